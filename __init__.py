@@ -1,7 +1,82 @@
 """
 Tools for working with javascript
+
+Apart from the Javascript class itself, everything is imported the first
+time it is used, so that "import javascriptTools" does not drag in
+htmlTools, paths, colorTools, xml.dom.minidom, numpy, etc until
+something actually needs them.
 """
+import typing
+import importlib
 from .javascript import *
-from .jsgenerator import *
-from .utils import *
-from .jsHelper import *
\ No newline at end of file
+
+
+# the submodules, in the order they used to be star-imported
+_SUBMODULES=(
+    'jsgenerator','utils','jsHelper','jswriter','canvasBatch',
+    'jsOptimizer','jsTokenizer','scriptScanner','jsChannel','domTransaction',
+    'htmlPatcher','instrumentation','bulk','payloadCache')
+
+# {name:submodule} for everything the package exports
+_LAZY_ATTRIBUTES:typing.Dict[str,str]={}
+for _moduleName,_names in (
+    ('jsgenerator',(
+        'hasColorTools','hasNumpy','decimatePoints',
+        'UNCACHEABLE_METHODS','OutputCache','JavascriptGenerator')),
+    ('utils',(
+        'STREAM_CHUNK_SIZE','CSS_RULE_MODES','ContentRegistry','CssRuleRegistry',
+        'scriptHash','JavascriptRegistry',
+        'jsAddCssRules','jsAddJavascript','jsAddHtml',
+        'setElementContents','appendElementContents',
+        'JS_STRING_ESCAPES','TO_JS_STRING_CACHE_MAX_LEN','toJsString','toJsStrings')),
+    ('jsHelper',(
+        'DomElementType','SCRIPT_TYPE_ATTRIBUTES','JAVASCRIPT_MIME_TYPES',
+        'JAVASCRIPT_LANGUAGES','TAG_ATTRIBUTE_REGEX',
+        'FunctionIndexCache','defaultFunctionIndexCache','JsHelper')),
+    ('jswriter',('JavascriptWriter',)),
+    ('canvasBatch',('CanvasBatch',)),
+    ('jsOptimizer',(
+        'LOOKUP_REGEX','countLookups','hoistLookups','JS_RESERVED_WORDS','minify')),
+    ('jsTokenizer',(
+        'WHITESPACE','COMMENT','STRING','TEMPLATE','REGEX','NAME','NUMBER','PUNCTUATION',
+        'iterTokens','tokenize','JsFunction','findFunctions')),
+    ('scriptScanner',(
+        'SCAN_CHUNK_SIZE','HtmlSource','ScriptBlock','HtmlLandmarks',
+        'readHtml','iterScriptBlocks')),
+    ('jsChannel',(
+        'QUEUE_POLICIES','DEFAULT_QUEUE_SIZE','sseFrame','websocketFrame',
+        'Subscriber','JavascriptChannel','serveSse')),
+    ('domTransaction',('DomTransaction',)),
+    ('htmlPatcher',('VOID_ELEMENTS','CLOSES_P_ELEMENTS','splitTopLevelNodes','HtmlPatcher')),
+    ('instrumentation',(
+        'INSTRUMENTED_FUNCTIONS','Instrumentation','enableInstrumentation',
+        'disableInstrumentation','currentInstrumentation')),
+    ('bulk',('iterHtmlFiles','atomicWrite','processFile','processFiles')),
+    ('payloadCache',(
+        'PAYLOAD_ENCODINGS','payloadHash','chooseEncoding','PayloadCache')),
+    ):
+    for _name in _names:
+        _LAZY_ATTRIBUTES[_name]=_moduleName
+del _moduleName,_names,_name
+
+__all__=['CustomString','Javascript',*_LAZY_ATTRIBUTES]
+
+
+def __getattr__(name:str)->typing.Any:
+    """
+    Import things the first time they are asked for
+    """
+    if name in _SUBMODULES:
+        return importlib.import_module('.'+name,__name__)
+    moduleName=_LAZY_ATTRIBUTES.get(name)
+    if moduleName is not None:
+        value=getattr(importlib.import_module('.'+moduleName,__name__),name)
+        globals()[name]=value
+        return value
+    # (not searching the submodules, which would import all of them
+    # for a typo or a hasattr() check)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__()->typing.List[str]:
+    return sorted(set(globals())|set(_LAZY_ATTRIBUTES))
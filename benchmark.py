@@ -0,0 +1,629 @@
+"""
+Timing benchmarks for the hot paths in javascriptTools
+
+Run with:
+    python -m javascriptTools.benchmark [--quick] [--save baseline.json]
+        [--baseline baseline.json] [--threshold 0.25] [--only toJsString,...]
+
+With --baseline, exits with status 1 if any case got slower by more
+than the threshold.
+"""
+import typing
+import time
+import functools
+import sys
+import subprocess
+import argparse
+import json
+import tracemalloc
+from .javascript import Javascript
+from .utils import toJsString,toJsStrings,jsAddJavascript
+from .jsgenerator import JavascriptGenerator,OutputCache,hasNumpy
+from .jsOptimizer import hoistLookups,countLookups,minify
+from .jsTokenizer import findFunctions
+from .jsHelper import JsHelper,FunctionIndexCache
+
+
+def benchmarkAppend(
+    sizes:typing.Iterable[int]=(1000,10000,100000),
+    fragment:str='doSomething();\n'
+    )->typing.Dict[int,float]:
+    """
+    Time building a Javascript object out of many appended fragments.
+
+    The time includes the first len() so that the final join is counted.
+    If appending is linear, the time per append should stay roughly
+    the same as the number of appends goes up.
+
+    :return: {numAppends:seconds}
+    """
+    results:typing.Dict[int,float]={}
+    for size in sizes:
+        start=time.perf_counter()
+        js=Javascript()
+        for _ in range(size):
+            js.append(fragment)
+        len(js)
+        results[size]=time.perf_counter()-start
+    return results
+
+
+def _toJsStringReference(text:typing.Any)->str:
+    """
+    The original chained-replace implementation of toJsString()
+    (for plain strings) to time the real one against.
+    """
+    text=str(text)
+    text=text \
+        .replace('\\','\\\\') \
+        .replace('\'','\\\'') \
+        .replace('\n','\\n') \
+        .replace('\r','')
+    return f"'{text}'"
+
+
+def benchmarkToJsString(
+    repeat:int=100000
+    )->typing.Dict[str,typing.Tuple[float,float]]:
+    """
+    Time toJsString() against the original implementation
+    on a few typical kinds of input.
+
+    :return: {workloadName:(secondsNew,secondsOriginal)}
+    """
+    workloads={
+        'elementId':'myElementId',
+        'withQuotes':"it's a\nmultiline 'thing'",
+        'longScript':'var x=1;\n'*1000}
+    results={}
+    for name,text in workloads.items():
+        n=max(1,repeat//max(1,len(text)//16))
+        start=time.perf_counter()
+        for _ in range(n):
+            toJsString(text)
+        secondsNew=time.perf_counter()-start
+        start=time.perf_counter()
+        for _ in range(n):
+            _toJsStringReference(text)
+        results[name]=(secondsNew,time.perf_counter()-start)
+    return results
+
+
+def benchmarkPolyline(
+    sizes:typing.Iterable[int]=(1000,100000,1000000),
+    columns:int=1000
+    )->typing.Dict[int,typing.Dict[str,typing.Tuple[float,int]]]:
+    """
+    Time canvasShape() against the numpy-based canvasPolyline() variants.
+    (canvasShape is skipped for the biggest size as it takes so long)
+
+    :return: {numPoints:{variant:(seconds,outputBytes)}}
+    """
+    import numpy as np # pylint: disable=import-outside-toplevel
+    jsg=JavascriptGenerator()
+    results:typing.Dict[int,typing.Dict[str,typing.Tuple[float,int]]]={}
+    for size in sizes:
+        x=np.arange(size,dtype=np.float64)
+        points=np.column_stack((x,np.sin(x/100.0)*100.0))
+        variants:typing.Dict[str,typing.Callable[[],str]]={
+            'array':functools.partial(jsg.canvasPolyline,'c',points),
+            'base64':functools.partial(jsg.canvasPolyline,'c',points,encoding='base64'),
+            'decimated':functools.partial(jsg.canvasPolyline,'c',points,columns=columns)}
+        if size<=100000:
+            pointList=points.tolist()
+            variants['canvasShape']=functools.partial(jsg.canvasShape,'c',pointList)
+        results[size]={}
+        for name,fn in variants.items():
+            start=time.perf_counter()
+            js=fn()
+            results[size][name]=(time.perf_counter()-start,len(js))
+    return results
+
+
+def dashboardFragments(
+    numElements:int=1000,
+    jsg:typing.Optional[JavascriptGenerator]=None
+    )->typing.List[Javascript]:
+    """
+    A typical-ish sequence of generated updates, several per element
+    """
+    if jsg is None:
+        jsg=JavascriptGenerator()
+    fragments=[]
+    for i in range(numElements):
+        elementId=f'row{i}'
+        fragments.append(jsg.setElementAttribute(elementId,'class','updated'))
+        fragments.append(jsg.setElementStyleValue(elementId,'color','red'))
+        fragments.append(jsg.appendElementContents(elementId,f'<td>{i}</td>'))
+    return fragments
+
+
+def benchmarkHoistLookups(
+    sizes:typing.Iterable[int]=(10,1000,10000)
+    )->typing.Dict[int,typing.Dict[str,float]]:
+    """
+    Payload size and browser-side lookups before/after hoistLookups()
+
+    :return: {numElements:{measurement:value}}
+    """
+    results={}
+    for size in sizes:
+        fragments=dashboardFragments(size)
+        start=time.perf_counter()
+        optimized=hoistLookups(fragments)
+        seconds=time.perf_counter()-start
+        results[size]={
+            'seconds':seconds,
+            'bytesBefore':sum(len(fragment) for fragment in fragments),
+            'bytesAfter':len(optimized),
+            'lookupsBefore':countLookups(fragments),
+            'lookupsAfter':countLookups(optimized)}
+    return results
+
+
+def benchmarkMinify(
+    sizes:typing.Iterable[int]=(100,1000,10000)
+    )->typing.Dict[int,typing.Dict[str,float]]:
+    """
+    Bytes saved and throughput of minify() on dashboard-style updates
+
+    :return: {numElements:{measurement:value}}
+    """
+    results={}
+    for size in sizes:
+        js=hoistLookups(dashboardFragments(size))
+        start=time.perf_counter()
+        minified=minify(js)
+        seconds=time.perf_counter()-start
+        results[size]={
+            'seconds':seconds,
+            'bytesBefore':len(js),
+            'bytesAfter':len(minified),
+            'MBps':len(js)/seconds/1e6}
+    return results
+
+
+# a chunk of typical-ish hand-written/bundled javascript
+SAMPLE_JAVASCRIPT=r"""
+/* a comment with a { brace and a 'quote */
+function update%(n)d(el, value) {
+    // another } comment
+    if (value > 10 && el.id !== "x}") {
+        el.innerHTML = `<b>${value}</b> {not a brace}`;
+    }
+    var re = /[{}]+\//g;
+    return el.className.replace(re, '') / 2;
+}
+const helper%(n)d = function(a, b) { return {sum: a + b, re: /}/}; };
+let arrow%(n)d = (x) => { return x * 2; };
+var short%(n)d = x => x + 1;
+var obj%(n)d = {
+    method(a) { return [a, {b: a}]; },
+    other: function() { return "function fake() {}"; }
+};
+"""
+
+
+def syntheticJavascript(size:int)->str:
+    """
+    Make a javascript "bundle" of about the given size in characters
+    """
+    chunks=[]
+    total=0
+    n=0
+    while total<size:
+        chunk=SAMPLE_JAVASCRIPT%{'n':n}
+        chunks.append(chunk)
+        total+=len(chunk)
+        n+=1
+    return ''.join(chunks)
+
+
+def benchmarkFindFunctions(
+    sizes:typing.Iterable[int]=(100000,1000000,10000000,20000000)
+    )->typing.Dict[int,typing.Dict[str,float]]:
+    """
+    Throughput of findFunctions() on big bundles
+
+    :return: {sizeInBytes:{measurement:value}}
+    """
+    results={}
+    for size in sizes:
+        code=syntheticJavascript(size)
+        start=time.perf_counter()
+        functions=findFunctions(code)
+        seconds=time.perf_counter()-start
+        results[size]={
+            'seconds':seconds,
+            'functions':len(functions),
+            'MBps':len(code)/seconds/1e6}
+    return results
+
+
+def measureObjectMemory(count:int=20000)->typing.Dict[str,float]:
+    """
+    Bytes of memory per object (via tracemalloc) for a bunch of
+    typical small fragments, as plain str and as Javascript
+
+    :return: {kind:bytesPerObject}
+    """
+    results={}
+    makers:typing.Dict[str,typing.Callable[[int],typing.Any]]={
+        'str':lambda i:f'document.getElementById(\'row{i}\').className=\'x\';',
+        'Javascript':lambda i:Javascript(f'document.getElementById(\'row{i}\').className=\'x\';')}
+    for name,make in makers.items():
+        tracemalloc.start()
+        objects=[make(i) for i in range(count)]
+        size,_=tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name]=size/len(objects)
+    js=Javascript('\n'.join([f'line{i};' for i in range(count)]))
+    tracemalloc.start()
+    lines=js.splitlines()
+    size,_=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['Javascript.splitlines()']=size/len(lines)
+    return results
+
+
+# script sizes (in bytes) and fragment counts the suite runs at
+SCRIPT_SIZES=(1000,100000,10000000,100000000)
+FRAGMENT_COUNTS=(10,1000,100000,1000000)
+
+# the biggest of each that --quick runs
+QUICK_MAX_SCRIPT_SIZE=100000
+QUICK_MAX_FRAGMENT_COUNT=1000
+
+# how much slower than the baseline a case can get before it is a regression
+REGRESSION_THRESHOLD=0.25
+
+# keep repeating a case until it has run for this long (or MAX_REPEAT times)
+MIN_BENCHMARK_SECONDS=0.2
+MAX_REPEAT=5
+
+# what a workload setup returns: (fn to time,ops per call,bytes per call)
+Workload=typing.Tuple[typing.Callable[[],typing.Any],int,int]
+
+
+class BenchmarkCase(typing.NamedTuple):
+    """
+    One thing to time at several sizes
+
+    setup(size) builds the input outside of the timing and returns
+    the function to time along with how many ops and bytes one call
+    of it handles.
+    """
+    name:str
+    sizes:typing.Tuple[int,...]
+    setup:typing.Callable[[int],Workload]
+
+
+def _htmlPage(size:int)->str:
+    """
+    An html page with about size bytes of javascript in the <head>
+    """
+    code=syntheticJavascript(size)
+    return '<html><head><script type="text/javascript">'+code \
+        +'</script></head><body></body></html>'
+
+
+def _toJsStringScript(size:int)->Workload:
+    text=syntheticJavascript(size)
+    return (lambda:toJsString(text)),1,len(text)
+
+
+def _toJsStringIds(count:int)->Workload:
+    ids=[f'element{i%1000}' for i in range(count)]
+    return (lambda:toJsStrings(ids)),count,sum(len(i) for i in ids)
+
+
+def _appendJoin(count:int)->Workload:
+    fragment='doSomething();\n'
+    def run()->str:
+        js=Javascript()
+        for _ in range(count):
+            js.append(fragment)
+        return str(js)
+    return run,count,count*len(fragment)
+
+
+def _generatorMethods(count:int)->Workload:
+    # 3 generator calls per element
+    numElements=max(1,count//3)
+    numBytes=sum(len(fragment) for fragment in dashboardFragments(numElements))
+    return (lambda:dashboardFragments(numElements)),numElements*3,numBytes
+
+
+def _cachedGeneratorMethods(count:int)->Workload:
+    # the same updates again and again, as across many requests
+    numElements=max(1,count//3)
+    jsg=JavascriptGenerator(cache=OutputCache(64*1024*1024))
+    numBytes=sum(len(fragment) for fragment in dashboardFragments(numElements,jsg))
+    return (lambda:dashboardFragments(numElements,jsg)),numElements*3,numBytes
+
+
+def _jsAddJavascript(size:int)->Workload:
+    code=syntheticJavascript(size)
+    return (lambda:jsAddJavascript(code)),1,len(code)
+
+
+def _hoistLookups(count:int)->Workload:
+    fragments=dashboardFragments(max(1,count//3))
+    return (lambda:hoistLookups(fragments)),len(fragments),sum(len(f) for f in fragments)
+
+
+def _minify(size:int)->Workload:
+    code=syntheticJavascript(size)
+    return (lambda:minify(code)),1,len(code)
+
+
+def _findFunctions(size:int)->Workload:
+    code=syntheticJavascript(size)
+    return (lambda:findFunctions(code)),1,len(code)
+
+
+def _getFunctionsFromCodeString(size:int)->Workload:
+    code=syntheticJavascript(size)
+    helper=JsHelper()
+    return (lambda:helper.GetFunctionsFromCodeString(code)),1,len(code)
+
+
+def _getFunctionsFromHtml(size:int)->Workload:
+    page=_htmlPage(size).encode('utf-8')
+    helper=JsHelper(FunctionIndexCache(0)) # time the parsing, not the cache
+    return (lambda:helper.GetFunctionsFromHtml(page)),1,len(page)
+
+
+def _fixScriptTagsInHtml(size:int)->Workload:
+    page=_htmlPage(size).encode('utf-8')
+    helper=JsHelper()
+    return (lambda:helper.FixScriptTagsInHtml(page)),1,len(page)
+
+
+BENCHMARK_CASES:typing.Tuple[BenchmarkCase,...]=(
+    BenchmarkCase('toJsString',SCRIPT_SIZES,_toJsStringScript),
+    BenchmarkCase('toJsStrings.ids',FRAGMENT_COUNTS,_toJsStringIds),
+    BenchmarkCase('Javascript.append+join',FRAGMENT_COUNTS,_appendJoin),
+    BenchmarkCase('JavascriptGenerator',FRAGMENT_COUNTS,_generatorMethods),
+    BenchmarkCase('JavascriptGenerator.cached',FRAGMENT_COUNTS,_cachedGeneratorMethods),
+    BenchmarkCase('jsAddJavascript',SCRIPT_SIZES,_jsAddJavascript),
+    BenchmarkCase('hoistLookups',FRAGMENT_COUNTS,_hoistLookups),
+    BenchmarkCase('minify',SCRIPT_SIZES,_minify),
+    BenchmarkCase('findFunctions',SCRIPT_SIZES,_findFunctions),
+    BenchmarkCase('JsHelper.GetFunctionsFromCodeString',SCRIPT_SIZES,_getFunctionsFromCodeString),
+    BenchmarkCase('JsHelper.GetFunctionsFromHtml',SCRIPT_SIZES,_getFunctionsFromHtml),
+    BenchmarkCase('JsHelper.FixScriptTagsInHtml',SCRIPT_SIZES,_fixScriptTagsInHtml))
+
+
+def runCase(case:BenchmarkCase,size:int)->typing.Dict[str,typing.Any]:
+    """
+    Time one case at one size
+
+    :return: {case,size,seconds (the best run),opsPerSecond,MBps,peakBytes}
+    """
+    fn,ops,numBytes=case.setup(size)
+    best=None
+    total=0.0
+    for _ in range(MAX_REPEAT):
+        start=time.perf_counter()
+        fn()
+        seconds=time.perf_counter()-start
+        total+=seconds
+        if best is None or seconds<best:
+            best=seconds
+        if total>=MIN_BENCHMARK_SECONDS:
+            break
+    # memory is measured on a separate run since tracing slows things down
+    tracemalloc.start()
+    try:
+        fn()
+        _,peakBytes=tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best=max(typing.cast(float,best),1e-9)
+    return {
+        'case':case.name,
+        'size':size,
+        'seconds':best,
+        'opsPerSecond':ops/best,
+        'MBps':numBytes/best/1e6,
+        'peakBytes':peakBytes}
+
+
+def runSuite(
+    cases:typing.Optional[typing.Iterable[BenchmarkCase]]=None,
+    maxScriptSize:typing.Optional[int]=None,
+    maxFragmentCount:typing.Optional[int]=None,
+    report:typing.Optional[typing.Callable[[typing.Dict[str,typing.Any]],None]]=None
+    )->typing.Dict[str,typing.Dict[str,typing.Any]]:
+    """
+    Run the benchmark cases
+
+    :param cases: defaults to BENCHMARK_CASES
+    :param maxScriptSize: skip script sizes bigger than this
+    :param maxFragmentCount: skip fragment counts bigger than this
+    :param report: called with each result as it comes in
+    :return: {"case/size":result}
+    """
+    if cases is None:
+        cases=BENCHMARK_CASES
+    results={}
+    for case in cases:
+        limit=maxFragmentCount if case.sizes is FRAGMENT_COUNTS else maxScriptSize
+        for size in case.sizes:
+            if limit is not None and size>limit:
+                continue
+            result=runCase(case,size)
+            results[f'{case.name}/{size}']=result
+            if report is not None:
+                report(result)
+    return results
+
+
+def formatResult(result:typing.Dict[str,typing.Any])->str:
+    """
+    One line of the results table
+    """
+    return f"  {result['case']:<36} {result['size']:>10} {result['seconds']*1000:11.3f}ms" \
+        f" {result['opsPerSecond']:14.1f}ops/s {result['MBps']:9.2f}MB/s" \
+        f" {result['peakBytes']/1e6:9.2f}MB peak"
+
+
+def saveBaseline(results:typing.Dict[str,typing.Dict[str,typing.Any]],filename:str)->None:
+    """
+    Save results as a json baseline to compare later runs against
+    """
+    with open(filename,'w',encoding='utf-8') as f:
+        json.dump(results,f,indent=2,sort_keys=True)
+
+
+def loadBaseline(filename:str)->typing.Dict[str,typing.Dict[str,typing.Any]]:
+    """
+    Load a json baseline saved with saveBaseline()
+    """
+    with open(filename,'r',encoding='utf-8') as f:
+        return json.load(f)
+
+
+def findRegressions(
+    results:typing.Dict[str,typing.Dict[str,typing.Any]],
+    baseline:typing.Dict[str,typing.Dict[str,typing.Any]],
+    threshold:typing.Optional[float]=None
+    )->typing.List[str]:
+    """
+    Compare results to a baseline
+
+    :param threshold: how much slower (as a fraction) counts as a
+        regression, defaults to REGRESSION_THRESHOLD
+    :return: a description of each case that regressed
+    """
+    if threshold is None:
+        threshold=REGRESSION_THRESHOLD
+    regressions=[]
+    for key,result in results.items():
+        base=baseline.get(key)
+        if base is None:
+            continue
+        ratio=result['seconds']/max(base['seconds'],1e-9)
+        if ratio>1.0+threshold:
+            regressions.append(
+                f"{key}: {result['seconds']*1000:.3f}ms vs {base['seconds']*1000:.3f}ms"
+                f" baseline ({(ratio-1.0)*100:.0f}% slower)")
+    return regressions
+
+
+def measureImportTime(
+    module:str='javascriptTools',
+    repeat:int=5
+    )->typing.Tuple[float,typing.List[str]]:
+    """
+    Time importing a module in a fresh interpreter with "python -X importtime"
+
+    :return: (best cumulative seconds,[every module that got imported])
+    """
+    best=None
+    modules:typing.List[str]=[]
+    for _ in range(repeat):
+        result=subprocess.run(
+            [sys.executable,'-X','importtime','-c',f'import {module}'],
+            capture_output=True,text=True,check=True)
+        modules=[]
+        seconds=None
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _,cumulative,name=line.split('|',2)
+            name=name.strip()
+            if not cumulative.strip().isdigit():
+                continue # the header
+            modules.append(name)
+            if name==module:
+                seconds=int(cumulative)/1e6
+        if seconds is None:
+            raise Exception(f'No import time reported for {module}')
+        if best is None or seconds<best:
+            best=seconds
+    return typing.cast(float,best),modules
+
+
+def printDetails()->None:
+    """
+    Print the older, more specific before/after benchmarks
+    """
+    print('Javascript.append')
+    for size,seconds in benchmarkAppend().items():
+        print(f'  {size:>8} appends: {seconds*1000:9.3f}ms  {seconds/size*1e9:8.1f}ns/append')
+    print('toJsString')
+    for name,(secondsNew,secondsOriginal) in benchmarkToJsString().items():
+        print(f'  {name:>12}: {secondsNew*1000:9.3f}ms  (original {secondsOriginal*1000:9.3f}ms)')
+    print('hoistLookups')
+    for size,r in benchmarkHoistLookups().items():
+        print(f"  {size:>8} elements: {r['seconds']*1000:9.3f}ms"
+            f" bytes {r['bytesBefore']:.0f}->{r['bytesAfter']:.0f}"
+            f" lookups {r['lookupsBefore']:.0f}->{r['lookupsAfter']:.0f}")
+    print('minify')
+    for size,r in benchmarkMinify().items():
+        print(f"  {size:>8} elements: {r['seconds']*1000:9.3f}ms {r['MBps']:6.2f}MB/s"
+            f" bytes {r['bytesBefore']:.0f}->{r['bytesAfter']:.0f}")
+    print('findFunctions')
+    for size,r in benchmarkFindFunctions().items():
+        print(f"  {size:>10} bytes: {r['seconds']*1000:9.3f}ms {r['MBps']:6.2f}MB/s"
+            f" {r['functions']:.0f} functions")
+    if hasNumpy:
+        print('canvasPolyline')
+        for size,variants in benchmarkPolyline().items():
+            for name,(seconds,numBytes) in variants.items():
+                print(f'  {size:>8} points {name:>12}: {seconds*1000:9.3f}ms {numBytes:>10} bytes')
+
+
+def main(argv:typing.Optional[typing.List[str]]=None)->int:
+    """
+    Run the benchmarks and print the results
+
+    :return: the exit status (1 if there were regressions)
+    """
+    parser=argparse.ArgumentParser(description='javascriptTools benchmarks')
+    parser.add_argument('--quick',action='store_true',
+        help=f'only run up to {QUICK_MAX_SCRIPT_SIZE} byte scripts'
+            f' and {QUICK_MAX_FRAGMENT_COUNT} fragments')
+    parser.add_argument('--max-script-size',type=int,help='skip bigger scripts')
+    parser.add_argument('--max-fragments',type=int,help='skip bigger fragment counts')
+    parser.add_argument('--only',help='comma-separated case names to run')
+    parser.add_argument('--save',help='save the results as a json baseline')
+    parser.add_argument('--baseline',help='fail if slower than this json baseline')
+    parser.add_argument('--threshold',type=float,default=REGRESSION_THRESHOLD,
+        help='how much slower than the baseline is a regression (0.25=25%%)')
+    parser.add_argument('--details',action='store_true',
+        help='also print the older before/after comparisons')
+    args=parser.parse_args(argv)
+    print(f'import javascriptTools: {measureImportTime()[0]*1000:.1f}ms')
+    for name,bytesPerObject in measureObjectMemory().items():
+        print(f'memory per {name}: {bytesPerObject:.0f} bytes')
+    maxScriptSize=args.max_script_size
+    maxFragmentCount=args.max_fragments
+    if args.quick:
+        maxScriptSize=min(maxScriptSize or QUICK_MAX_SCRIPT_SIZE,QUICK_MAX_SCRIPT_SIZE)
+        maxFragmentCount=min(maxFragmentCount or QUICK_MAX_FRAGMENT_COUNT,QUICK_MAX_FRAGMENT_COUNT)
+    cases:typing.Iterable[BenchmarkCase]=BENCHMARK_CASES
+    if args.only:
+        names=set(args.only.split(','))
+        cases=[case for case in BENCHMARK_CASES if case.name in names]
+    results=runSuite(cases,maxScriptSize,maxFragmentCount,
+        lambda r:print(formatResult(r),flush=True))
+    if args.details:
+        printDetails()
+    if args.save:
+        saveBaseline(results,args.save)
+    if args.baseline:
+        regressions=findRegressions(results,loadBaseline(args.baseline),args.threshold)
+        if regressions:
+            print('REGRESSIONS:')
+            for regression in regressions:
+                print('  '+regression)
+            return 1
+        print('no regressions')
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
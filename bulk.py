@@ -0,0 +1,191 @@
+"""
+Scan (and optionally fix) the script tags of a whole tree of html files,
+spread over several processes.
+
+Run with:
+    python -m javascriptTools.bulk site/ [more/dirs/or/files.html ...]
+        [--fix] [--output results.jsonl] [--workers 8] [--chunk-size 16]
+
+Writes one json line per file with the functions defined in its <head>
+scripts, how many script tags needed fixing, whether the file was
+rewritten, and how long it took.
+"""
+import typing
+import os
+import sys
+import time
+import json
+import fnmatch
+import tempfile
+import argparse
+import contextlib
+import concurrent.futures
+from .jsHelper import JsHelper
+
+
+# which files get processed
+DEFAULT_PATTERNS=('*.html','*.htm','*.xhtml')
+
+# how many files each worker gets at a time
+DEFAULT_CHUNK_SIZE=16
+
+# one per worker process, so its function cache is shared by all of
+# the files that process handles (many sites repeat the same scripts)
+_helper:typing.Optional[JsHelper]=None
+
+
+def iterHtmlFiles(
+    paths:typing.Iterable[str],
+    patterns:typing.Iterable[str]=DEFAULT_PATTERNS
+    )->typing.Iterator[str]:
+    """
+    Go through all of the matching files in the given files/directories
+    (in a consistent order)
+    """
+    patterns=tuple(patterns)
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory,subdirectories,filenames in os.walk(path):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                if any(fnmatch.fnmatch(filename,pattern) for pattern in patterns):
+                    yield os.path.join(directory,filename)
+
+
+def atomicWrite(filename:str,data:bytes)->None:
+    """
+    Replace a file's contents such that anything reading it sees
+    either the old contents or the new ones, never a mix.
+    (Keeps the file's permissions.)
+    """
+    directory,name=os.path.split(os.path.abspath(filename))
+    fd,tempFilename=tempfile.mkstemp(prefix=f'.{name}.',suffix='.tmp',dir=directory)
+    try:
+        with os.fdopen(fd,'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tempFilename,os.stat(filename).st_mode&0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tempFilename,filename)
+    except BaseException:
+        try:
+            os.unlink(tempFilename)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def processFile(
+    filename:str,
+    fix:bool=False,
+    encoding:str='utf-8'
+    )->typing.Dict[str,typing.Any]:
+    """
+    Scan one html file (and fix it, if asked)
+
+    :return: a json-compatible dict of what happened
+    """
+    global _helper # pylint: disable=global-statement
+    if _helper is None:
+        _helper=JsHelper()
+    start=time.perf_counter()
+    result:typing.Dict[str,typing.Any]={'path':filename}
+    try:
+        with open(filename,'rb') as f:
+            data=f.read()
+        result['bytes']=len(data)
+        result['functions']=sorted(_helper.GetFunctionsFromHtml(data,encoding))
+        fixes:typing.List[typing.Any]=[]
+        fixed=_helper.FixScriptTagsInHtml(data,encoding,fixes)
+        result['scriptTagsFixed']=len(fixes)
+        result['written']=False
+        if fix and fixes:
+            atomicWrite(filename,typing.cast(bytes,fixed))
+            result['written']=True
+    except Exception as e: # pylint: disable=broad-except
+        result['error']=f'{e.__class__.__name__}: {e}'
+    result['seconds']=time.perf_counter()-start
+    return result
+
+
+def _processFileArgs(args:typing.Tuple[str,bool,str])->typing.Dict[str,typing.Any]:
+    return processFile(*args)
+
+
+def processFiles(
+    filenames:typing.Iterable[str],
+    fix:bool=False,
+    encoding:str='utf-8',
+    workers:typing.Optional[int]=None,
+    chunkSize:int=DEFAULT_CHUNK_SIZE
+    )->typing.Iterator[typing.Dict[str,typing.Any]]:
+    """
+    Run processFile() on a bunch of files, over a pool of processes,
+    yielding the results (in order) as they come in.
+
+    :param workers: how many processes (defaults to the number of cpus,
+        1 does everything in this process)
+    :param chunkSize: how many files to hand a worker at a time
+    """
+    if workers is None:
+        workers=os.cpu_count() or 1
+    jobs=((filename,fix,encoding) for filename in filenames)
+    if workers<=1:
+        yield from map(_processFileArgs,jobs)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_processFileArgs,jobs,chunksize=max(1,chunkSize))
+
+
+def main(argv:typing.Optional[typing.List[str]]=None)->int:
+    """
+    Command line entry point
+
+    :return: the exit status (1 if any file could not be processed)
+    """
+    parser=argparse.ArgumentParser(
+        description='Inventory (and optionally fix) the script tags in a tree of html files')
+    parser.add_argument('paths',nargs='+',help='html files and/or directories to search')
+    parser.add_argument('--fix',action='store_true',
+        help='write fixed script tags back to the files (atomically)')
+    parser.add_argument('--output','-o',help='where to write the json lines (default stdout)')
+    parser.add_argument('--workers','-j',type=int,
+        help='how many processes (default: number of cpus)')
+    parser.add_argument('--chunk-size',type=int,default=DEFAULT_CHUNK_SIZE,
+        help='how many files to hand a worker at a time')
+    parser.add_argument('--pattern',action='append',
+        help=f'filename pattern to match (can repeat, default: {" ".join(DEFAULT_PATTERNS)})')
+    parser.add_argument('--encoding',default='utf-8',help='what the html files are encoded as')
+    args=parser.parse_args(argv)
+    patterns=args.pattern or DEFAULT_PATTERNS
+    numFiles=numFixed=numErrors=0
+    start=time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if args.output is None:
+            out=sys.stdout
+            stack.callback(out.flush)
+        else:
+            out=stack.enter_context(open(args.output,'w',encoding='utf-8'))
+        for result in processFiles(
+            iterHtmlFiles(args.paths,patterns),
+            args.fix,args.encoding,args.workers,args.chunk_size):
+            #
+            out.write(json.dumps(result)+'\n')
+            numFiles+=1
+            if result.get('scriptTagsFixed'):
+                numFixed+=1
+            if 'error' in result:
+                numErrors+=1
+    verb='fixed' if args.fix else 'need fixing'
+    print(f'{numFiles} files, {numFixed} {verb}, {numErrors} errors'
+        f' in {time.perf_counter()-start:.2f}s',file=sys.stderr)
+    return 1 if numErrors else 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Batch up a bunch of canvas drawing calls into one compact script
+"""
+import typing
+from .javascript import Javascript
+from .jsgenerator import JavascriptGenerator
+
+
+class _CanvasBatchGenerator(JavascriptGenerator):
+    """
+    A generator whose canvas methods draw on a local variable
+    rather than looking up the canvas every time.
+    """
+
+    def __init__(self,contextVar:str='c'):
+        JavascriptGenerator.__init__(self)
+        self.contextVar=contextVar
+
+    def canvasContext(self,canvasId:str)->Javascript:
+        return Javascript(self.contextVar)
+
+
+class CanvasBatch:
+    """
+    Records canvas drawing calls and emits them as a single script
+    that only looks up the canvas and its 2d context once.
+
+    Any of the JavascriptGenerator canvas methods can be called on it,
+    minus the canvasId parameter.
+
+    Runs of plain fillRect/clearRect calls (no color change in between)
+    are packed into one numeric array and drawn with a loop, which is
+    far smaller than thousands of separate statements.
+
+    Usage:
+        with CanvasBatch('myChart',animationFrame=True) as batch:
+            batch.canvasFillStyle(color)
+            for x,y,w,h in bars:
+                batch.canvasFillRect(x,y,w,h)
+        js=batch.javascript()
+    """
+
+    # the shortest run of rects worth packing into an array
+    MIN_RECT_RUN=3
+
+    def __init__(self,
+        canvasId:str,
+        animationFrame:bool=False,
+        contextVar:str='c',
+        out:typing.Optional[typing.TextIO]=None):
+        """
+        :param canvasId: the canvas to draw on
+        :param animationFrame: wrap the drawing in one requestAnimationFrame()
+        :param contextVar: javascript variable name to keep the context in
+        :param out: if specified, the script is written here when
+            the "with" block ends
+        """
+        self.canvasId=canvasId
+        self.animationFrame=animationFrame
+        self.contextVar=contextVar
+        self.out=out
+        self._generator=_CanvasBatchGenerator(contextVar)
+        # each item is either javascript (str) or a (rectOp,(x,y,w,h)) tuple
+        self._calls:typing.List[typing.Union[str,typing.Tuple[str,typing.Tuple[typing.Any,...]]]]=[]
+
+    def __enter__(self)->'CanvasBatch':
+        return self
+
+    def __exit__(self,excType,excValue,traceback)->None:
+        if excType is None and self.out is not None:
+            self.out.write(str(self.javascript()))
+
+    def __len__(self)->int:
+        return len(self._calls)
+
+    def clear(self)->None:
+        """
+        Forget all recorded calls
+        """
+        self._calls=[]
+
+    def record(self,js:typing.Union[str,Javascript])->None:
+        """
+        Record some arbitrary javascript.
+        (It can use the context variable, eg "c.save();")
+        """
+        self._calls.append(str(js))
+
+    def canvasFillRect(self,
+        x:int,y:int,w:int,h:int,
+        color:typing.Optional[typing.Any]=None
+        )->None:
+        """
+        fill a rectangular section
+        """
+        if color is not None:
+            self.canvasFillStyle(color)
+        self._calls.append(('fillRect',(x,y,w,h)))
+
+    def canvasClearRect(self,x:int,y:int,w:int,h:int)->None:
+        """
+        erase a rectangular section
+        """
+        self._calls.append(('clearRect',(x,y,w,h)))
+
+    def __getattr__(self,name:str)->typing.Callable[...,None]:
+        """
+        Record any other JavascriptGenerator canvas method
+        """
+        if not name.startswith('canvas') or name=='canvasContext':
+            raise AttributeError(name)
+        fn=getattr(self._generator,name)
+        def recordCall(*args,**kwargs)->None:
+            self._calls.append(str(fn(self.canvasId,*args,**kwargs)))
+        return recordCall
+
+    def _iterStatements(self)->typing.Iterator[str]:
+        """
+        Go through the recorded calls, packing runs of rects together
+        """
+        c=self.contextVar
+        calls=self._calls
+        i=0
+        while i<len(calls):
+            call=calls[i]
+            if isinstance(call,str):
+                yield call
+                i+=1
+                continue
+            op=call[0]
+            end=i+1
+            while end<len(calls) and not isinstance(calls[end],str) and calls[end][0]==op:
+                end+=1
+            if end-i<self.MIN_RECT_RUN:
+                for _,params in calls[i:end]:
+                    yield f'{c}.{op}({",".join([str(p) for p in params])});'
+            else:
+                nums=','.join([str(p) for _,params in calls[i:end] for p in params])
+                yield f'for(var r=[{nums}],i=0;i<r.length;i+=4){c}.{op}(r[i],r[i+1],r[i+2],r[i+3]);'
+            i=end
+
+    def javascript(self)->Javascript:
+        """
+        Get the whole batch as a single script
+        """
+        lookup=JavascriptGenerator().canvasContext(self.canvasId)
+        body='\n'.join(self._iterStatements())
+        js=f'var {self.contextVar}={lookup};\n{body}'
+        if self.animationFrame:
+            return Javascript(f'requestAnimationFrame(function(){{\n{js}\n}});')
+        return Javascript(f'(function(){{\n{js}\n}})();')
+
+    def __str__(self)->str:
+        return str(self.javascript())
@@ -0,0 +1,243 @@
+"""
+Coalesce a bunch of dom updates into one minimal script
+"""
+import typing
+from .javascript import Javascript
+from .jsgenerator import JavascriptGenerator
+from .utils import toJsString
+
+
+class _ElementUpdate:
+    """
+    Everything that is going to happen to one element
+    """
+
+    def __init__(self):
+        self.contents:typing.Optional[str]=None
+        self.appendOnly=False # contents are to be appended rather than set
+        self.attributes:typing.Dict[str,typing.Any]={}
+        self.styleValues:typing.Dict[str,typing.Any]={}
+
+    def statements(self,element:str)->typing.Iterator[str]:
+        """
+        The javascript to make the changes, given the element variable name
+        """
+        if self.contents is not None:
+            if self.appendOnly:
+                yield f"{element}.insertAdjacentHTML('beforeend',{toJsString(self.contents)});"
+            else:
+                yield f'{element}.innerHTML={toJsString(self.contents)};'
+        for name,value in self.attributes.items():
+            yield f'{element}.setAttribute({toJsString(name)},{toJsString(value)});'
+        if self.styleValues:
+            css=';'.join([f'{name}:{value}' for name,value in self.styleValues.items()])
+            yield f"{element}.style.cssText+={toJsString(';'+css)};"
+
+
+class DomTransaction:
+    """
+    Records element updates and coalesces them, so that many updates to
+    the same elements in one go end up as one small script with as few
+    dom mutations as possible:
+        * consecutive appends are concatenated
+        * contents that are set again are only set the last time
+        * attributes that are set again are only set the last time
+        * style values are merged into one style assignment
+
+    NOTE: this reorders updates.  Between barriers, the updates are
+    grouped by element, with the elements in the order they were first
+    updated, so eg updates to "a", "b", then "a" again come out as all of
+    "a"'s (with the last contents winning) followed by "b"'s.  That only
+    matters when one update depends on another element's (eg "b" is
+    created by "a"'s new contents), in which case put a barrier() between
+    them.  Anything recorded with record() is also a barrier, so it is
+    kept in order with respect to the element updates around it.
+
+    Usage:
+        with DomTransaction(out=socket) as t:
+            for row in rows:
+                t.appendElementContents('table',rowHtml(row))
+            t.setElementStyleValue('status','color','green')
+            t.setElementContents('status',html='done')
+    """
+
+    def __init__(self,
+        animationFrame:bool=False,
+        out:typing.Optional[typing.TextIO]=None):
+        """
+        :param animationFrame: wrap the updates in one requestAnimationFrame()
+        :param out: if specified, the script is written here on commit()
+            (including when the "with" block ends)
+        """
+        self.animationFrame=animationFrame
+        self.out=out
+        self.numCalls=0
+        self._generator=JavascriptGenerator()
+        self._statements:typing.List[str]=[]
+        self._pending:typing.Dict[str,_ElementUpdate]={}
+
+    def __enter__(self)->'DomTransaction':
+        return self
+
+    def __exit__(self,excType,excValue,traceback)->None:
+        if excType is None:
+            self.commit()
+
+    def __len__(self)->int:
+        return self.numCalls
+
+    def _update(self,elementId:str)->_ElementUpdate:
+        self.numCalls+=1
+        update=self._pending.get(elementId)
+        if update is None:
+            update=_ElementUpdate()
+            self._pending[elementId]=update
+        return update
+
+    def _flushPending(self)->None:
+        """
+        Turn the pending element updates into statements
+        """
+        for elementId,update in self._pending.items():
+            statements=list(update.statements('e'))
+            if not statements:
+                continue
+            lookup=self._generator._element(elementId) # pylint: disable=protected-access
+            if len(statements)==1:
+                self._statements.extend(update.statements(lookup))
+            else:
+                self._statements.append('{let e='+lookup+';\n'+'\n'.join(statements)+'}')
+        self._pending={}
+
+    @staticmethod
+    def _asHtml(
+        html:typing.Optional[typing.Any],
+        plaintext:typing.Optional[typing.Any]
+        )->str:
+        """
+        Same html/plaintext handling as utils.setElementContents()
+        """
+        if html is None:
+            from htmlTools import Html # pylint: disable=import-outside-toplevel
+            html=Html(text=plaintext)
+        return str(html)
+
+    def barrier(self)->None:
+        """
+        Make sure every update recorded so far happens before any
+        recorded after this (nothing after is merged into them)
+        """
+        self._flushPending()
+
+    def record(self,js:typing.Union[str,Javascript])->None:
+        """
+        Record some arbitrary javascript.
+
+        Updates recorded before this happen before it.
+        """
+        self._flushPending()
+        self.numCalls+=1
+        self._statements.append(str(js))
+
+    def setElementContents(self,
+        elementId:str,
+        html:typing.Optional[typing.Any]=None,
+        plaintext:typing.Optional[typing.Any]=None
+        )->None:
+        """
+        Assign the contents of an element
+
+        :param html: assign this html to the element contents
+        :param plaintext: if html is not set, convert text to html and assign to element contents
+        """
+        update=self._update(elementId)
+        update.contents=self._asHtml(html,plaintext)
+        update.appendOnly=False
+
+    def replaceElementContents(self,elementId:str,newHtml:typing.Any)->None:
+        """
+        Replace the entire contents within the given element's tag.
+        """
+        self.setElementContents(elementId,html=newHtml)
+
+    def appendElementContents(self,
+        elementId:str,
+        html:typing.Optional[typing.Any]=None,
+        plaintext:typing.Optional[typing.Any]=None
+        )->None:
+        """
+        append html to the inside of an element
+
+        :param html: append this html to the element contents
+        :param plaintext: if html is not set, convert text to html and append that
+        """
+        update=self._update(elementId)
+        html=self._asHtml(html,plaintext)
+        if update.contents is None:
+            update.contents=html
+            update.appendOnly=True
+        else:
+            update.contents+=html
+
+    def setElementAttribute(self,elementId:str,attributeName:str,attributeValue:typing.Any)->None:
+        """
+        set a single attribute value within an element
+        """
+        update=self._update(elementId)
+        if attributeName.lower()=='style':
+            # replaces the whole style, so forget any earlier style values
+            update.styleValues={}
+        update.attributes.pop(attributeName,None) # so it moves to the end
+        update.attributes[attributeName]=attributeValue
+
+    def setElementStyle(self,elementId:str,cssStyle:str)->None:
+        """
+        Sets the entire css of an element's style= tag.
+        """
+        self.setElementAttribute(elementId,'style',cssStyle)
+
+    def setElementStyleValue(self,elementId:str,styleItemName:str,styleItemValue:typing.Any)->None:
+        """
+        Sets an css style value if it exists.  If not, adds it.
+        """
+        update=self._update(elementId)
+        update.styleValues.pop(styleItemName,None)
+        update.styleValues[styleItemName]=styleItemValue
+
+    def javascript(self)->Javascript:
+        """
+        Get everything recorded so far as a single script
+        (without clearing it)
+        """
+        statements=list(self._statements)
+        pending=self._pending
+        self._flushPending()
+        body='\n'.join(self._statements)
+        self._statements=statements
+        self._pending=pending
+        if not body:
+            return Javascript('')
+        if self.animationFrame:
+            return Javascript(f'requestAnimationFrame(function(){{\n{body}\n}});')
+        return Javascript(body)
+
+    def clear(self)->None:
+        """
+        Forget everything recorded
+        """
+        self.numCalls=0
+        self._statements=[]
+        self._pending={}
+
+    def commit(self)->Javascript:
+        """
+        Get the script, write it to out (if there is one), and start over
+        """
+        js=self.javascript()
+        self.clear()
+        if self.out is not None and js:
+            self.out.write(str(js))
+        return js
+
+    def __str__(self)->str:
+        return str(self.javascript())
@@ -0,0 +1,228 @@
+"""
+Send only what changed when replacing an element's contents
+"""
+import typing
+import difflib
+import html.parser
+from .javascript import Javascript
+from .jsgenerator import JavascriptGenerator
+from .utils import toJsString
+
+
+# elements that never have an end tag
+VOID_ELEMENTS=frozenset((
+    'area','base','br','col','embed','hr','img','input',
+    'link','meta','param','source','track','wbr'))
+
+# the client-side helper that patches the element's child nodes:
+#   p(start,end,html) removes childNodes[start:end] and puts html there
+PATCH_HELPER=r"""var n=e.childNodes,t=document.createElement('template');
+function p(i,j,h){for(var k=j-1;k>=i;k--)e.removeChild(n[k]);
+if(h){t.innerHTML=h;e.insertBefore(t.content,n[i]||null);}}"""
+
+# elements whose start tag closes an open <p>, so that the browser's
+# nodes would not be what the tags seem to say
+# (see https://html.spec.whatwg.org/multipage/parsing.html#parsing-main-inbody)
+CLOSES_P_ELEMENTS=frozenset((
+    'address','article','aside','blockquote','center','details','dialog','dir',
+    'div','dl','fieldset','figcaption','figure','footer','form','h1','h2','h3',
+    'h4','h5','h6','header','hgroup','hr','listing','main','menu','nav','ol',
+    'p','plaintext','pre','search','section','summary','table','ul','xmp'))
+
+
+class _TopLevelSplitter(html.parser.HTMLParser):
+    """
+    Finds where each top-level node (element, run of text, or comment)
+    starts in some html
+    """
+
+    def __init__(self):
+        html.parser.HTMLParser.__init__(self,convert_charrefs=False)
+        self.starts:typing.List[int]=[]
+        self.safe=True # False if the browser might not see the same nodes
+        self._stack:typing.List[str]=[]
+        self._index=0
+        self._lastKind:typing.Optional[str]=None
+
+    def updatepos(self,i:int,j:int)->int:
+        self._index=j
+        return html.parser.HTMLParser.updatepos(self,i,j)
+
+    def _topLevel(self,kind:str)->None:
+        """
+        An event happened at the current position
+        """
+        if self._stack:
+            return
+        if kind!='text' or self._lastKind!='text':
+            self.starts.append(self._index)
+        self._lastKind=kind
+
+    def handle_starttag(self,tag:str,attrs:typing.Any)->None:
+        if tag in CLOSES_P_ELEMENTS and 'p' in self._stack:
+            self.safe=False # the browser ends the <p> before this
+        self._topLevel('element')
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(tag)
+
+    def handle_startendtag(self,tag:str,attrs:typing.Any)->None:
+        if tag in CLOSES_P_ELEMENTS and 'p' in self._stack:
+            self.safe=False
+        self._topLevel('element')
+        if tag not in VOID_ELEMENTS:
+            self.safe=False # <div/> is really just <div>
+
+    def handle_endtag(self,tag:str)->None:
+        if not self._stack or self._stack[-1]!=tag:
+            self.safe=False # optional or mismatched end tags
+            return
+        self._stack.pop()
+
+    def handle_data(self,data:str)->None:
+        self._topLevel('text')
+
+    def handle_entityref(self,name:str)->None:
+        self._topLevel('text')
+
+    def handle_charref(self,name:str)->None:
+        self._topLevel('text')
+
+    def handle_comment(self,data:str)->None:
+        self._topLevel('comment')
+
+    def handle_decl(self,decl:str)->None:
+        self.safe=False
+
+    def handle_pi(self,data:str)->None:
+        self.safe=False
+
+    def unknown_decl(self,data:str)->None:
+        self.safe=False
+
+
+def splitTopLevelNodes(htmlText:str)->typing.Optional[typing.List[str]]:
+    """
+    Split html into its top-level nodes, the same way a browser would
+    turn it into an element's childNodes.
+
+    :return: None if the html is not tidy enough to be sure of that
+        (unclosed or mismatched tags, block elements inside a <p>,
+    doctypes, etc)
+    """
+    splitter=_TopLevelSplitter()
+    splitter.feed(htmlText)
+    splitter.close()
+    if not splitter.safe or splitter._stack: # pylint: disable=protected-access
+        return None
+    starts=splitter.starts
+    return [htmlText[start:end] for start,end in zip(starts,starts[1:]+[len(htmlText)])]
+
+
+class HtmlPatcher:
+    """
+    A stateful replaceElementContents() that remembers the html last sent
+    for each element, and when it changes, only sends javascript to
+    insert/replace/remove the child nodes that are different.
+
+    Falls back to replacing everything when the patch would not be
+    much smaller, or when the html is too messy to know what child
+    nodes the browser will have made out of it.
+
+    NOTE: this assumes nothing else changes the children of those elements.
+    If something does (or the page is reloaded) call forget().
+    Also, the browser wraps bare <tr>s in a <table> in a <tbody>,
+    so patch the <tbody> rather than the <table>.
+    """
+
+    def __init__(self,
+        maxPatchRatio:float=0.5,
+        verify:bool=False):
+        """
+        :param maxPatchRatio: only send a patch if it is at most this
+            fraction of the size of a full replace
+        :param verify: make the patch check that the element has the
+            expected number of children, and replace everything if not
+            (safer, but the full html has to be sent along too)
+        """
+        self.maxPatchRatio=maxPatchRatio
+        self.verify=verify
+        self.patches=0
+        self.fullReplaces=0
+        self._generator=JavascriptGenerator()
+        self._sent:typing.Dict[str,typing.Tuple[str,typing.Optional[typing.List[str]]]]={}
+
+    def forget(self,elementId:typing.Optional[str]=None)->None:
+        """
+        Forget what was sent for an element (or all of them if None)
+        """
+        if elementId is None:
+            self._sent={}
+        else:
+            self._sent.pop(elementId,None)
+
+    def _patch(self,
+        elementId:str,
+        oldNodes:typing.List[str],
+        newNodes:typing.List[str],
+        fullReplace:Javascript
+        )->typing.Optional[str]:
+        """
+        Create a script that turns oldNodes into newNodes
+
+        :return: None if there is no point
+        """
+        matcher=difflib.SequenceMatcher(None,oldNodes,newNodes,autojunk=False)
+        calls=[]
+        # from the end backwards, so earlier indexes stay the same
+        for op,i1,i2,j1,j2 in reversed(matcher.get_opcodes()):
+            if op=='equal':
+                continue
+            calls.append(f"p({i1},{i2},{toJsString(''.join(newNodes[j1:j2]))});")
+        if not calls:
+            return None
+        js=[PATCH_HELPER]
+        if self.verify:
+            js.append(f'if(n.length!=={len(oldNodes)}){{{fullReplace}return;}}')
+        js.extend(calls)
+        element=self._generator._element(elementId) # pylint: disable=protected-access
+        return '(function(e){\n'+'\n'.join(js)+'\n})('+element+');'
+
+    def replaceElementContents(self,
+        elementId:str,
+        newHtml:typing.Any
+        )->Javascript:
+        """
+        Replace the entire contents within the given element's tag,
+        sending as little as possible.
+
+        :return: the javascript to do it (empty if nothing changed)
+        """
+        newHtml=str(newHtml)
+        sent=self._sent.get(elementId)
+        if sent is not None and sent[0]==newHtml:
+            return Javascript('')
+        newNodes=splitTopLevelNodes(newHtml)
+        self._sent[elementId]=(newHtml,newNodes)
+        fullReplace=self._generator.replaceElementContents(elementId,newHtml)
+        if sent is not None and sent[1] is not None and newNodes is not None:
+            patch=self._patch(elementId,sent[1],newNodes,fullReplace)
+            if patch is not None and len(patch)<=len(fullReplace)*self.maxPatchRatio:
+                self.patches+=1
+                return Javascript(patch)
+        self.fullReplaces+=1
+        return fullReplace
+
+    # so it can be dropped in where a setElementContents() would go
+    def setElementContents(self,
+        elementId:str,
+        html:typing.Optional[typing.Any]=None,
+        plaintext:typing.Optional[typing.Any]=None
+        )->Javascript:
+        """
+        Same as replaceElementContents() but with the html/plaintext
+        handling of utils.setElementContents()
+        """
+        if html is None:
+            from htmlTools import Html # pylint: disable=import-outside-toplevel
+            html=Html(text=plaintext)
+        return self.replaceElementContents(elementId,html)
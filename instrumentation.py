@@ -0,0 +1,223 @@
+"""
+Opt-in instrumentation of where the time and payload bytes go
+
+When it is off (the default) nothing is wrapped, so it costs nothing.
+
+Usage:
+    with Instrumentation() as inst:
+        ... generate some javascript ...
+    print(inst.toJson())
+"""
+import typing
+import sys
+import time
+import json
+import threading
+import functools
+from .javascript import Javascript
+
+
+# the utils helpers that get instrumented
+INSTRUMENTED_FUNCTIONS=(
+    'toJsString','toJsStrings','jsAddCssRules','jsAddJavascript','jsAddHtml',
+    'setElementContents','appendElementContents')
+
+
+def _outputSize(result:typing.Any)->int:
+    """
+    How many bytes something returned comes to as utf-8
+    (0 for things that aren't output)
+    """
+    if isinstance(result,Javascript):
+        return len(result.toBytes()) # cached, so sending it later costs nothing extra
+    if isinstance(result,str):
+        return len(result.encode('utf-8'))
+    if isinstance(result,(bytes,bytearray)):
+        return len(result)
+    return 0
+
+
+class Instrumentation:
+    """
+    Keeps call count, cumulative time, and output size for each
+    instrumented method/function.
+
+    Times are inclusive, so eg setElementContents includes the time of
+    the toJsString calls it makes.  Output streamed to an out= file
+    is not counted.
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._lock=threading.Lock()
+        self._stats:typing.Dict[str,typing.List[float]]={} # {name:[calls,seconds,bytes]}
+        self._originals:typing.List[typing.Tuple[typing.Any,typing.Any]]=[] # [(original,wrapped)]
+
+    def record(self,name:str,seconds:float,numBytes:int)->None:
+        """
+        Record one call
+        """
+        with self._lock:
+            stats=self._stats.get(name)
+            if stats is None:
+                self._stats[name]=[1,seconds,numBytes]
+            else:
+                stats[0]+=1
+                stats[1]+=seconds
+                stats[2]+=numBytes
+
+    def wrap(self,name:str,fn:typing.Callable)->typing.Callable:
+        """
+        Wrap a function so that its calls are recorded under name
+        """
+        record=self.record
+        perfCounter=time.perf_counter
+        @functools.wraps(fn)
+        def instrumented(*args,**kwargs):
+            start=perfCounter()
+            result=fn(*args,**kwargs)
+            record(name,perfCounter()-start,_outputSize(result))
+            return result
+        return instrumented
+
+    def snapshot(self)->typing.Dict[str,typing.Dict[str,float]]:
+        """
+        Get the stats so far
+
+        :return: {name:{'calls':n,'seconds':s,'bytes':b}}
+        """
+        with self._lock:
+            return {
+                name:{'calls':int(calls),'seconds':seconds,'bytes':int(numBytes)}
+                for name,(calls,seconds,numBytes) in self._stats.items()}
+
+    def reset(self)->typing.Dict[str,typing.Dict[str,float]]:
+        """
+        Start counting over
+
+        :return: the stats from before the reset
+        """
+        with self._lock:
+            stats=self._stats
+            self._stats={}
+        return {
+            name:{'calls':int(calls),'seconds':seconds,'bytes':int(numBytes)}
+            for name,(calls,seconds,numBytes) in stats.items()}
+
+    def toDict(self)->typing.Dict[str,typing.Dict[str,float]]:
+        """
+        Same as snapshot()
+        """
+        return self.snapshot()
+
+    def toJson(self,indent:typing.Optional[int]=None)->str:
+        """
+        Get the stats as json
+        """
+        return json.dumps(self.snapshot(),indent=indent,sort_keys=True)
+
+    @property
+    def enabled(self)->bool:
+        """
+        Whether this is what is currently instrumenting things
+        """
+        return _active is self
+
+    def __enter__(self)->'Instrumentation':
+        enableInstrumentation(self)
+        return self
+
+    def __exit__(self,excType,excValue,traceback)->None:
+        disableInstrumentation()
+
+
+# the instrumentation that is currently on, if any
+_active:typing.Optional[Instrumentation]=None
+_activeLock=threading.Lock()
+
+
+def _replaceEverywhere(old:typing.Any,new:typing.Any)->None:
+    """
+    Replace every reference to a function within this package
+    (including things that were imported with "from .utils import x")
+    """
+    package=__name__.rsplit('.',1)[0]
+    for moduleName,module in list(sys.modules.items()):
+        if module is None or (moduleName!=package and not moduleName.startswith(package+'.')):
+            continue
+        for name,value in list(vars(module).items()):
+            if value is old:
+                setattr(module,name,new)
+    # JavascriptWriter keeps its own table of the helpers
+    from .jswriter import JavascriptWriter # pylint: disable=import-outside-toplevel
+    helpers=JavascriptWriter.STREAMING_HELPERS
+    for name,value in list(helpers.items()):
+        if value is old:
+            helpers[name]=new
+
+
+def _publicMethods(cls:type)->typing.Iterator[typing.Tuple[str,typing.Callable]]:
+    for name,value in list(vars(cls).items()):
+        if not name.startswith('_') and callable(value):
+            yield name,value
+
+
+def enableInstrumentation(
+    instrumentation:typing.Optional[Instrumentation]=None
+    )->Instrumentation:
+    """
+    Start instrumenting the JavascriptGenerator methods, the utils
+    helpers (including toJsString) and the JsHelper methods.
+
+    :param instrumentation: what to record into (creates one if None)
+    """
+    # pylint: disable=import-outside-toplevel
+    from . import utils
+    from .jsgenerator import JavascriptGenerator
+    from .jsHelper import JsHelper
+    global _active # pylint: disable=global-statement
+    if instrumentation is None:
+        instrumentation=Instrumentation()
+    with _activeLock:
+        if _active is not None:
+            raise Exception('Instrumentation is already enabled')
+        originals=instrumentation._originals # pylint: disable=protected-access
+        for name in INSTRUMENTED_FUNCTIONS:
+            fn=getattr(utils,name)
+            wrapped=instrumentation.wrap(name,fn)
+            _replaceEverywhere(fn,wrapped)
+            originals.append((fn,wrapped))
+        for cls in (JavascriptGenerator,JsHelper):
+            for name,method in _publicMethods(cls):
+                wrapped=instrumentation.wrap(f'{cls.__name__}.{name}',method)
+                setattr(cls,name,wrapped)
+                originals.append(((cls,name,method),wrapped))
+        _active=instrumentation
+    return instrumentation
+
+
+def disableInstrumentation()->None:
+    """
+    Stop instrumenting and put everything back the way it was
+    """
+    global _active # pylint: disable=global-statement
+    with _activeLock:
+        if _active is None:
+            return
+        originals=_active._originals # pylint: disable=protected-access
+        for original,wrapped in reversed(originals):
+            if isinstance(original,tuple):
+                cls,name,method=original
+                setattr(cls,name,method)
+            else:
+                _replaceEverywhere(wrapped,original)
+        originals.clear()
+        _active=None
+
+
+def currentInstrumentation()->typing.Optional[Instrumentation]:
+    """
+    The instrumentation that is on, or None
+    """
+    return _active
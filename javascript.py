@@ -5,25 +5,168 @@ The reason it is needed is because sometimes we don't know whether
 a function is returning java script code or just plain text.
 """
 import typing
+import types
+import codecs
 import collections
 
 
-class CustomString(str,collections.UserString): # type: ignore
+# the biggest piece iterBytes() yields
+BYTES_CHUNK_SIZE=65536
+
+
+class CustomString(str):
     """
     A class that acts like a string
+
+    The str itself is the only copy of the value, with no __dict__ or
+    separate UserString-style .data alongside it.
+
+    Appending does not copy anything, it just records the new chunk.
+    The chunks are joined the first time the value is actually looked at
+    (str(), len(), slicing, etc) and the result is kept, so building a
+    script from many small pieces is linear rather than quadratic.
+
+    NOTE: the underlying str value is fixed when the object is created,
+    so anything that reads the raw str buffer directly (eg ''.join() or
+    file.write()) will not see appended chunks.  Use str(x) for those.
+
+    The encoded bytes are also kept (until the next change), so sending
+    the same object several times only encodes it once.
     """
 
-    def __init__(self,s=''):
-        collections.UserString.__init__(self,s)
+    # _chunks is None until something is appended or assigned,
+    # at which point it holds the real value (and the str is out of date)
+    __slots__=('_chunks','_encoded')
+
+    def __new__(cls,s=''):
+        self=str.__new__(cls,s)
+        self._chunks:typing.Optional[typing.List[str]]=None
+        self._encoded:typing.Optional[typing.Tuple[str,typing.List[bytes]]]=None
+        return self
+
+    def __init__(self,s=''): # pylint: disable=super-init-not-called,unused-argument
+        pass # everything is done in __new__
+
+    def _value(self)->str:
+        """
+        The current value, without copying it
+        (may be self, if nothing has been appended)
+        """
+        chunks=self._chunks
+        if chunks is None:
+            return self
+        if len(chunks)>1:
+            chunks[:]=[''.join(chunks)]
+        return chunks[0]
+
+    @property
+    def data(self)->str:
+        """
+        The current value as a plain str
+        """
+        if self._chunks is None:
+            return str.__str__(self)
+        return self._value()
+    @data.setter
+    def data(self,data:str)->None:
+        if type(data) is not str: # pylint: disable=unidiomatic-typecheck
+            data=str(data)
+        self._chunks=[data]
+        self._encoded=None
+
+    def __str__(self)->str:
+        return self.data
+
+    def __format__(self,formatSpec:str)->str:
+        return str.__format__(self._value(),formatSpec)
 
     # ---- features I wish str had
     def append(self,s:typing.Union[str,'Javascript']):
         """
         append onto the end of the js
         """
-        self.data=self.data+s
+        if type(s) is not str: # pylint: disable=unidiomatic-typecheck
+            s=str(s)
+        if self._chunks is None:
+            self._chunks=[str.__str__(self)] if len(self) else []
+        self._chunks.append(s)
+        self._encoded=None
+
+    # ---- bytes output
+    def _encodedPieces(self,encoding:str)->typing.List[bytes]:
+        """
+        The value encoded a chunk at a time (without joining the str first),
+        remembered until the value changes
+        """
+        encoded=self._encoded
+        if encoded is None or encoded[0]!=encoding:
+            chunks=self._chunks
+            if chunks is None:
+                pieces=[str.encode(self,encoding)]
+            else:
+                # one encoder for the whole thing, so eg a BOM is only written once
+                encoder=codecs.getincrementalencoder(encoding)()
+                pieces=[encoder.encode(chunk) for chunk in chunks if chunk]
+                pieces.append(encoder.encode('',final=True))
+            encoded=(encoding,pieces)
+            self._encoded=encoded
+        return encoded[1]
+
+    def toBytes(self,encoding:str='utf-8')->bytes:
+        """
+        Get the value as encoded bytes.
+
+        The result is cached, so asking again (eg, for every client
+        that gets the same script) does not encode it again.
+        """
+        pieces=self._encodedPieces(encoding)
+        if len(pieces)!=1:
+            pieces[:]=[b''.join(pieces)]
+        return pieces[0]
+
+    # the name people tend to look for
+    to_bytes=toBytes
+
+    def __bytes__(self)->bytes:
+        return self.toBytes()
+
+    def iterBytes(self,
+        encoding:str='utf-8',
+        chunkSize:typing.Optional[int]=None
+        )->typing.Iterator[memoryview]:
+        """
+        Go through the encoded value as memoryviews of at most chunkSize
+        bytes, without ever building one big str or bytes.
 
-    # ---- UserString is pretty good but a few functions aren't quite right
+        Good for handing to a WSGI/ASGI response a piece at a time.
+        (They are views of the cached bytes, so nothing is copied.)
+
+        :param chunkSize: defaults to BYTES_CHUNK_SIZE
+        """
+        if chunkSize is None:
+            chunkSize=BYTES_CHUNK_SIZE
+        for piece in self._encodedPieces(encoding):
+            view=memoryview(piece)
+            for i in range(0,len(view),chunkSize):
+                yield view[i:i+chunkSize]
+
+    def __radd__(self,other:typing.Any)->'CustomString':
+        # self.data, not self._value(), which may be self and
+        # would come right back here
+        return self.__class__(str(other)+self.data)
+
+    def __iter__(self)->typing.Iterator[str]:
+        return iter(self._value())
+
+    # copies get their own (already joined) value rather than sharing
+    # the list of chunks, which appending to one would change for both
+    def __copy__(self)->'CustomString':
+        return self.__class__(self.data)
+
+    def __deepcopy__(self,memo:typing.Dict[int,typing.Any])->'CustomString':
+        return self.__class__(self.data)
+
+    # ---- a few functions that need to be a little different
 
     def join(self,seq:typing.Iterable[typing.Any])->str:
         """
@@ -31,16 +174,16 @@ class CustomString(str,collections.UserString): # type: ignore
         """
         if isinstance(seq,str):
             return __class__(seq)
-        return __class__(self.data.join(seq))
+        return __class__(str.join(self._value(),seq))
 
     def partition(self,sep:str)->typing.Tuple[str,str,str]:
         """ String partition """
-        before,sep,after=self.data.partition(sep)
+        before,sep,after=str.partition(self._value(),_valueOf(sep))
         return __class__(before),__class__(sep),__class__(after)
 
     def rpartition(self,sep:str)->typing.Tuple[str,str,str]:
         """ String rpartition """
-        before,sep,after=self.data.rpartition(sep)
+        before,sep,after=str.rpartition(self._value(),_valueOf(sep))
         return __class__(before),__class__(sep),__class__(after)
 
     def split(self,
@@ -48,18 +191,72 @@ class CustomString(str,collections.UserString): # type: ignore
         maxsplit:typing.SupportsIndex=-1
         )->typing.List[str]:
         """ String split """
-        return [__class__(s) for s in self.data.split(sep,maxsplit)]
+        return [__class__(s) for s in str.split(self._value(),_valueOf(sep),maxsplit)]
 
     def rsplit(self,
         sep:typing.Optional[str]=None,
         maxsplit:typing.SupportsIndex=-1
         )->typing.List[str]:
         """ String rsplit """
-        return [__class__(s) for s in self.data.rsplit(sep,maxsplit)]
+        return [__class__(s) for s in str.rsplit(self._value(),_valueOf(sep),maxsplit)]
 
     def splitlines(self,keepends:bool=False)->typing.List[str]:
         """ String splitlines """
-        return [__class__(s) for s in self.data.splitlines(keepends)]
+        return [__class__(s) for s in str.splitlines(self._value(),keepends)]
+
+
+def _valueOf(x:typing.Any)->typing.Any:
+    """
+    The current value of x if it is a CustomString, otherwise x
+    """
+    if isinstance(x,CustomString):
+        return x._value() # pylint: disable=protected-access
+    return x
+
+
+# str methods that give back a new string which, like UserString,
+# should be the same class as the original
+_SAME_CLASS_RESULTS=frozenset((
+    '__add__','__getitem__','__mod__','__mul__','__rmul__',
+    'capitalize','casefold','center','expandtabs','ljust','lower','lstrip',
+    'removeprefix','removesuffix','replace','rjust','rstrip','strip',
+    'swapcase','title','translate','upper','zfill'))
+
+
+def _forwardToValue(name:str)->typing.Callable:
+    """
+    Create a method that calls the str method of the same name
+    on the current value rather than on the (possibly out of date) str
+    """
+    strMethod=getattr(str,name)
+    if name in _SAME_CLASS_RESULTS:
+        def sameClassMethod(self,*args,**kwargs):
+            return self.__class__(strMethod(self._value(),*[_valueOf(a) for a in args],**kwargs))
+        method=sameClassMethod
+    else:
+        def valueMethod(self,*args,**kwargs):
+            return strMethod(self._value(),*[_valueOf(a) for a in args],**kwargs)
+        method=valueMethod
+    method.__name__=name
+    method.__qualname__=f'CustomString.{name}'
+    method.__doc__=strMethod.__doc__
+    return method
+
+
+def _forwardStrMethods()->None:
+    """
+    The str methods would only ever see the value the object was created
+    with, so point the ones that UserString covers at the current value.
+    (__rmod__ is left alone because str%x already goes through __str__ anyway)
+    """
+    for name,value in list(vars(collections.UserString).items()):
+        if name in ('__init__','__rmod__') or name in vars(CustomString):
+            continue
+        if isinstance(value,types.FunctionType) and hasattr(str,name):
+            setattr(CustomString,name,_forwardToValue(name))
+
+
+_forwardStrMethods()
 
 
 class Javascript(CustomString):
@@ -69,5 +266,16 @@ class Javascript(CustomString):
     The reason it is needed is because sometimes we don't know whether
     a function is returning java script code or just plain text.
     """
+    __slots__=()
+
     def __init__(self,s=''):
         CustomString.__init__(self,s)
+
+    def minify(self,shortenNames:bool=True)->'Javascript':
+        """
+        Get a smaller version of this javascript
+
+        (see jsOptimizer.minify)
+        """
+        from .jsOptimizer import minify # pylint: disable=import-outside-toplevel
+        return minify(self,shortenNames)
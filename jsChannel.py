@@ -0,0 +1,430 @@
+"""
+Push generated javascript (dom updates and the like) to live clients
+with asyncio, as server-sent events or websocket frames.
+
+Usage:
+    channel=JavascriptChannel(policy='merge')
+    server=await serveSse(channel,port=8080)
+    ...
+    await channel.publish(setElementContents('clock',now),key='clock')
+"""
+import typing
+import asyncio
+import collections
+import re
+import struct
+from .javascript import Javascript
+
+
+# what to do when a subscriber's queue is full:
+#   'block' - publish() waits until there is room (backpressure)
+#   'dropOldest' - throw away the oldest queued update
+#   'dropNewest' - throw away the new update
+#   'merge' - squash everything queued into one update
+QUEUE_POLICIES=('block','dropOldest','dropNewest','merge')
+
+# how many updates a subscriber can have queued by default
+DEFAULT_QUEUE_SIZE=256
+
+# splits text into lines the way the event-stream format does
+SSE_LINE_REGEX=re.compile(r'\r\n|\r|\n')
+
+JavascriptUpdate=typing.Union[str,Javascript]
+
+
+def _toBytes(js:JavascriptUpdate,encoding:str='utf-8')->bytes:
+    """
+    Encode some javascript, using its cached bytes if it has them
+    """
+    if isinstance(js,Javascript):
+        return js.toBytes(encoding)
+    return str(js).encode(encoding)
+
+
+def sseFrame(
+    js:JavascriptUpdate,
+    event:typing.Optional[str]='javascript',
+    eventId:typing.Optional[typing.Union[int,str]]=None,
+    encoding:str='utf-8'
+    )->bytes:
+    """
+    Wrap some javascript up as a server-sent event
+
+    See also:
+        https://html.spec.whatwg.org/multipage/server-sent-events.html
+    """
+    lines=[]
+    if eventId is not None:
+        lines.append(f'id: {eventId}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.extend(['data: '+line for line in SSE_LINE_REGEX.split(str(js))])
+    return ('\n'.join(lines)+'\n\n').encode(encoding)
+
+
+def websocketFrame(js:JavascriptUpdate,encoding:str='utf-8')->bytes:
+    """
+    Wrap some javascript up as a single (unmasked, server to client)
+    websocket text frame
+
+    See also:
+        https://www.rfc-editor.org/rfc/rfc6455#section-5.2
+    """
+    payload=_toBytes(js,encoding)
+    size=len(payload)
+    if size<126:
+        header=struct.pack('!BB',0x81,size)
+    elif size<65536:
+        header=struct.pack('!BBH',0x81,126,size)
+    else:
+        header=struct.pack('!BBQ',0x81,127,size)
+    return header+payload
+
+
+FRAME_FORMATS:typing.Dict[str,typing.Callable[...,bytes]]={
+    'sse':sseFrame,
+    'websocket':websocketFrame}
+
+
+class _Update:
+    """
+    One published update, shared by every subscriber it goes to,
+    so that its frames are only built once however many there are
+    """
+    __slots__=('js','_frames')
+
+    def __init__(self,js:JavascriptUpdate):
+        self.js=js
+        self._frames:typing.Dict[typing.Tuple[str,str],bytes]={}
+
+    def frame(self,frameFormat:str,encoding:str)->bytes:
+        """
+        The update as bytes ready to send to the client
+        """
+        key=(frameFormat,encoding)
+        frame=self._frames.get(key)
+        if frame is None:
+            frame=FRAME_FORMATS[frameFormat](self.js,encoding=encoding)
+            self._frames[key]=frame
+        return frame
+
+
+class Subscriber:
+    """
+    One client's view of a JavascriptChannel
+
+    Holds a bounded queue of updates that have not been sent yet.
+    Iterate over it (async for) to get them, or use frames() to get them
+    ready to write to the client.
+    """
+
+    def __init__(self,
+        channel:'JavascriptChannel',
+        maxQueue:int=DEFAULT_QUEUE_SIZE,
+        policy:str='dropOldest'):
+        """
+        :param maxQueue: the most updates that can be waiting
+        :param policy: what to do when that fills up (see QUEUE_POLICIES)
+        """
+        if policy not in QUEUE_POLICIES:
+            raise Exception(f'Unknown queue policy "{policy}", expected one of {QUEUE_POLICIES}')
+        self.channel=channel
+        self.maxQueue=max(1,maxQueue)
+        self.policy=policy
+        self.closed=False
+        self.delivered=0
+        self.dropped=0
+        self.merged=0
+        self._queue:typing.Deque[typing.Tuple[typing.Optional[str],_Update]]=\
+            collections.deque()
+        self._notEmpty=asyncio.Event()
+        self._notFull=asyncio.Event()
+        self._notFull.set()
+
+    def __len__(self)->int:
+        return len(self._queue)
+
+    @property
+    def stats(self)->typing.Dict[str,int]:
+        """
+        queued/delivered/dropped/merged
+        """
+        return {
+            'queued':len(self._queue),
+            'delivered':self.delivered,
+            'dropped':self.dropped,
+            'merged':self.merged}
+
+    def _merge(self)->None:
+        """
+        Squash everything that is queued into a single update
+        """
+        if len(self._queue)<2:
+            return
+        self.merged+=len(self._queue)-1
+        merged=Javascript('\n'.join([str(update.js) for _,update in self._queue]))
+        self._queue.clear()
+        self._queue.append((None,_Update(merged)))
+
+    def putNowait(self,
+        js:typing.Union[JavascriptUpdate,_Update],
+        key:typing.Optional[str]=None
+        )->bool:
+        """
+        Queue an update without waiting.
+
+        :param key: with the 'merge' policy, a queued update with the same
+            key (eg, the element being updated) is replaced by this one
+        :return: False if the update was dropped
+        """
+        if self.closed:
+            return False
+        queue=self._queue
+        if key is not None and self.policy=='merge':
+            for i,(queuedKey,_) in enumerate(queue):
+                if queuedKey==key:
+                    del queue[i]
+                    self.merged+=1
+                    break
+        if len(queue)>=self.maxQueue:
+            if self.policy=='dropNewest':
+                self.dropped+=1
+                return False
+            if self.policy=='dropOldest':
+                queue.popleft()
+                self.dropped+=1
+            elif self.policy=='merge':
+                self._merge()
+            else:
+                raise Exception('Subscriber queue is full')
+        if not isinstance(js,_Update):
+            js=_Update(js)
+        queue.append((key,js))
+        self._notEmpty.set()
+        if len(queue)>=self.maxQueue:
+            self._notFull.clear()
+        return True
+
+    async def put(self,
+        js:typing.Union[JavascriptUpdate,_Update],
+        key:typing.Optional[str]=None
+        )->bool:
+        """
+        Queue an update, waiting for room if the policy is 'block'
+
+        :return: False if the update was dropped
+        """
+        if self.policy=='block':
+            while len(self._queue)>=self.maxQueue and not self.closed:
+                await self._notFull.wait()
+        return self.putNowait(js,key)
+
+    async def _getUpdate(self)->_Update:
+        """
+        Wait for the next update
+
+        :raises StopAsyncIteration: if closed and there is nothing left
+        """
+        while not self._queue:
+            if self.closed:
+                raise StopAsyncIteration()
+            self._notEmpty.clear()
+            await self._notEmpty.wait()
+        _,update=self._queue.popleft()
+        self.delivered+=1
+        self._notFull.set()
+        return update
+
+    async def get(self)->JavascriptUpdate:
+        """
+        Wait for the next update
+
+        :raises StopAsyncIteration: if closed and there is nothing left
+        """
+        return (await self._getUpdate()).js
+
+    def __aiter__(self)->'Subscriber':
+        return self
+
+    async def __anext__(self)->JavascriptUpdate:
+        return await self.get()
+
+    async def frames(self,
+        frameFormat:str='sse',
+        encoding:str='utf-8'
+        )->typing.AsyncIterator[bytes]:
+        """
+        Go through the updates as bytes ready to send to the client
+
+        :param frameFormat: 'sse' or 'websocket'
+        """
+        if frameFormat not in FRAME_FORMATS:
+            raise Exception(
+                f'Unknown frame format "{frameFormat}", expected one of {tuple(FRAME_FORMATS)}')
+        while True:
+            try:
+                update=await self._getUpdate()
+            except StopAsyncIteration:
+                return
+            # built once per update, then shared with the other subscribers
+            yield update.frame(frameFormat,encoding)
+
+    def close(self)->None:
+        """
+        Stop taking updates.  Whatever is queued can still be read.
+        """
+        self.closed=True
+        self._notEmpty.set()
+        self._notFull.set()
+        self.channel.unsubscribe(self)
+
+    async def __aenter__(self)->'Subscriber':
+        return self
+
+    async def __aexit__(self,excType,excValue,traceback)->None:
+        self.close()
+
+
+class JavascriptChannel:
+    """
+    Sends javascript updates to any number of subscribers,
+    each with its own bounded queue so one slow client does not
+    hold up (or eat the memory of) everyone else, unless that is
+    what is asked for with the 'block' policy.
+    """
+
+    def __init__(self,
+        maxQueue:int=DEFAULT_QUEUE_SIZE,
+        policy:str='dropOldest'):
+        """
+        :param maxQueue: default queue size for subscribers
+        :param policy: default full-queue policy for subscribers
+            (see QUEUE_POLICIES)
+        """
+        if policy not in QUEUE_POLICIES:
+            raise Exception(f'Unknown queue policy "{policy}", expected one of {QUEUE_POLICIES}')
+        self.maxQueue=maxQueue
+        self.policy=policy
+        self.closed=False
+        self._subscribers:typing.List[Subscriber]=[]
+
+    def __len__(self)->int:
+        return len(self._subscribers)
+
+    def subscribe(self,
+        maxQueue:typing.Optional[int]=None,
+        policy:typing.Optional[str]=None
+        )->Subscriber:
+        """
+        Add a subscriber
+
+        Can be used as:
+            async with channel.subscribe() as subscriber:
+                async for frame in subscriber.frames():
+                    ...
+        """
+        if self.closed:
+            raise Exception('Channel is closed')
+        subscriber=Subscriber(self,
+            self.maxQueue if maxQueue is None else maxQueue,
+            self.policy if policy is None else policy)
+        self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self,subscriber:Subscriber)->None:
+        """
+        Remove a subscriber (same as subscriber.close())
+        """
+        if subscriber in self._subscribers:
+            self._subscribers.remove(subscriber)
+        if not subscriber.closed:
+            subscriber.close()
+
+    async def publish(self,
+        js:JavascriptUpdate,
+        key:typing.Optional[str]=None
+        )->int:
+        """
+        Send an update to all subscribers, waiting on any
+        with the 'block' policy that are full
+
+        :param key: what the update is for, so that the 'merge' policy
+            can replace an older update for the same thing
+        :return: how many subscribers took it
+        """
+        update=_Update(js) # so the frames are only built once for everyone
+        accepted=0
+        for subscriber in list(self._subscribers):
+            if await subscriber.put(update,key):
+                accepted+=1
+        return accepted
+
+    def publishNowait(self,
+        js:JavascriptUpdate,
+        key:typing.Optional[str]=None
+        )->int:
+        """
+        Same as publish() but never waits
+
+        :raises Exception: if a 'block' subscriber is full
+        """
+        update=_Update(js)
+        accepted=0
+        for subscriber in list(self._subscribers):
+            if subscriber.putNowait(update,key):
+                accepted+=1
+        return accepted
+
+    def close(self)->None:
+        """
+        Close the channel and all of its subscribers
+        """
+        self.closed=True
+        for subscriber in list(self._subscribers):
+            subscriber.close()
+
+
+async def _readRequestHead(reader:asyncio.StreamReader)->None:
+    """
+    Skip over an http request's head
+    """
+    while True:
+        line=await reader.readline()
+        if not line or line in (b'\r\n',b'\n'):
+            return
+
+
+async def serveSse(
+    channel:JavascriptChannel,
+    host:str='127.0.0.1',
+    port:int=0,
+    maxQueue:typing.Optional[int]=None,
+    policy:typing.Optional[str]=None
+    )->asyncio.AbstractServer:
+    """
+    A minimal http server that streams a channel as server-sent events
+    to everyone that connects (whatever they ask for).
+
+    Good for local testing and as an example of hooking a channel
+    up to a real server.  Waiting on the socket to drain is what
+    pushes back on a slow client's queue.
+
+    :param port: 0 picks a free port (see server.sockets[0].getsockname())
+    """
+    async def handleClient(reader:asyncio.StreamReader,writer:asyncio.StreamWriter)->None:
+        try:
+            await _readRequestHead(reader)
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'Connection: close\r\n\r\n')
+            async with channel.subscribe(maxQueue,policy) as subscriber:
+                async for frame in subscriber.frames('sse'):
+                    writer.write(frame)
+                    await writer.drain()
+        except (ConnectionError,asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handleClient,host,port)
@@ -3,16 +3,181 @@ A helper for javascript functions
 """
 import typing
 import re
+import hashlib
+import threading
+import collections
 import xml.dom.minidom
+from .jsTokenizer import findFunctions,JsFunction
+from .scriptScanner import iterScriptBlocks,readHtml,HtmlSource,HtmlLandmarks,ScriptBlock
 
 
 DomElementType=xml.dom.minidom.Element
 
+# the type identification FixScriptTags() gives javascript
+SCRIPT_TYPE_ATTRIBUTES=' language="JavaScript" type="text/javascript"'
+
+# script type= values that mean plain old javascript
+# (see https://html.spec.whatwg.org/multipage/scripting.html#javascript-mime-type)
+JAVASCRIPT_MIME_TYPES=frozenset((
+    'application/ecmascript','application/javascript','application/x-ecmascript',
+    'application/x-javascript','text/ecmascript','text/javascript','text/javascript1.0',
+    'text/javascript1.1','text/javascript1.2','text/javascript1.3','text/javascript1.4',
+    'text/javascript1.5','text/jscript','text/livescript','text/x-ecmascript',
+    'text/x-javascript'))
+
+# script language= values that mean javascript
+JAVASCRIPT_LANGUAGES=frozenset((
+    'javascript','javascript1.0','javascript1.1','javascript1.2','javascript1.3',
+    'javascript1.4','javascript1.5','jscript','ecmascript','livescript'))
+
+# an attribute in a start tag
+TAG_ATTRIBUTE_REGEX=re.compile(
+    r"""\s+(?P<name>[^\s"'>/=]+)(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?""")
+
+
+def _isScriptToFix(attributes:typing.Mapping[str,str])->bool:
+    """
+    Whether FixScriptTags() should touch a script tag with these attributes
+    (only classic javascript, not modules, json, templates, etc)
+    """
+    language=attributes.get('language','').strip().lower()
+    if language and language not in JAVASCRIPT_LANGUAGES:
+        return False
+    scriptType=attributes.get('type','').split(';',1)[0].strip().lower()
+    return not scriptType or scriptType in JAVASCRIPT_MIME_TYPES
+
+
+def _hasScriptTypeAttributes(attributes:typing.Mapping[str,str])->bool:
+    """
+    Whether a script tag is already identified the way FixScriptTags() wants
+    """
+    return attributes.get('language')=='JavaScript' \
+        and attributes.get('type')=='text/javascript'
+
+
+def _isCdataWrapped(code:str)->bool:
+    """
+    Whether script code is already wrapped in a commented-out CDATA section
+    """
+    code=code.strip()
+    return code.startswith('//<![CDATA[') and code.endswith('//]]>')
+
+
+def _cdataWrap(code:str)->str:
+    """
+    Wrap script code in a commented-out CDATA section
+    """
+    return '//<![CDATA[\n'+code.strip()+'\n//]]>'
+
+
+def _fixScriptStartTag(tag:str)->str:
+    """
+    Give a raw <script ...> start tag the right type identification,
+    leaving any other attributes exactly as they were
+    """
+    def dropTypeAttribute(match:typing.Match)->str:
+        if match.group('name').lower() in ('language','type'):
+            return ''
+        return match.group(0)
+    return tag[:7]+SCRIPT_TYPE_ATTRIBUTES+TAG_ATTRIBUTE_REGEX.sub(dropTypeAttribute,tag[7:])
+
+
+class FunctionIndexCache:
+    """
+    Remembers the {fnName:fnCode} index of script blocks, keyed by
+    a hash of the script text, so that unchanged scripts do not have to
+    be parsed again.  The least recently used entries are dropped once
+    there are more than maxEntries.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self,maxEntries:int=1024):
+        self.maxEntries=maxEntries
+        self._entries:typing.OrderedDict[bytes,typing.Dict[str,str]]=collections.OrderedDict()
+        self._lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+    @staticmethod
+    def key(code:str)->bytes:
+        """
+        The cache key for some code
+        """
+        return hashlib.blake2b(code.encode('utf-8','surrogatepass'),digest_size=16).digest()
+
+    def get(self,
+        code:str,
+        indexer:typing.Callable[[str],typing.Dict[str,str]]
+        )->typing.Dict[str,str]:
+        """
+        Get the function index for some code, calling indexer(code)
+        to create it if it is not already cached.
+
+        The returned dict is shared, so do not modify it.
+        """
+        key=self.key(code)
+        with self._lock:
+            fns=self._entries.get(key)
+            if fns is not None:
+                self._entries.move_to_end(key)
+                self.hits+=1
+                return fns
+            self.misses+=1
+        fns=indexer(code)
+        with self._lock:
+            self._entries[key]=fns
+            while len(self._entries)>self.maxEntries:
+                self._entries.popitem(last=False)
+                self.evictions+=1
+        return fns
+
+    def clear(self)->None:
+        """
+        Forget everything (and reset the stats)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits=0
+            self.misses=0
+            self.evictions=0
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    @property
+    def stats(self)->typing.Dict[str,typing.Union[int,float]]:
+        """
+        hits/misses/evictions/entries/hitRatio
+        """
+        lookups=self.hits+self.misses
+        return {
+            'hits':self.hits,
+            'misses':self.misses,
+            'evictions':self.evictions,
+            'entries':len(self._entries),
+            'hitRatio':self.hits/lookups if lookups else 0.0}
+
+
+# shared by all JsHelpers that are not given their own
+defaultFunctionIndexCache=FunctionIndexCache()
+
+
 class JsHelper:
     """
     A helper for javascript functions
     """
 
+    def __init__(self,functionCache:typing.Optional[FunctionIndexCache]=None):
+        """
+        :param functionCache: where to remember script function indexes
+            (if None, uses defaultFunctionIndexCache)
+        """
+        if functionCache is None:
+            functionCache=defaultFunctionIndexCache
+        self.functionCache=functionCache
+
     def GetFunctions(self,dom:DomElementType)->typing.Dict[str,str]:
         """
         Gets all the existing javascript functions in a {fnName:fnCode} dictionary
@@ -25,73 +190,139 @@ class JsHelper:
             head=head[0]
         scriptTags:typing.Iterable[DomElementType]=head.getElementsByTagName('script')
         for scriptTag in scriptTags:
-            if scriptTag.getAttribute('language').lower()!='javascript' \
-                and scriptTag.getAttribute('type').lower()!='text/javascript':
+            if not self._IsJavascriptTag(scriptTag):
                 continue
-            code=scriptTag.childNodes[0].nodeValue
-            if code is None:
-                code=''
-            moreFns:typing.Dict[str,str]=self.GetFunctionsFromCodeString(code)
+            code=self._GetScriptCode(scriptTag)
+            moreFns=self.functionCache.get(code,self.GetFunctionsFromCodeString)
             for k,v in moreFns.items():
                 fns[k]=v
         return fns
 
+    def _IsJavascriptTag(self,scriptTag:DomElementType)->bool:
+        """
+        Whether a script tag says that it is javascript
+        """
+        return scriptTag.getAttribute('language').lower()=='javascript' \
+            or scriptTag.getAttribute('type').lower()=='text/javascript'
+
+    def _GetScriptCode(self,scriptTag:DomElementType)->str:
+        """
+        Get all the code inside of a script tag
+        (which may be split across several text nodes)
+        """
+        return ''.join([node.nodeValue or '' for node in scriptTag.childNodes
+            if node.nodeType in (node.TEXT_NODE,node.CDATA_SECTION_NODE)])
+
     def FixScriptTags(self,dom:DomElementType)->None:
         """
         Makes all the script tags in the given document universally compatible.
+
+        Only classic javascript (no type=, or one of JAVASCRIPT_MIME_TYPES)
+        is changed, so modules, json data, templates and the like are left
+        alone.  Tags that are already right are not touched.
         """
-        scriptTags=dom.getElementsByTagName('script')
-        hh=HtmlHelper()
-        for scriptTag in scriptTags:
-            if scriptTag.getAttribute('language').lower()!='javascript' \
-                and scriptTag.getAttribute('type').lower()!='text/javascript':
-                #
-                if scriptTag.getAttribute('language') and scriptTag.getAttribute('type'):
-                    continue # Some other kind of script.  Ignore it.
+        domDocument=dom.ownerDocument
+        if domDocument is None:
+            raise Exception('No document assoicated with HTML')
+        for scriptTag in dom.getElementsByTagName('script'):
+            attributes={'language':scriptTag.getAttribute('language'),
+                'type':scriptTag.getAttribute('type')}
+            if not _isScriptToFix(attributes):
+                continue # Some other kind of script.  Ignore it.
             # make sure the type identification is correct
-            scriptTag.setAttribute('language','JavaScript')
-            scriptTag.setAttribute('type','text/javascript')
+            if not _hasScriptTypeAttributes(attributes):
+                scriptTag.setAttribute('language','JavaScript')
+                scriptTag.setAttribute('type','text/javascript')
             # make sure the contents are inside CDATA section
-            innerHtml=hh.getInnerHtml(scriptTag).strip()
-            if len(innerHtml)<2 or innerHtml[0:2]!='//':
-                innerHtml='//\n'+innerHtml+'\n//'
-            if len(innerHtml)<10 or innerHtml[2:10]!='<![CDATA[':
-                # replace all non-quoted html elements with plain text
-                regex=re.compile("""(.*?)((?P<q>["']).*?(?P=q))""",re.DOTALL)
-                chunks=[]
-                lastPos=0
-                for match in regex.finditer(innerHtml):
-                    chunks.append(hh.htmlUnescape(match.group(1)))
-                    lastPos=match.end(1)
-                    if match.group(2) is not None:
-                        chunks.append(match.group(2))
-                        lastPos=match.end(2)
-                chunks.append(innerHtml[lastPos:])
-                chunks[0]='//<![CDATA['+chunks[0].split('//',1)[-1]
-                chunks[len(chunks)-1]=chunks[-1].rsplit('//',1)[0]+'//]]>'
-                innerHtml=''.join(chunks)
-            hh.setInnerHtml(scriptTag,innerHtml)
+            if any(node.nodeType==node.CDATA_SECTION_NODE for node in scriptTag.childNodes):
+                continue
+            code=self._GetScriptCode(scriptTag).strip()
+            while scriptTag.childNodes.length>0:
+                scriptTag.removeChild(scriptTag.childNodes[0])
+            scriptTag.appendChild(domDocument.createTextNode('//'))
+            scriptTag.appendChild(domDocument.createCDATASection('\n'+code+'\n//'))
+
+    def FixScriptTagsInHtml(self,
+        source:HtmlSource,
+        encoding:str='utf-8',
+        fixes:typing.Optional[typing.List[ScriptBlock]]=None
+        )->typing.Union[str,bytes]:
+        """
+        Same as FixScriptTags() but works on raw html
+        (str, bytes, file-like object, or os.PathLike file path)
+        and returns the new html (bytes unless given a str).
+
+        The script tags are found in one pass and only the parts that
+        need fixing are spliced into the output.  Every other byte of
+        the document is left exactly as it was.
+
+        NOTE: html script contents are not entity-escaped, so unlike
+        the dom version, there is nothing to unescape.
+
+        :param fixes: if specified, each block that needed fixing
+            is added to this list
+        """
+        source=readHtml(source)
+        isStr=isinstance(source,str)
+        chunks:typing.List[typing.Union[str,bytes]]=[]
+        pos=0
+        for block in iterScriptBlocks(source,encoding):
+            if not _isScriptToFix(block.attributes):
+                continue
+            fixTag=not _hasScriptTypeAttributes(block.attributes)
+            selfClosed=block.codeStart==block.tagEnd
+            fixCode=not selfClosed and not _isCdataWrapped(block.code)
+            if not fixTag and not fixCode:
+                continue
+            if fixes is not None:
+                fixes.append(block)
+            if fixTag:
+                tag=source[block.tagStart:block.codeStart]
+                if not isStr:
+                    tag=tag.decode(encoding)
+                tag=_fixScriptStartTag(tag)
+                chunks.append(source[pos:block.tagStart])
+                chunks.append(tag if isStr else tag.encode(encoding))
+                pos=block.codeStart
+            if fixCode:
+                code=_cdataWrap(block.code)
+                chunks.append(source[pos:block.codeStart])
+                chunks.append(code if isStr else code.encode(encoding))
+                pos=block.codeEnd
+        if not chunks:
+            return source
+        chunks.append(source[pos:])
+        if isStr:
+            return ''.join(chunks)
+        return b''.join(chunks)
 
     def GetFunctionsFromCodeString(self,code:str)->typing.Dict[str,str]:
         """
         Given a string representing javascript code, returns a functions dict
+
+        Only includes functions (and classes) that are not nested inside
+        other functions, and are not object or class members.
         """
         fns:typing.Dict[str,str]={}
-        for line in code.split('\n'):
-            line=line.strip()
-            if line[0:8]=='function':
-                fnName=line[8:].split('(',1)[0].strip()
-                fnCode=''
-                # TODO: start braket counting until end of function then set fnCode
-                #   after that do something like fns[fnName]=fnCode
-                fns[fnName]=fnCode
+        for fn in findFunctions(code):
+            if fn.depth==0 and not fn.member:
+                fns[fn.name]=fn.code
         return fns
 
-    def _SetAllFns(self,dom:DomElementType,fnDict:typing.Dict[str,str])->None:
+    def GetFunctionInfosFromCodeString(self,
+        code:typing.Union[str,bytes]
+        )->typing.List[JsFunction]:
         """
-        Sets all functions in the dom's javascript.
+        Given javascript code, returns every named function in it
+        (including nested ones) along with where it is in the code.
 
-        TODO: preserve global vars!
+        If code is bytes, the offsets are byte offsets.
+        """
+        return findFunctions(code)
+
+    def _GetHead(self,dom:DomElementType)->DomElementType:
+        """
+        Get the <head> tag, creating it if necessary
         """
         domDocument=dom.ownerDocument
         if domDocument is None:
@@ -99,22 +330,40 @@ class JsHelper:
         head=dom.getElementsByTagName('head')
         if head is None or len(head)<1:
             head=domDocument.createElement('head')
-            dom.getElementsByTagName('html')[0].appendChild(head)
+            if getattr(dom,'tagName','').lower()=='html':
+                htmlTag=dom
+            else:
+                htmlTag=dom.getElementsByTagName('html')[0]
+            htmlTag.insertBefore(head,htmlTag.firstChild)
         else:
             head=head[0]
+        return head
+
+    def _CreateScriptTag(self,head:DomElementType)->DomElementType:
+        """
+        Add a new javascript tag to the <head>
+        """
+        scriptTag=head.ownerDocument.createElement('script')
+        scriptTag.setAttribute('language','JavaScript')
+        scriptTag.setAttribute('type','text/javascript')
+        head.appendChild(scriptTag)
+        return scriptTag
+
+    def _SetAllFns(self,dom:DomElementType,fnDict:typing.Dict[str,str])->None:
+        """
+        Sets all functions in the dom's javascript.
+
+        TODO: preserve global vars!
+        """
+        domDocument=dom.ownerDocument
+        head=self._GetHead(dom)
         first=True
         scriptTags=head.getElementsByTagName('script')
         if scriptTags is None or len(scriptTags)<1:
-            scriptTag=domDocument.createElement('script')
-            scriptTag.setAttribute('language','JavaScript')
-            scriptTag.setAttribute('type','text/javascript')
-            head.appendChild(scriptTag)
-            scriptTags=[scriptTag]
+            scriptTags=[self._CreateScriptTag(head)]
         for scriptTag in scriptTags:
             if first:
-                codeString=''
-                for v in fnDict.values():
-                    codeString='\n'+v+'\n'
+                codeString=''.join(['\n'+v+'\n' for v in fnDict.values()])
                 while scriptTag.childNodes.length>0:
                     scriptTag.removeChild(scriptTag.childNodes[0])
                 scriptTag.appendChild(domDocument.createTextNode(codeString))
@@ -122,16 +371,137 @@ class JsHelper:
             else:
                 head.removeChild(scriptTag)
 
-    def CreateMissingFunctions(self,dom:DomElementType,fnDict:typing.Dict[str,str])->None:
+    def _AddFns(self,
+        dom:DomElementType,
+        fnDict:typing.Dict[str,str],
+        scriptTag:typing.Optional[DomElementType]=None
+        )->None:
+        """
+        Adds functions to the end of a single script tag,
+        leaving all other tags (and everything else in that one) alone.
+
+        :param scriptTag: the tag to add to.  If None, uses the first
+            inline javascript tag in the <head>, creating one if necessary.
+        """
+        if not fnDict:
+            return
+        if scriptTag is None:
+            head=self._GetHead(dom)
+            for tag in head.getElementsByTagName('script'):
+                # (browsers ignore the contents of <script src=...>)
+                if self._IsJavascriptTag(tag) and not tag.hasAttribute('src'):
+                    scriptTag=tag
+                    break
+            else:
+                scriptTag=self._CreateScriptTag(head)
+        codeString=''.join(['\n'+v+'\n' for v in fnDict.values()])
+        cdataSections=[node for node in scriptTag.childNodes
+            if node.nodeType==node.CDATA_SECTION_NODE]
+        if not cdataSections:
+            scriptTag.appendChild(scriptTag.ownerDocument.createTextNode(codeString))
+            return
+        # keep it inside the (last) CDATA section, before its closing "//"
+        cdata=cdataSections[-1]
+        data=cdata.data.rstrip()
+        if data.endswith('//'):
+            cdata.data=data[:-2]+codeString+'//'
+        else:
+            cdata.data=cdata.data+codeString
+
+    def CreateMissingFunctions(self,
+        dom:DomElementType,
+        fnDict:typing.Dict[str,str],
+        incremental:bool=False,
+        scriptTag:typing.Optional[DomElementType]=None
+        )->None:
         """
         Adds all missing functions in the {fnName:fnCode} dictionary to the given dom document.
 
         Will create html parent tags as required.
 
-        IMPORTANT:  WILL CURRENTLY CLOBBER ALL EXISTING HEAD JAVASCRIPT!
+        :param incremental: only append the missing functions to one script
+            tag and leave all the rest of the head javascript alone
+        :param scriptTag: (incremental only) the script tag to add to,
+            if None, uses the first javascript tag in the <head>
+
+        IMPORTANT:  UNLESS INCREMENTAL, WILL CLOBBER ALL EXISTING HEAD JAVASCRIPT!
         """
         fns=self.GetFunctions(dom)
+        if incremental:
+            missing={k:v for k,v in fnDict.items() if k not in fns}
+            self._AddFns(dom,missing,scriptTag)
+            return
         for k,v in list(fnDict.items()):
             if k not in fns:
                 fns[k]=v
         self._SetAllFns(dom,fns)
+
+    # ---- the same sorts of things, but working directly on html text
+
+    def GetFunctionsFromHtml(self,
+        source:HtmlSource,
+        encoding:str='utf-8'
+        )->typing.Dict[str,str]:
+        """
+        Same as GetFunctions() but streams through raw html
+        (str, bytes, file-like object, or os.PathLike file path)
+        instead of needing a dom.
+        """
+        fns:typing.Dict[str,str]={}
+        for block in iterScriptBlocks(source,encoding):
+            if not block.inHead or not block.isJavascript:
+                continue
+            for k,v in self.functionCache.get(block.code,self.GetFunctionsFromCodeString).items():
+                fns[k]=v
+        return fns
+
+    def CreateMissingFunctionsInHtml(self,
+        source:HtmlSource,
+        fnDict:typing.Dict[str,str],
+        encoding:str='utf-8'
+        )->typing.Union[str,bytes]:
+        """
+        Same as CreateMissingFunctions() but works on raw html
+        (str, bytes, file-like object, or os.PathLike file path)
+        and returns the new html (bytes unless given a str).
+
+        Missing functions are added to the end of the first inline
+        javascript block in the <head> (inside its CDATA section, if it
+        has one), creating one if necessary.  Everything else in the
+        document is left exactly as it was.
+        """
+        source=readHtml(source)
+        landmarks=HtmlLandmarks()
+        fns:typing.Dict[str,str]={}
+        firstBlock:typing.Optional[ScriptBlock]=None
+        for block in iterScriptBlocks(source,encoding,landmarks=landmarks):
+            if not block.inHead or not block.isJavascript:
+                continue
+            if firstBlock is None and 'src' not in block.attributes:
+                # (browsers ignore the contents of <script src=...>)
+                firstBlock=block
+            fns.update(self.functionCache.get(block.code,self.GetFunctionsFromCodeString))
+        missing=[v for k,v in fnDict.items() if k not in fns]
+        if not missing:
+            return source
+        code=''.join(['\n'+v+'\n' for v in missing])
+        if firstBlock is not None:
+            pos=firstBlock.codeEnd
+            insert=code
+            trailerStart=firstBlock.code.rfind('//]]>')
+            if trailerStart>=0 and not firstBlock.code[trailerStart+5:].strip():
+                # keep it inside the CDATA section
+                trailer=firstBlock.code[trailerStart:]
+                pos-=len(trailer) if isinstance(source,str) else len(trailer.encode(encoding))
+        else:
+            insert='<script language="JavaScript" type="text/javascript">'+code+'</script>'
+            if landmarks.headEndTagStart>=0:
+                pos=landmarks.headEndTagStart
+            elif landmarks.headTagEnd>=0:
+                pos=landmarks.headTagEnd
+            else:
+                insert='<head>'+insert+'</head>'
+                pos=max(0,landmarks.htmlTagEnd)
+        if isinstance(source,str):
+            return source[:pos]+insert+source[pos:]
+        return source[:pos]+insert.encode(encoding)+source[pos:]
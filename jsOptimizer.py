@@ -0,0 +1,347 @@
+"""
+Optimization passes over generated javascript
+"""
+import typing
+import re
+from .javascript import Javascript
+from .jsTokenizer import (
+    iterTokens,WHITESPACE,COMMENT,NUMBER,NAME,PUNCTUATION,TEMPLATE,REGEX)
+
+
+# Matches either a quoted string (so that we can skip over it) or one of
+# the lookups generated by JavascriptGenerator._element()/_window()
+_QUOTED=r"""'(?:[^'\\\n]|\\.)*'"""
+LOOKUP_REGEX=re.compile(
+    r"""(?P<string>'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|`(?:[^`\\]|\\.)*`)"""
+    r"""|(?P<lookup>document\.getElementById\((?P<elementId>"""+_QUOTED+r""")\)"""
+    r"""|py_windows\[(?P<windowName>"""+_QUOTED+r""")\])"""
+    r"""(?P<assign>\s*=(?!=))?""",
+    re.DOTALL)
+
+
+def countLookups(js:typing.Union[str,typing.Iterable[str]])->int:
+    """
+    Count how many element/window lookups the javascript does
+    (not counting anything inside of string literals)
+    """
+    if isinstance(js,str):
+        js=(js,)
+    count=0
+    for fragment in js:
+        for match in LOOKUP_REGEX.finditer(str(fragment)):
+            if match.group('lookup') is not None:
+                count+=1
+    return count
+
+
+def hoistLookups(
+    fragments:typing.Iterable[typing.Union[str,Javascript]],
+    minUses:int=2,
+    elementPrefix:str='_e',
+    windowPrefix:str='_w'
+    )->Javascript:
+    """
+    Combine a sequence of generated javascript fragments into one block,
+    looking up each repeatedly-used element (document.getElementById(...))
+    or python window (py_windows[...]) only once, into a block-scoped const.
+
+    Each const is declared right before the fragment that first uses it,
+    so elements created by earlier fragments are still found.
+    Assigning to a window (eg createWindow) is left alone and starts
+    over with a new lookup for the uses after it.
+
+    NOTE: if a fragment replaces an element (eg by setting the innerHTML
+    of its parent) later uses will still refer to the old element.
+
+    :param minUses: how many times something has to be used to be hoisted
+    """
+    fragments=[str(fragment) for fragment in fragments]
+    # {(kind,literal,generation):[(fragmentIndex,start,end),...]}
+    uses:typing.Dict[typing.Tuple[str,str,int],typing.List[typing.Tuple[int,int,int]]]={}
+    generations:typing.Dict[typing.Tuple[str,str],typing.Tuple[int,int]]={}
+    for i,fragment in enumerate(fragments):
+        for match in LOOKUP_REGEX.finditer(fragment):
+            if match.group('lookup') is None:
+                continue
+            if match.group('elementId') is not None:
+                key=('e',match.group('elementId'))
+            else:
+                key=('w',match.group('windowName'))
+            generation,assignedIn=generations.get(key,(0,-1))
+            if match.group('assign') is not None:
+                generations[key]=(generation+1,i)
+                continue
+            if assignedIn==i:
+                # used in the same fragment it was assigned in
+                continue
+            uses.setdefault((key[0],key[1],generation),[]).append(
+                (i,match.start('lookup'),match.end('lookup')))
+    # decide what gets hoisted
+    declarations:typing.Dict[int,typing.List[str]]={}
+    replacements:typing.Dict[int,typing.List[typing.Tuple[int,int,str]]]={}
+    counts={'e':0,'w':0}
+    for (kind,literal,_),locations in uses.items():
+        if len(locations)<minUses:
+            continue
+        if kind=='e':
+            name=f'{elementPrefix}{counts[kind]}'
+            lookup=f'document.getElementById({literal})'
+        else:
+            name=f'{windowPrefix}{counts[kind]}'
+            lookup=f'py_windows[{literal}]'
+        counts[kind]+=1
+        declarations.setdefault(locations[0][0],[]).append(f'const {name}={lookup};')
+        for i,start,end in locations:
+            replacements.setdefault(i,[]).append((start,end,name))
+    # put it all together
+    ret=['{']
+    for i,fragment in enumerate(fragments):
+        ret.extend(declarations.get(i,()))
+        if i in replacements:
+            chunks=[]
+            pos=0
+            for start,end,name in sorted(replacements[i]):
+                chunks.append(fragment[pos:start])
+                chunks.append(name)
+                pos=end
+            chunks.append(fragment[pos:])
+            fragment=''.join(chunks)
+        ret.append(fragment)
+    ret.append('}')
+    return Javascript('\n'.join(ret))
+
+
+# ---- minification
+
+JS_RESERVED_WORDS=frozenset((
+    'abstract','arguments','await','boolean','break','byte','case','catch',
+    'char','class','const','continue','debugger','default','delete','do',
+    'double','else','enum','eval','export','extends','false','final',
+    'finally','float','for','function','goto','if','implements','import',
+    'in','instanceof','int','interface','let','long','native','new','null',
+    'package','private','protected','public','return','short','static',
+    'super','switch','synchronized','this','throw','throws','transient',
+    'true','try','typeof','var','void','volatile','while','with','yield',
+    'undefined','NaN','Infinity','of','async','get','set'))
+
+# a newline can be dropped after these without changing the meaning
+# (ie, automatic semicolon insertion can't happen there)
+_NEWLINE_SAFE_AFTER=frozenset(('{','(','[',';',',','=',':','?','.','?.',
+    '==','===','!=','!==','<','>','<=','>=','+','-','*','/','%','**',
+    '&','|','^','!','~','&&','||','??','+=','-=','*=','/=','%=','**=',
+    '&=','|=','^=','<<','>>','>>>','<<=','>>=','>>>=','&&=','||=','??=','=>'))
+# ... or before these
+_NEWLINE_SAFE_BEFORE=frozenset((';',')',']','}',',','.','?.',':','?',
+    '=','==','===','!=','!==','&&','||','??'))
+
+# (kind,text,newlineBefore)
+_MinifyToken=typing.Tuple[str,str,bool]
+
+
+# tokens that need a space between them when they are next to each other
+# (regex is included because its flags would run into a following name)
+_WORD_KINDS=frozenset((NAME,NUMBER,REGEX))
+
+# anything that looks like a name (the same as the tokenizer's), to find
+# what the ${} substitutions in a template literal might refer to
+_NAME_REGEX=re.compile(r'(?:[^\W\d]|\$)[\w$]*')
+
+
+def _shortNames()->typing.Iterator[str]:
+    """
+    Generate a, b, ... z, A, ... Z, aa, ab, ...
+    """
+    letters='abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    size=1
+    while True:
+        indices=[0]*size
+        while True:
+            yield ''.join([letters[i] for i in indices])
+            pos=size-1
+            while pos>=0:
+                indices[pos]+=1
+                if indices[pos]<len(letters):
+                    break
+                indices[pos]=0
+                pos-=1
+            if pos<0:
+                break
+        size+=1
+
+
+def _shortenLocals(tokens:typing.List[_MinifyToken])->typing.List[_MinifyToken]:
+    """
+    Rename let/const variables declared inside of a {} block
+    to the shortest names that are not already used in that block.
+
+    Only done where it is clearly safe.  The whole block is skipped if
+    it contains eval or with, and a variable is skipped if it could be
+    a shorthand object property/method or appears in a template literal.
+    Every name-like word in a template literal also counts as used, so
+    no variable is renamed to something a ${} substitution refers to.
+    """
+    texts=[text for _,text,_ in tokens]
+    kinds=[kind for kind,_,_ in tokens]
+    n=len(tokens)
+    # match up brackets
+    closer:typing.Dict[int,int]={}
+    enclosing:typing.List[int]=[-1]*n # innermost open bracket of each token
+    enclosingBrace:typing.List[int]=[-1]*n # innermost open { of each token
+    stack:typing.List[int]=[]
+    braceStack:typing.List[int]=[]
+    for i in range(n):
+        if stack:
+            enclosing[i]=stack[-1]
+        if braceStack:
+            enclosingBrace[i]=braceStack[-1]
+        if kinds[i]!=PUNCTUATION:
+            continue
+        text=texts[i]
+        if text in '([{':
+            stack.append(i)
+            if text=='{':
+                braceStack.append(i)
+        elif text in ')]}' and stack:
+            opener=stack.pop()
+            closer[opener]=i
+            if text=='}' and braceStack and braceStack[-1]==opener:
+                braceStack.pop()
+    # find the declarations and their scopes
+    scopes:typing.Dict[typing.Tuple[int,int],typing.List[str]]={}
+    for i in range(n-1):
+        if kinds[i]!=NAME or texts[i] not in ('let','const') or kinds[i+1]!=NAME:
+            continue
+        if i>0 and texts[i-1] in ('.','?.'):
+            continue
+        if i>1 and texts[i-1]=='(' and texts[i-2]=='for':
+            headEnd=closer.get(i-1)
+            if headEnd is None or headEnd+1>=n or texts[headEnd+1]!='{':
+                continue
+            scopeEnd=closer.get(headEnd+1)
+            scope=(i-2,scopeEnd)
+        else:
+            opener=enclosingBrace[i]
+            if opener<0 or enclosing[i]!=opener:
+                continue
+            scope=(opener,closer.get(opener))
+        if scope[1] is None:
+            continue
+        names=scopes.setdefault(scope,[]) # type: ignore
+        # collect the declared names
+        j=i+1
+        while j<n and kinds[j]==NAME:
+            names.append(texts[j])
+            j+=1
+            depth=0
+            while j<n:
+                text=texts[j]
+                if kinds[j]==PUNCTUATION:
+                    if text in '([{':
+                        depth+=1
+                    elif text in ')]}':
+                        depth-=1
+                        if depth<0:
+                            break
+                    elif depth==0 and text in (';',','):
+                        break
+                elif depth==0 and (texts[j] in ('in','of') or tokens[j][2]):
+                    break
+                j+=1
+            if j>=n or texts[j]!=',':
+                break
+            j+=1
+    # rename, outermost scopes first
+    for (start,end),names in sorted(scopes.items(),key=lambda item:item[0][0]-item[0][1]):
+        declared=set(names)
+        used:typing.Set[str]=set()
+        templates=[]
+        occurrences:typing.Dict[str,typing.List[int]]={}
+        for k in range(start,end):
+            if kinds[k]==NAME:
+                text=texts[k]
+                used.add(text)
+                if text in declared:
+                    occurrences.setdefault(text,[]).append(k)
+            elif kinds[k]==TEMPLATE:
+                templates.append(texts[k])
+                used.update(_NAME_REGEX.findall(texts[k]))
+        if 'eval' in used or 'with' in used:
+            continue
+        newNames=_shortNames()
+        for name in names:
+            if any(name in template for template in templates):
+                continue
+            locations=[]
+            for k in occurrences.get(name,()):
+                if texts[k]!=name:
+                    continue # already renamed
+                previous=texts[k-1] if k>0 else ''
+                following=texts[k+1] if k+1<n else ''
+                if previous in ('.','?.'):
+                    continue # a property
+                if following==':' and previous in ('{',','):
+                    continue # an object key (or a label)
+                if previous in ('{',',') and following in (',','}','(') \
+                    and enclosingBrace[k]==enclosing[k]>=0:
+                    locations=[]
+                    break # might be a shorthand object property or method
+                if previous in ('get','set','static','async') and following=='(':
+                    locations=[]
+                    break
+                locations.append(k)
+            if not locations:
+                continue
+            newName=next(candidate for candidate in newNames
+                if candidate not in used and candidate not in JS_RESERVED_WORDS)
+            if len(newName)>=len(name):
+                continue
+            used.add(newName)
+            for k in locations:
+                texts[k]=newName
+    return [(kind,text,token[2]) for kind,text,token in zip(kinds,texts,tokens)]
+
+
+def minify(js:typing.Union[str,Javascript],shortenNames:bool=True)->Javascript:
+    """
+    Make javascript smaller by removing comments and unnecessary
+    whitespace, and (optionally) giving block-scoped locals short names.
+
+    Works on tokens, so strings, template literals and regexes are
+    never touched.  Newlines are kept wherever removing them could
+    change how automatic semicolon insertion works.
+
+    :param shortenNames: rename let/const variables declared in blocks
+    """
+    code=str(js)
+    tokens:typing.List[_MinifyToken]=[]
+    newline=False
+    for kind,start,end in iterTokens(code):
+        if kind==WHITESPACE or kind==COMMENT:
+            if not newline and (code.find('\n',start,end)>=0 or code.startswith('//',start)):
+                newline=True
+            continue
+        tokens.append((kind,code[start:end],newline))
+        newline=False
+    if shortenNames:
+        tokens=_shortenLocals(tokens)
+    ret=[]
+    previousKind=''
+    previous=''
+    for kind,text,newlineBefore in tokens:
+        if previous:
+            if newlineBefore \
+                and not (previousKind==PUNCTUATION and previous in _NEWLINE_SAFE_AFTER) \
+                and not (kind==PUNCTUATION and text in _NEWLINE_SAFE_BEFORE):
+                ret.append('\n')
+            elif previousKind in _WORD_KINDS:
+                if kind in _WORD_KINDS or (previousKind==NUMBER and text[0]=='.'):
+                    ret.append(' ')
+            elif previousKind==PUNCTUATION and kind!=NAME:
+                a=previous[-1]
+                b=text[0]
+                if (a==b and a in '+-') or (a=='/' and b in '/*') or (a=='<' and b=='!'):
+                    ret.append(' ')
+        ret.append(text)
+        previousKind=kind
+        previous=text
+    return Javascript(''.join(ret))
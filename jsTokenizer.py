@@ -0,0 +1,490 @@
+"""
+A small single-pass javascript tokenizer.
+
+It knows enough about javascript to correctly skip over strings,
+template literals (including nested ${} expressions), comments and
+regex literals, which is what you need to safely do things like
+count braces or minify code.  It does not try to parse anything.
+"""
+import typing
+import re
+
+
+# token kinds
+WHITESPACE='whitespace'
+COMMENT='comment'
+STRING='string'
+TEMPLATE='template'
+REGEX='regex'
+NAME='name'
+NUMBER='number'
+PUNCTUATION='punctuation'
+
+# (kind,start,end) where start and end are offsets into the code
+Token=typing.Tuple[str,int,int]
+
+# names after which a / starts a regex rather than being division
+REGEX_AFTER_NAMES=frozenset((
+    'return','typeof','instanceof','in','of','new','delete','void',
+    'throw','case','do','else','yield','await'))
+
+# punctuation after which a / is division rather than a regex
+DIVISION_AFTER_PUNCTUATION=frozenset((')',']','++','--'))
+
+TOKEN_REGEX=re.compile(r"""
+     (?P<whitespace>\s+)
+    |(?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    |(?P<string>'(?:[^'\\\n]|\\.)*'?|"(?:[^"\\\n]|\\.)*"?)
+    |(?P<name>(?:[^\W\d]|\$)[\w$]*)
+    |(?P<number>0[xXbBoO][\da-fA-F_]+n?|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?n?)
+    |(?P<punctuation>>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|\?\?=|&&=|\|\|=
+        |=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.|\+\+|--|\+=|-=|\*=|/=|%=|&=|\|=|\^=|\*\*|<<|>>
+        |[{}()\[\];,<>+\-*/%&|^!~?:=.@\#\\])
+    """,re.VERBOSE|re.DOTALL)
+REGEX_LITERAL_REGEX=re.compile(
+    r"""/(?![*/])(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[\w$]*""")
+TEMPLATE_TEXT_REGEX=re.compile(r"""(?:[^`\\$]|\\.|\$(?!\{))*""",re.DOTALL)
+
+
+def _regexAllowed(code:str,previous:typing.Optional[Token])->bool:
+    """
+    Decide whether a / after the previous significant token
+    would start a regex literal
+    """
+    if previous is None:
+        return True
+    kind,start,end=previous
+    if kind==PUNCTUATION:
+        return code[start:end] not in DIVISION_AFTER_PUNCTUATION
+    if kind==NAME:
+        return code[start:end] in REGEX_AFTER_NAMES
+    return False
+
+
+def _scanTemplate(code:str,pos:int)->int:
+    """
+    Find the end of a template literal
+
+    :param pos: the position of the opening backtick
+    :return: the position just after the closing backtick
+        (or the end of the code if it is never closed)
+    """
+    n=len(code)
+    pos+=1
+    while pos<n:
+        pos=TEMPLATE_TEXT_REGEX.match(code,pos).end()
+        if pos>=n:
+            break
+        if code[pos]=='`':
+            return pos+1
+        # must be the start of a ${} expression
+        depth=0
+        for kind,start,end in iterTokens(code,pos+2):
+            pos=end
+            if kind==PUNCTUATION:
+                c=code[start]
+                if c=='{':
+                    depth+=1
+                elif c=='}':
+                    if depth==0:
+                        break
+                    depth-=1
+    return n
+
+
+def iterTokens(code:str,pos:int=0)->typing.Iterator[Token]:
+    """
+    Go through the code, yielding (kind,start,end) tokens
+
+    Every character of the code belongs to exactly one token
+    (anything unrecognizable comes out as one-character punctuation).
+    """
+    n=len(code)
+    previous:typing.Optional[Token]=None
+    match=TOKEN_REGEX.match
+    while pos<n:
+        c=code[pos]
+        if c=='`':
+            token:Token=(TEMPLATE,pos,_scanTemplate(code,pos))
+        elif c=='/' and _regexAllowed(code,previous) \
+            and (m:=REGEX_LITERAL_REGEX.match(code,pos)) is not None:
+            token=(REGEX,pos,m.end())
+        else:
+            m=match(code,pos)
+            if m is None:
+                token=(PUNCTUATION,pos,pos+1)
+            else:
+                token=(m.lastgroup,pos,m.end()) # type: ignore
+        yield token
+        if token[0]!=WHITESPACE and token[0]!=COMMENT:
+            previous=token
+        pos=token[2]
+
+
+def tokenize(code:str)->typing.List[Token]:
+    """
+    Get all of the (kind,start,end) tokens in the code as a list
+    """
+    return list(iterTokens(code))
+
+
+# ---- finding functions
+
+class JsFunction(typing.NamedTuple):
+    """
+    A function found in some javascript code
+    """
+    name:str
+    start:int # offset of the start of the definition
+    end:int # offset just past the end of the definition
+    code:str # the full source of the definition
+    depth:int # how many functions this is nested inside of
+    member:bool=False # an object literal property or class member, not a standalone function
+
+
+# things findFunctions() needs to stop at, everything else is skipped over
+_FUNCTION_SCAN_REGEX=re.compile(r"""
+     (?P<string>'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")
+    |(?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    |(?P<template>`)
+    |(?P<slash>/)
+    |(?P<arrow>=>)
+    |(?P<bracket>[{}()\[\]])
+    """,re.VERBOSE|re.DOTALL)
+_NOT_METHOD_NAMES=frozenset((
+    'if','for','while','switch','catch','with','return','typeof','function',
+    'do','else','new','delete','void','throw','in','of','instanceof','await'))
+# words after which a { starts an object literal rather than a block
+_OBJECT_AFTER_NAMES=frozenset((
+    'return','typeof','yield','await','void','delete','in','of','instanceof','case'))
+# punctuation after which a { starts an object literal rather than a block
+_OBJECT_AFTER_CHARS=frozenset('=(,:[?!&|+-*%<>~^')
+_IDENTIFIER_CHARS=frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+
+
+def _previousSignificant(code:str,pos:int)->int:
+    """
+    Position of the last non-whitespace character before pos, or -1
+    """
+    pos-=1
+    while pos>=0 and code[pos] in ' \t\r\n':
+        pos-=1
+    return pos
+
+
+def _wordBefore(code:str,pos:int,extraChars:str='')->typing.Tuple[str,int]:
+    """
+    Get the identifier just before pos (skipping whitespace)
+
+    :param extraChars: other characters to allow in the word (eg '.')
+    :return: (word,startOfWord) where word is '' if there isn't one
+    """
+    end=_previousSignificant(code,pos)+1
+    start=end
+    while start>0 and (code[start-1] in _IDENTIFIER_CHARS or code[start-1] in extraChars):
+        start-=1
+    return code[start:end],start
+
+
+def _assignedName(code:str,pos:int)->typing.Optional[typing.Tuple[str,int]]:
+    """
+    If what is just before pos looks like "name=" or "name:"
+    (optionally with const/let/var and async)
+    return (name,startOfDefinition)
+    """
+    word,wordStart=_wordBefore(code,pos)
+    if word=='async':
+        pos=wordStart
+    operator=_previousSignificant(code,pos)
+    if operator<0:
+        return None
+    c=code[operator]
+    if c=='=':
+        if operator>0 and code[operator-1] in '=!<>':
+            return None
+    elif c!=':':
+        return None
+    name,start=_wordBefore(code,operator,'.')
+    if not name or name[0].isdigit():
+        return None
+    word,wordStart=_wordBefore(code,start)
+    if word in ('const','let','var'):
+        start=wordStart
+    return name,start
+
+
+def _classBefore(code:str,bracePos:int)->typing.Optional[typing.Tuple[str,int]]:
+    """
+    If the { at bracePos starts a class body, figure out its name
+
+    :return: (name,startOfDefinition) where name is '' for an anonymous
+        class, or None if it is not a class body
+    """
+    words=[]
+    pos=bracePos
+    for _ in range(4): # class Name extends Base {
+        word,wordStart=_wordBefore(code,pos,'.')
+        if not word:
+            return None
+        if word=='class':
+            name=words[-1] if words and words[-1]!='extends' else ''
+            if not name:
+                # anonymous, use the name it is assigned to
+                return _assignedName(code,wordStart) or ('',wordStart)
+            return name,wordStart
+        words.append(word)
+        pos=wordStart
+    return None
+
+
+def _isObjectLiteral(code:str,previous:int)->bool:
+    """
+    Whether a { that is not a function or class body starts an object
+    literal (rather than a block), given the position of the last
+    significant character before it
+    """
+    if previous<0:
+        return False
+    c=code[previous]
+    if c in _IDENTIFIER_CHARS:
+        return _wordBefore(code,previous+1)[0] in _OBJECT_AFTER_NAMES
+    return c in _OBJECT_AFTER_CHARS
+
+
+def _expressionEnd(code:str,pos:int)->int:
+    """
+    Find the end of an expression (eg, the body of an arrow function
+    without braces) starting at pos.
+    """
+    depth=0
+    seenSomething=False
+    for kind,start,end in iterTokens(code,pos):
+        if kind==WHITESPACE or kind==COMMENT:
+            if depth==0 and seenSomething and '\n' in code[start:end]:
+                # could be the end, if nothing continues the expression
+                nextPos=end
+                while nextPos<len(code) and code[nextPos] in ' \t\r\n':
+                    nextPos+=1
+                if nextPos>=len(code) or code[nextPos] not in '.?:+-*/%&|^=<>,([':
+                    return start
+            continue
+        if kind==PUNCTUATION:
+            c=code[start]
+            if c in '([{':
+                depth+=1
+            elif c in ')]}':
+                if depth==0:
+                    return start
+                depth-=1
+            elif depth==0 and c in ';,':
+                return start
+        seenSomething=True
+    return len(code)
+
+
+def findFunctions(code:typing.Union[str,bytes])->typing.List[JsFunction]:
+    """
+    Find all the named functions in some javascript code, in one pass.
+
+    Finds:
+        function name(){}           (also async and generator functions)
+        name=function(){}           (also var/let/const, and name:function)
+        name=(a,b)=>{} / name=a=>a+1
+        name(a,b){}                 (object/class methods)
+        class Name{}                (so classes are not lost either)
+
+    Anything defined directly inside an object literal or class body
+    is marked as a member, since it is not a standalone function.
+
+    Strings, template literals, comments and regex literals are skipped.
+
+    If code is bytes, it is assumed to be utf-8 and start/end are byte
+    offsets, otherwise they are character offsets.
+    """
+    isBytes=isinstance(code,(bytes,bytearray))
+    if isBytes:
+        # latin-1 maps bytes 1:1 to characters and utf-8 multi-byte
+        # sequences never contain ascii, so all the syntax stays the same
+        text=bytes(code).decode('latin-1')
+    else:
+        text=str(code)
+    functions:typing.List[typing.Tuple[str,int,int,int,bool]]=[]
+    # each entry is (bracket,kind,function,member) where kind is what a {
+    # starts ('function','class','object' or 'block'), function is
+    # (name,start) or None, and member is whether it is inside an object/class
+    stack:typing.List[typing.Tuple[str,typing.Optional[str],
+        typing.Optional[typing.Tuple[str,int]],bool]]=[]
+    parenStarts:typing.List[int]=[]
+    lastParen=(-1,-1) # (open,close) of the most recently closed ()
+    lastArrow=-1 # position just after the most recent =>
+    functionDepth=0
+    search=_FUNCTION_SCAN_REGEX.search
+    n=len(text)
+    pos=0
+    while True:
+        match=search(text,pos)
+        if match is None:
+            break
+        kind=match.lastgroup
+        start=match.start()
+        pos=match.end()
+        if kind=='bracket':
+            c=text[start]
+            if c=='{':
+                function=None
+                kind='block'
+                previous=_previousSignificant(text,start)
+                if previous>=0 and previous==lastParen[1]:
+                    function=_functionBeforeParens(text,lastParen[0])
+                    if function is not None:
+                        kind='function'
+                elif previous>=0 and previous==lastArrow-1:
+                    function=_arrowFunction(text,lastArrow-2)
+                    kind='function'
+                else:
+                    function=_classBefore(text,start)
+                    if function is not None:
+                        kind='class'
+                        if not function[0]:
+                            function=None
+                    elif _isObjectLiteral(text,previous):
+                        kind='object'
+                stack.append((c,kind,function,function is not None and _inMember(stack)))
+                if kind=='function':
+                    functionDepth+=1
+            elif c=='}':
+                if stack and stack[-1][0]=='{':
+                    _,kind,function,member=stack.pop()
+                    if kind=='function':
+                        functionDepth-=1
+                    if function is not None:
+                        functions.append((function[0],function[1],pos,functionDepth,member))
+            elif c=='(':
+                parenStarts.append(start)
+                stack.append((c,None,None,False))
+            elif c==')':
+                if stack and stack[-1][0]=='(':
+                    stack.pop()
+                    lastParen=(parenStarts.pop(),start)
+            elif c=='[':
+                stack.append((c,None,None,False))
+            elif stack and stack[-1][0]=='[':
+                stack.pop()
+        elif kind=='arrow':
+            lastArrow=pos
+            bodyStart=pos
+            while bodyStart<n and text[bodyStart] in ' \t\r\n':
+                bodyStart+=1
+            if bodyStart<n and text[bodyStart]!='{':
+                function=_arrowFunction(text,start)
+                if function is not None:
+                    end=_expressionEnd(text,bodyStart)
+                    functions.append((function[0],function[1],end,functionDepth,_inMember(stack)))
+        elif kind=='template':
+            pos=_scanTemplate(text,start)
+        elif kind=='slash':
+            previous=_previousSignificant(text,start)
+            if previous<0:
+                regexAllowed=True
+            else:
+                c=text[previous]
+                if c in ')]':
+                    regexAllowed=False
+                elif c in _IDENTIFIER_CHARS:
+                    regexAllowed=_wordBefore(text,previous+1)[0] in REGEX_AFTER_NAMES
+                else:
+                    regexAllowed=True
+            if regexAllowed:
+                regex=REGEX_LITERAL_REGEX.match(text,start)
+                if regex is not None:
+                    pos=regex.end()
+    functions.sort(key=lambda f:f[1])
+    ret=[]
+    for name,start,end,depth,member in functions:
+        source=text[start:end]
+        if isBytes:
+            source=source.encode('latin-1').decode('utf-8',errors='replace')
+        ret.append(JsFunction(name,start,end,source,depth,member))
+    return ret
+
+
+def _inMember(stack:typing.List[typing.Tuple[str,typing.Optional[str],typing.Any,bool]])->bool:
+    """
+    Whether the innermost {} on the findFunctions() stack is an
+    object literal or class body (ie, what is there is a member)
+    """
+    for bracket,kind,_,_ in reversed(stack):
+        if bracket=='{':
+            return kind in ('object','class')
+    return False
+
+
+def _functionBeforeParens(code:str,parenStart:int)->typing.Optional[typing.Tuple[str,int]]:
+    """
+    Given the ( of a parameter list that is followed by a {
+    figure out what kind of function it is.
+
+    :return: (name,startOfDefinition) or None if it is not a function
+        (or is an anonymous one)
+    """
+    name,start=_wordBefore(code,parenStart)
+    if not name:
+        pos=_previousSignificant(code,parenStart)
+        if pos>=0 and code[pos]=='*':
+            # anonymous generator function
+            word,wordStart=_wordBefore(code,pos)
+            if word=='function':
+                return _assignedName(code,wordStart)
+        # eg "(a,b)=>{" is handled elsewhere, and "({" is not a function
+        return None
+    if name=='function':
+        # anonymous function, use the name it is assigned to
+        return _assignedName(code,start)
+    if name in _NOT_METHOD_NAMES:
+        return None
+    pos=_previousSignificant(code,start)
+    if pos<0 or code[pos]!='*':
+        pos=start
+    # else a generator function, so look before the *
+    word,wordStart=_wordBefore(code,pos)
+    if word!='function':
+        # a method
+        return name,start
+    # function name(){}
+    start=wordStart
+    word,wordStart=_wordBefore(code,start)
+    if word=='async':
+        start=wordStart
+    return name,start
+
+
+def _arrowFunction(code:str,arrowPos:int)->typing.Optional[typing.Tuple[str,int]]:
+    """
+    Given the position of a => figure out the name the arrow function is assigned to
+
+    :return: (name,startOfDefinition) or None
+    """
+    previous=_previousSignificant(code,arrowPos)
+    if previous<0:
+        return None
+    if code[previous]==')':
+        # find the matching (
+        depth=0
+        pos=previous
+        while pos>=0:
+            c=code[pos]
+            if c==')':
+                depth+=1
+            elif c=='(':
+                depth-=1
+                if depth==0:
+                    break
+            pos-=1
+        paramsStart=pos
+    else:
+        param,paramsStart=_wordBefore(code,previous+1)
+        if not param:
+            return None
+    if paramsStart<0:
+        return None
+    return _assignedName(code,paramsStart)
@@ -5,6 +5,10 @@ This class contains utility functions which return Javascript code
 to perform common and powerful tasks.
 """
 import typing
+import sys
+import base64
+import threading
+import collections
 from paths import UrlCompatible,asURL
 from htmlTools import Html
 try:
@@ -13,9 +17,244 @@ try:
 except ImportError:
     Color=str
     hasColorTools=False
+try:
+    import numpy as np
+    hasNumpy=True
+except ImportError:
+    hasNumpy=False
 import javascriptTools
 
 
+def decimatePoints(points:typing.Any,columns:int)->typing.Any:
+    """
+    Reduce an Nx2 numpy array of points sorted by x down to the
+    lowest and highest point in each of the given number of columns
+    (plus the two end points), keeping them in their original order.
+
+    For a line plot that is drawn that many pixels wide, the result
+    looks the same, but its size depends on the width and not
+    on how many points there were.
+    """
+    points=np.asarray(points)
+    if columns<1 or len(points)<=2*columns+2:
+        return points
+    x=points[:,0]
+    xMin=x.min()
+    xRange=x.max()-xMin
+    if xRange<=0:
+        column=np.zeros(len(points),dtype=np.int64)
+    else:
+        column=((x-xMin)*((columns-1)/xRange)).astype(np.int64)
+    # sort by column, then by y within the column
+    order=np.lexsort((points[:,1],column))
+    sortedColumn=column[order]
+    starts=np.flatnonzero(np.r_[True,sortedColumn[1:]!=sortedColumn[:-1]])
+    ends=np.r_[starts[1:],len(order)]-1
+    keep=np.unique(np.concatenate((order[starts],order[ends],[0,len(points)-1])))
+    return points[keep]
+
+
+def _numberListJs(values:typing.Any,precision:int=0)->str:
+    """
+    Format a 1d numpy array of finite numbers as a comma-separated
+    javascript number list (rounded to precision decimal places,
+    without trailing zeros) entirely with array operations,
+    rather than calling str() on every number.
+    """
+    scale=10**max(precision,0)
+    scaled=np.round(np.asarray(values,dtype=np.float64)*scale)
+    count=len(scaled)
+    if not count:
+        return ''
+    if np.abs(scaled).max()>=2**63:
+        # too big for int64 digits, so do it the slow way
+        return ','.join([repr(round(v,precision) if precision>0 else int(v))
+            for v in (scaled/scale).tolist()])
+    negative=scaled<0
+    remaining=np.abs(scaled).astype(np.uint64)
+    # the digits, least significant first, until there are no more
+    # (and at least one for the integer part plus the decimal places)
+    numDecimals=max(precision,0)
+    columns=[]
+    while True:
+        remaining,digit=np.divmod(remaining,np.uint64(10))
+        columns.append(digit.astype(np.uint8))
+        if len(columns)>numDecimals and not remaining.any():
+            break
+    digits=np.stack(columns[::-1],axis=1)
+    numInteger=digits.shape[1]-numDecimals
+    integerPart=digits[:,:numInteger]
+    # drop leading zeros (but not the last integer digit)
+    leading=np.cumsum(integerPart!=0,axis=1)==0
+    leading[:,-1]=False
+    integerPart=np.where(leading,0,integerPart+48).astype(np.uint8)
+    pieces=[np.where(negative,45,0).astype(np.uint8)[:,None],integerPart] # 45 is '-'
+    if numDecimals:
+        fraction=digits[:,numInteger:]
+        # drop trailing zeros, and the point if there is nothing after it
+        trailing=np.cumsum(fraction[:,::-1]!=0,axis=1)[:,::-1]==0
+        pieces.append(np.where(trailing[:,0],0,46).astype(np.uint8)[:,None]) # 46 is '.'
+        pieces.append(np.where(trailing,0,fraction+48).astype(np.uint8))
+    pieces.append(np.full((count,1),44,dtype=np.uint8)) # 44 is ','
+    table=np.concatenate(pieces,axis=1)
+    return table[table!=0].tobytes()[:-1].decode('ascii')
+
+
+# methods whose output depends on more than their arguments
+# (so a JavascriptGenerator never caches them)
+UNCACHEABLE_METHODS=frozenset(('addJavascriptFunction',))
+
+# private helpers that are worth caching too
+CACHED_PRIVATE_METHODS=('_element','_window')
+
+# roughly what each entry costs beyond its key parts and value
+# (the dict slot, ordering links, and the key tuple)
+OUTPUT_CACHE_ENTRY_OVERHEAD=160
+
+
+def _typedKey(value:typing.Any)->typing.Any:
+    """
+    Make a cache key part that keeps eg 1, 1.0 and True apart
+    (they are equal, but toJsString() makes different things of them)
+    """
+    if isinstance(value,tuple):
+        return (tuple,tuple(_typedKey(item) for item in value))
+    return (value.__class__,value)
+
+
+class OutputCache:
+    """
+    Remembers what JavascriptGenerator methods returned for a given set
+    of arguments, so that calling them again with the same arguments
+    does not have to generate the javascript again.
+
+    Bounded by the (approximate) total bytes of memory used, dropping the
+    least recently used entries once there is more than maxBytes.
+    Calls with any unhashable argument are not cached.
+
+    NOTE: arguments are expected to be immutable values.  An object that
+    is hashed by identity and changed afterwards would get stale output.
+
+    Safe to share between threads (and between generators).
+    """
+
+    def __init__(self,maxBytes:int=8*1024*1024):
+        self.maxBytes=maxBytes
+        self._entries:typing.OrderedDict[typing.Any,typing.Tuple[type,str,int]]=\
+            collections.OrderedDict()
+        self._lock=threading.Lock()
+        self.numBytes=0
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.uncacheable=0
+
+    def key(self,
+        name:typing.Hashable,
+        args:typing.Tuple,
+        kwargs:typing.Dict[str,typing.Any]
+        )->typing.Any:
+        """
+        The cache key for a call (not necessarily hashable)
+        """
+        types=tuple(arg.__class__ for arg in args)
+        if tuple in types:
+            args=_typedKey(args)
+        if not kwargs:
+            return (name,args,types)
+        return (name,args,types,tuple(sorted([(k,_typedKey(v)) for k,v in kwargs.items()])))
+
+    @staticmethod
+    def _entrySize(args:typing.Tuple,kwargs:typing.Dict[str,typing.Any],value:str)->int:
+        size=OUTPUT_CACHE_ENTRY_OVERHEAD+sys.getsizeof(value)
+        for arg in args:
+            size+=sys.getsizeof(arg)
+        for k,v in kwargs.items():
+            size+=sys.getsizeof(k)+sys.getsizeof(v)
+        return size
+
+    def call(self,
+        name:typing.Hashable,
+        method:typing.Callable,
+        args:typing.Tuple,
+        kwargs:typing.Dict[str,typing.Any]
+        )->typing.Any:
+        """
+        Get method(*args,**kwargs), from the cache if it is there
+
+        Each hit returns a new object, so appending to what is returned
+        does not change what is cached.
+        """
+        key=self.key(name,args,kwargs)
+        with self._lock:
+            try:
+                entry=self._entries.get(key)
+            except TypeError: # something unhashable in there
+                self.uncacheable+=1
+                entry=key=None
+            else:
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits+=1
+                else:
+                    self.misses+=1
+        if entry is not None:
+            cls=entry[0]
+            return cls.__new__(cls,entry[1])
+        if key is None:
+            return method(*args,**kwargs)
+        result=method(*args,**kwargs)
+        if not isinstance(result,str):
+            return result
+        value=str(result)
+        size=self._entrySize(args,kwargs,value)
+        if size>self.maxBytes:
+            return result
+        with self._lock:
+            old=self._entries.pop(key,None)
+            if old is not None:
+                self.numBytes-=old[2]
+            self._entries[key]=(result.__class__,value,size)
+            self.numBytes+=size
+            while self.numBytes>self.maxBytes:
+                _,(_,_,evictedSize)=self._entries.popitem(last=False)
+                self.numBytes-=evictedSize
+                self.evictions+=1
+        return result
+
+    def clear(self)->None:
+        """
+        Forget everything (and reset the stats)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.numBytes=0
+            self.hits=0
+            self.misses=0
+            self.evictions=0
+            self.uncacheable=0
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    @property
+    def stats(self)->typing.Dict[str,typing.Union[int,float]]:
+        """
+        hits/misses/evictions/uncacheable/entries/bytes/maxBytes/hitRatio
+        """
+        with self._lock:
+            lookups=self.hits+self.misses
+            return {
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'uncacheable':self.uncacheable,
+                'entries':len(self._entries),
+                'bytes':self.numBytes,
+                'maxBytes':self.maxBytes,
+                'hitRatio':self.hits/lookups if lookups else 0.0}
+
+
 class JavascriptGenerator:
     """
     This class contains utility functions which return Javascript code
@@ -25,8 +264,90 @@ class JavascriptGenerator:
     https://developer.mozilla.org/en/Canvas_tutorial%3aApplying_styles_and_colors
     """
 
-    def __init__(self):
-        pass
+    def __init__(self,
+        minify:bool=False,
+        cache:typing.Optional[OutputCache]=None):
+        """
+        :param minify: minify everything this generator returns
+            (see jsOptimizer.minify)
+        :param cache: if specified, remember outputs here so that
+            calls with the same arguments do not generate them again
+            (can be shared by many generators and threads)
+        """
+        self.minify=minify
+        self.cache=cache
+        if minify:
+            self._wrapPublicMethods(self._minifyOutput)
+        if cache is not None:
+            self._wrapPublicMethods(self._cacheOutput,CACHED_PRIVATE_METHODS,UNCACHEABLE_METHODS)
+
+    def _wrapPublicMethods(self,
+        wrapper:typing.Callable[[str,typing.Callable],typing.Callable],
+        include:typing.Iterable[str]=(),
+        exclude:typing.Container[str]=()
+        )->None:
+        """
+        Replace each public method of this instance with wrapper(name,method)
+
+        :param include: private methods to wrap as well
+        :param exclude: public methods not to wrap
+        """
+        for name in dir(self):
+            if name.startswith('_') and name not in include:
+                continue
+            if name in exclude:
+                continue
+            if not callable(getattr(self,name)):
+                continue
+            method=vars(self).get(name) # already wrapped
+            if method is None:
+                method=self._classMethod(name)
+            setattr(self,name,wrapper(name,method))
+
+    def _classMethod(self,name:str)->typing.Callable:
+        """
+        Get a method of this instance that looks it up on the class
+        every time it is called (rather than binding it now) so that it
+        goes along with the class being instrumented or not later
+        """
+        cls=self.__class__
+        def method(*args,**kwargs):
+            return getattr(cls,name)(self,*args,**kwargs)
+        method.__name__=name
+        method.__doc__=getattr(cls,name).__doc__
+        return method
+
+    def _minifyOutput(self,name:str,method:typing.Callable)->typing.Callable:
+        """
+        Wrap a method so that its output is minified
+        """
+        def minified(*args,**kwargs):
+            return javascriptTools.minify(method(*args,**kwargs))
+        minified.__name__=name
+        minified.__doc__=method.__doc__
+        return minified
+
+    def _cacheKey(self)->typing.Hashable:
+        """
+        What the output depends on besides the method and its arguments,
+        so that different generators can share a cache.
+
+        Subclasses with settings of their own that change the output
+        should add them to this.
+        """
+        return (self.__class__,self.minify)
+
+    def _cacheOutput(self,name:str,method:typing.Callable)->typing.Callable:
+        """
+        Wrap a method so that its output is cached
+        """
+        call=self.cache.call # type: ignore
+        cacheKey=self._cacheKey
+        def cached(*args,**kwargs):
+            return call((name,cacheKey()),method,args,kwargs)
+        cached.__name__=name
+        cached.__doc__=method.__doc__
+        return cached
 
     def _element(self,elementId:str
         )->javascriptTools.Javascript:
@@ -50,14 +371,33 @@ class JavascriptGenerator:
             return javascriptTools.Javascript('')
         return javascriptTools.Javascript(f'py_windows[{javascriptTools.toJsString(windowName)}]')
 
-    def addJavascriptFunction(self,fn:str
+    def addJavascriptFunction(self,fn:str,
+        dedup:bool=False,
+        registry:typing.Optional['javascriptTools.JavascriptRegistry']=None
         )->javascriptTools.Javascript:
         """
         Adds the given javascript function code to the list of callable js functions
+
+        :param dedup: guard it with a window.__jsLoaded[contentHash] check
+            so the browser only adds it once
+        :param registry: if specified, return nothing at all if this
+            page/session has already been sent the same function
         """
+        fn=str(fn)
+        if registry is not None and not registry.add(fn):
+            return javascriptTools.Javascript('')
         js=[]
         js.append('var scriptTag=document.getElementsByTagName(\'script\')[0];')
-        js.append(f'scriptTag.innerHTML=scriptTag.innerHTML+{javascriptTools.toJsString(fn)};')
+        # (appending a text node does not re-serialize and re-parse
+        # the whole tag like innerHTML+= does)
+        code=javascriptTools.toJsString(fn)
+        js.append(f'scriptTag.appendChild(document.createTextNode({code}));')
+        if dedup:
+            key=javascriptTools.scriptHash(fn)
+            js.insert(0,
+                "if(!(window.__jsLoaded=window.__jsLoaded||{})"
+                f"['{key}']){{window.__jsLoaded['{key}']=1;")
+            js.append('}')
         return javascriptTools.Javascript('\n'.join(js))
 
     def replaceElementContents(self,elementId:str,newHtml:typing.Union[str,Html]
@@ -65,7 +405,7 @@ class JavascriptGenerator:
         """
         Replace the entire contents within the given element's tag.
         """
-        js=f'{self._element(elementId)}.innerHTML+{javascriptTools.toJsString(newHtml)};'
+        js=f'{self._element(elementId)}.innerHTML={javascriptTools.toJsString(newHtml)};'
         return javascriptTools.Javascript(js)
 
     def appendElementContents(self,elementId:str,newHtml:typing.Union[str,Html]
@@ -117,11 +457,11 @@ class JavascriptGenerator:
         elementId=elementId.replace("'","\\'")
         elementId=elementId.replace("'","\\'")
         js=['{']
-        js.append(f'_element={self._element(elementId)};')
-        js.append('_style=_element.getAttribute(\'style\').split(\';\');')
-        js.append('had1=0;')
-        js.append('for(i=0;i<_style.length;i++) {')
-        js.append('s=_style[i].split(\':\');')
+        js.append(f'let _element={self._element(elementId)};')
+        js.append('let _style=_element.getAttribute(\'style\').split(\';\');')
+        js.append('let had1=0;')
+        js.append('for(let i=0;i<_style.length;i++) {')
+        js.append('let s=_style[i].split(\':\');')
         js.append(f'if(s[0]==\'{styleItemName}\')')
         js.append('{')
         js.append(f'_style[i]=\'{styleItemName}:{styleItemValue}\';')
@@ -199,6 +539,60 @@ class JavascriptGenerator:
         retval.append("ctx.strokePath();")
         return javascriptTools.Javascript('\n'.join(retval))
 
+    def canvasPolyline(self,
+        canvasId:str,
+        points:typing.Any,
+        close:bool=False,
+        fill:bool=False,
+        encoding:str='array',
+        precision:int=0,
+        columns:typing.Optional[int]=None
+        )->javascriptTools.Javascript:
+        """
+        Draw a line through a lot of points efficiently.
+
+        :param points: an Nx2 numpy array (or anything numpy can turn into one)
+        :param encoding: how to send the points to the browser
+            'array' - as a javascript numeric array literal
+            'base64' - as base64-encoded little-endian Float32Array data,
+                which is smaller and faster for big or non-integer data
+        :param precision: decimal places to keep for the 'array' encoding
+        :param columns: if specified, decimate the points to the min/max
+            in that many columns (usually the canvas width in pixels)
+            so that output size does not depend on the number of points.
+            Assumes the points are sorted by x.
+
+        Requires numpy.
+        """
+        if not hasNumpy:
+            raise Exception('canvasPolyline requires numpy')
+        points=np.asarray(points,dtype=np.float64)
+        if points.ndim!=2 or points.shape[1]!=2:
+            raise Exception(f'points must be Nx2, not {points.shape}')
+        if columns is not None:
+            points=decimatePoints(points,columns)
+        retval=[f"var ctx={self.canvasContext(canvasId)};"]
+        if encoding=='base64':
+            data=base64.b64encode(points.astype('<f4').tobytes()).decode('ascii')
+            retval.append(f"var b=atob('{data}'),u=new Uint8Array(b.length);")
+            retval.append("for(var i=0;i<b.length;i++)u[i]=b.charCodeAt(i);")
+            retval.append("var p=new Float32Array(u.buffer);")
+        elif encoding=='array':
+            if not np.isfinite(points).all():
+                raise Exception("points must be finite for the 'array' encoding (try 'base64')")
+            retval.append(f"var p=[{_numberListJs(points.ravel(),precision)}];")
+        else:
+            raise Exception(f'Unknown point encoding "{encoding}"')
+        retval.append("ctx.beginPath();")
+        retval.append("if(p.length>1)ctx.moveTo(p[0],p[1]);")
+        retval.append("for(var i=2;i<p.length;i+=2)ctx.lineTo(p[i],p[i+1]);")
+        if fill or close:
+            retval.append("ctx.closePath();")
+        if fill:
+            retval.append("ctx.fill();")
+        retval.append("ctx.stroke();")
+        return javascriptTools.Javascript('\n'.join(retval))
+
     def canvasArc(self,canvasId:str,
         x:int,y:int,
         radius:float,
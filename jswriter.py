@@ -0,0 +1,83 @@
+"""
+Write generated javascript straight to a file, socket, etc
+rather than building it all up in memory first.
+"""
+import typing
+from .javascript import Javascript
+from .jsgenerator import JavascriptGenerator
+from .utils import jsAddCssRules,jsAddJavascript,jsAddHtml
+
+
+class JavascriptWriter:
+    """
+    Writes generated javascript to a file-like object as it is generated,
+    so the size of a script no longer matters for memory use.
+
+    Any JavascriptGenerator method can be called on this object, as can
+    the jsAddCssRules(), jsAddJavascript() and jsAddHtml() helpers.
+    Instead of returning the javascript, it is written to out.
+
+    Usage:
+        with open('page.js','w',encoding='utf-8') as f:
+            w=JavascriptWriter(f)
+            w.setElementAttribute('myButton','value','Ok')
+            w.jsAddCssRules(cssRules)
+            w.write('doSomethingElse();')
+    """
+
+    # helpers that know how to stream to an out= themselves
+    STREAMING_HELPERS:typing.Dict[str,typing.Callable[...,typing.Optional[Javascript]]]={
+        'jsAddCssRules':jsAddCssRules,
+        'jsAddJavascript':jsAddJavascript,
+        'jsAddHtml':jsAddHtml}
+
+    def __init__(self,
+        out:typing.TextIO,
+        generator:typing.Optional[JavascriptGenerator]=None,
+        separator:str='\n'):
+        """
+        :param out: where to write to (anything with a write(str) method)
+        :param generator: the generator to use (creates one if None)
+        :param separator: written after each generated statement
+        """
+        if generator is None:
+            generator=JavascriptGenerator()
+        self.out=out
+        self.generator=generator
+        self.separator=separator
+
+    def write(self,js:typing.Union[None,str,Javascript])->None:
+        """
+        Write some javascript to the output
+        """
+        if js is None:
+            return
+        self.out.write(str(js))
+        if self.separator:
+            self.out.write(self.separator)
+
+    def flush(self)->None:
+        """
+        Flush the output, if it supports that
+        """
+        flush=getattr(self.out,'flush',None)
+        if flush is not None:
+            flush()
+
+    def __getattr__(self,name:str)->typing.Callable[...,None]:
+        """
+        Wrap generator methods/helpers so they write instead of return
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        helper=self.STREAMING_HELPERS.get(name)
+        if helper is not None:
+            def streamToOutput(*args,**kwargs)->None:
+                helper(*args,out=self.out,**kwargs)
+                if self.separator:
+                    self.out.write(self.separator)
+            return streamToOutput
+        fn=getattr(self.generator,name)
+        def writeToOutput(*args,**kwargs)->None:
+            self.write(fn(*args,**kwargs))
+        return writeToOutput
@@ -0,0 +1,378 @@
+"""
+Keep generated scripts compressed and ready to send, so that sending
+the same script again does no compression work.
+
+Usage:
+    cache=PayloadCache(spillDirectory='/var/tmp')
+    ...
+    status,headers,body=cache.respond(js,
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match'))
+"""
+import typing
+import gzip
+import zlib
+import mmap
+import hashlib
+import tempfile
+import threading
+import collections
+from .javascript import Javascript
+
+
+# the content-codings that are kept precompressed
+PAYLOAD_ENCODINGS=('gzip','deflate')
+
+# roughly what each in-memory entry costs beyond its payloads
+PAYLOAD_ENTRY_OVERHEAD=400
+
+Payloads=typing.Dict[str,bytes]
+
+
+def _compress(data:bytes,contentEncoding:str,level:int)->bytes:
+    """
+    Compress for an http content-coding
+    """
+    if contentEncoding=='gzip':
+        return gzip.compress(data,level,mtime=0) # mtime=0 so it is the same every time
+    if contentEncoding=='deflate':
+        return zlib.compress(data,level) # http "deflate" is really the zlib format
+    raise Exception(f'Unknown content encoding "{contentEncoding}",'
+        f' expected one of {PAYLOAD_ENCODINGS}')
+
+
+def _toBytes(js:typing.Union[str,Javascript],encoding:str)->bytes:
+    """
+    Encode some javascript, using its cached bytes if it has them
+    """
+    if isinstance(js,Javascript):
+        return js.toBytes(encoding)
+    return str(js).encode(encoding)
+
+
+def payloadHash(data:bytes)->str:
+    """
+    The content hash used for cache keys and etags
+    """
+    return hashlib.blake2b(data,digest_size=16).hexdigest()
+
+
+def chooseEncoding(acceptEncoding:typing.Optional[str])->str:
+    """
+    Pick the best of PAYLOAD_ENCODINGS (or 'identity') that an
+    Accept-Encoding header allows, preferring gzip when it is a tie.
+    """
+    if not acceptEncoding:
+        return 'identity'
+    qualities:typing.Dict[str,float]={}
+    for item in acceptEncoding.split(','):
+        name,_,params=item.partition(';')
+        name=name.strip().lower()
+        quality=1.0
+        params=params.strip()
+        if params.lower().startswith('q='):
+            try:
+                quality=float(params[2:])
+            except ValueError:
+                quality=0.0
+        qualities[name]=quality
+    best='identity'
+    bestQuality=0.0
+    for contentEncoding in PAYLOAD_ENCODINGS:
+        quality=qualities.get(contentEncoding,qualities.get('*',0.0))
+        if quality>bestQuality:
+            best=contentEncoding
+            bestQuality=quality
+    return best
+
+
+def _etagMatches(ifNoneMatch:str,contentHash:str)->bool:
+    """
+    Whether an If-None-Match header matches any encoding of some content
+    """
+    for tag in ifNoneMatch.split(','):
+        tag=tag.strip()
+        if tag=='*':
+            return True
+        if tag.startswith('W/'):
+            tag=tag[2:]
+        if tag.strip('"').split('-',1)[0]==contentHash:
+            return True
+    return False
+
+
+class PayloadCache:
+    """
+    Stores the gzip and deflate (zlib) encodings of javascript, keyed by
+    a hash of its content, along with etags derived from that hash.
+
+    Bounded by maxBytes of payloads in memory, the least recently used
+    being dropped past that.  If a spillDirectory is given, dropped
+    payloads go to a (memory-mapped) temporary file there instead, which
+    is started over once it would be bigger than maxSpillBytes.
+
+    The content still has to be hashed to be looked up, but that is far
+    cheaper than compressing it.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self,
+        maxBytes:int=32*1024*1024,
+        spillDirectory:typing.Optional[str]=None,
+        maxSpillBytes:int=256*1024*1024,
+        compressLevel:int=9,
+        encoding:str='utf-8'):
+        """
+        :param maxBytes: how much compressed data to keep in memory
+        :param spillDirectory: where to put payloads that do not fit in memory
+            (None means just drop them)
+        :param maxSpillBytes: how big the spill file can get
+        :param compressLevel: compression level (each payload is compressed
+            once, so it might as well be the best)
+        :param encoding: what to encode the javascript as
+        """
+        self.maxBytes=maxBytes
+        self.maxSpillBytes=maxSpillBytes
+        self.compressLevel=compressLevel
+        self.encoding=encoding
+        self._lock=threading.Lock()
+        self._entries:typing.OrderedDict[str,Payloads]=collections.OrderedDict()
+        self.numBytes=0
+        self._spillFile:typing.Optional[typing.BinaryIO]=None
+        if spillDirectory is not None:
+            self._spillFile=tempfile.TemporaryFile(prefix='payloadCache',dir=spillDirectory)
+        self._spillIndex:typing.Dict[str,typing.Dict[str,typing.Tuple[int,int]]]={}
+        self._spillMap:typing.Optional[mmap.mmap]=None
+        self.spillBytes=0
+        self.hits=0
+        self.spillHits=0
+        self.misses=0
+        self.compressions=0
+        self.evictions=0
+        self.spillResets=0
+
+    @staticmethod
+    def _entrySize(payloads:Payloads)->int:
+        return PAYLOAD_ENTRY_OVERHEAD+sum(len(payload) for payload in payloads.values())
+
+    def _spill(self,contentHash:str,payloads:Payloads)->None:
+        """
+        Move payloads to the spill file (call with the lock held)
+        """
+        spillFile=self._spillFile
+        if spillFile is None:
+            return
+        size=sum(len(payload) for payload in payloads.values())
+        if size>self.maxSpillBytes:
+            return
+        if self.spillBytes+size>self.maxSpillBytes:
+            # start over, rather than keep track of holes
+            if self._spillMap is not None:
+                self._spillMap.close()
+                self._spillMap=None
+            spillFile.truncate(0)
+            self._spillIndex={}
+            self.spillBytes=0
+            self.spillResets+=1
+        spillFile.seek(self.spillBytes)
+        index={}
+        for contentEncoding,payload in payloads.items():
+            spillFile.write(payload)
+            index[contentEncoding]=(self.spillBytes,len(payload))
+            self.spillBytes+=len(payload)
+        spillFile.flush()
+        self._spillIndex[contentHash]=index
+
+    def _readSpilled(self,contentHash:str)->typing.Optional[Payloads]:
+        """
+        Get payloads back from the spill file (call with the lock held)
+        """
+        index=self._spillIndex.get(contentHash)
+        if index is None:
+            return None
+        spillMap=self._spillMap
+        if spillMap is None or len(spillMap)<self.spillBytes:
+            if spillMap is not None:
+                spillMap.close()
+            spillMap=mmap.mmap(
+                self._spillFile.fileno(),self.spillBytes, # type: ignore
+                access=mmap.ACCESS_READ)
+            self._spillMap=spillMap
+        return {
+            contentEncoding:spillMap[offset:offset+length]
+            for contentEncoding,(offset,length) in index.items()}
+
+    def _add(self,contentHash:str,payloads:Payloads)->None:
+        """
+        Keep newly compressed payloads (call with the lock held)
+        """
+        size=self._entrySize(payloads)
+        if size>self.maxBytes:
+            self._spill(contentHash,payloads)
+            return
+        old=self._entries.pop(contentHash,None)
+        if old is not None:
+            self.numBytes-=self._entrySize(old)
+        self._entries[contentHash]=payloads
+        self.numBytes+=size
+        while self.numBytes>self.maxBytes:
+            evictedHash,evicted=self._entries.popitem(last=False)
+            self.numBytes-=self._entrySize(evicted)
+            self.evictions+=1
+            self._spill(evictedHash,evicted)
+
+    def payloads(self,
+        js:typing.Union[str,Javascript]
+        )->typing.Tuple[str,Payloads]:
+        """
+        Get the compressed versions of some javascript,
+        compressing it only if it is not already cached.
+
+        The returned dict is shared, so do not modify it.
+
+        :return: (contentHash,{contentEncoding:payload})
+        """
+        data=_toBytes(js,self.encoding)
+        contentHash=payloadHash(data)
+        with self._lock:
+            payloads=self._entries.get(contentHash)
+            if payloads is not None:
+                self._entries.move_to_end(contentHash)
+                self.hits+=1
+                return contentHash,payloads
+            payloads=self._readSpilled(contentHash)
+            if payloads is not None:
+                self.spillHits+=1
+                return contentHash,payloads
+            self.misses+=1
+        payloads={
+            contentEncoding:_compress(data,contentEncoding,self.compressLevel)
+            for contentEncoding in PAYLOAD_ENCODINGS}
+        with self._lock:
+            self.compressions+=len(payloads)
+            self._add(contentHash,payloads)
+        return contentHash,payloads
+
+    def get(self,
+        js:typing.Union[str,Javascript],
+        contentEncoding:str='gzip'
+        )->bytes:
+        """
+        Get some javascript as bytes in the given content-coding
+        (one of PAYLOAD_ENCODINGS, or 'identity')
+        """
+        if contentEncoding=='identity':
+            return _toBytes(js,self.encoding)
+        if contentEncoding not in PAYLOAD_ENCODINGS:
+            raise Exception(f'Unknown content encoding "{contentEncoding}",'
+                f' expected one of {PAYLOAD_ENCODINGS}')
+        return self.payloads(js)[1][contentEncoding]
+
+    def etag(self,
+        js:typing.Union[str,Javascript],
+        contentEncoding:str='identity'
+        )->str:
+        """
+        A strong etag for some javascript in the given content-coding.
+
+        Only depends on the content, so it is the same across
+        processes and restarts.  (Does not compress anything.)
+        """
+        contentHash=payloadHash(_toBytes(js,self.encoding))
+        if contentEncoding=='identity':
+            return f'"{contentHash}"'
+        return f'"{contentHash}-{contentEncoding}"'
+
+    def respond(self,
+        js:typing.Union[str,Javascript],
+        acceptEncoding:typing.Optional[str]=None,
+        ifNoneMatch:typing.Optional[str]=None,
+        contentType:str='text/javascript; charset=utf-8'
+        )->typing.Tuple[int,typing.Dict[str,str],bytes]:
+        """
+        Everything needed to answer an http request for some javascript
+
+        :param acceptEncoding: the request's Accept-Encoding header
+        :param ifNoneMatch: the request's If-None-Match header
+        :return: (status,headers,body) where status is 304 (with an
+            empty body) if the client already has it, otherwise 200
+        """
+        contentEncoding=chooseEncoding(acceptEncoding)
+        if contentEncoding=='identity':
+            body=_toBytes(js,self.encoding)
+            contentHash=payloadHash(body)
+            etag=f'"{contentHash}"'
+        else:
+            contentHash,payloads=self.payloads(js)
+            body=payloads[contentEncoding]
+            etag=f'"{contentHash}-{contentEncoding}"'
+        headers={'ETag':etag,'Vary':'Accept-Encoding'}
+        if ifNoneMatch and _etagMatches(ifNoneMatch,contentHash):
+            return 304,headers,b''
+        headers['Content-Type']=contentType
+        headers['Content-Length']=str(len(body))
+        if contentEncoding!='identity':
+            headers['Content-Encoding']=contentEncoding
+        return 200,headers,body
+
+    def clear(self)->None:
+        """
+        Forget everything (and reset the stats)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.numBytes=0
+            if self._spillMap is not None:
+                self._spillMap.close()
+                self._spillMap=None
+            if self._spillFile is not None:
+                self._spillFile.truncate(0)
+            self._spillIndex={}
+            self.spillBytes=0
+            self.hits=0
+            self.spillHits=0
+            self.misses=0
+            self.compressions=0
+            self.evictions=0
+            self.spillResets=0
+
+    def close(self)->None:
+        """
+        Let go of everything, including the spill file
+        """
+        self.clear()
+        with self._lock:
+            if self._spillFile is not None:
+                self._spillFile.close()
+                self._spillFile=None
+
+    def __enter__(self)->'PayloadCache':
+        return self
+
+    def __exit__(self,excType,excValue,traceback)->None:
+        self.close()
+
+    def __len__(self)->int:
+        return len(self._entries)+len(self._spillIndex)
+
+    @property
+    def stats(self)->typing.Dict[str,typing.Union[int,float]]:
+        """
+        hits/spillHits/misses/compressions/evictions/spillResets/
+        entries/spilled/bytes/spillBytes/hitRatio
+        """
+        with self._lock:
+            lookups=self.hits+self.spillHits+self.misses
+            return {
+                'hits':self.hits,
+                'spillHits':self.spillHits,
+                'misses':self.misses,
+                'compressions':self.compressions,
+                'evictions':self.evictions,
+                'spillResets':self.spillResets,
+                'entries':len(self._entries),
+                'spilled':len(self._spillIndex),
+                'bytes':self.numBytes,
+                'spillBytes':self.spillBytes,
+                'hitRatio':(self.hits+self.spillHits)/lookups if lookups else 0.0}
@@ -0,0 +1,229 @@
+"""
+Find the <script> tags in html without building a dom.
+
+The html is scanned as a stream, so memory use depends on the size of
+the biggest script block rather than the size of the document.
+"""
+import typing
+import os
+import html.parser
+
+
+# how much of a file to read at a time
+SCAN_CHUNK_SIZE=65536
+
+HtmlSource=typing.Union[str,bytes,bytearray,memoryview,os.PathLike,typing.IO]
+
+# the attributes html.parser hands to handle_starttag()
+TagAttributes=typing.List[typing.Tuple[str,typing.Optional[str]]]
+
+
+class ScriptBlock(typing.NamedTuple):
+    """
+    A <script> tag found in some html
+
+    All of the offsets are into the original html (byte offsets if it
+    was bytes or a file, otherwise character offsets):
+        <script type="text/javascript">code();</script>
+        ^tagStart                      ^codeStart    ^tagEnd
+                                             codeEnd^
+    """
+    attributes:typing.Dict[str,str]
+    code:str
+    inHead:bool
+    tagStart:int
+    codeStart:int
+    codeEnd:int
+    tagEnd:int
+
+    @property
+    def isJavascript(self)->bool:
+        """
+        Whether the tag says it is javascript
+        (the same test that JsHelper.GetFunctions uses)
+        """
+        return self.attributes.get('language','').lower()=='javascript' \
+            or self.attributes.get('type','').lower()=='text/javascript'
+
+
+class HtmlLandmarks:
+    """
+    Offsets of the structural tags in a document, -1 if not found
+    """
+
+    def __init__(self):
+        self.htmlTagEnd=-1 # just after <html ...>
+        self.headTagEnd=-1 # just after <head ...>
+        self.headEndTagStart=-1 # at </head>
+
+
+class _ScriptScanner(html.parser.HTMLParser):
+    """
+    An HTMLParser that only cares about <script> tags and
+    keeps track of where everything is in the original text
+    """
+
+    def __init__(self,
+        encoding:typing.Optional[str]=None,
+        landmarks:typing.Optional[HtmlLandmarks]=None):
+        """
+        :param encoding: if the text being fed is bytes decoded as latin-1
+            this is what it is really encoded as, so that script code
+            and attribute values come out right
+        """
+        html.parser.HTMLParser.__init__(self,convert_charrefs=False)
+        self.encoding=encoding
+        self.landmarks=landmarks if landmarks is not None else HtmlLandmarks()
+        self.blocks:typing.List[ScriptBlock]=[]
+        self._fed=0
+        self._base=0 # absolute offset of self.rawdata[0]
+        self._index=0 # index into self.rawdata of the current event
+        self._inHead=False
+        self._script:typing.Optional[typing.Tuple[typing.Dict[str,str],int,int,bool]]=None
+        self._scriptChunks:typing.List[str]=[]
+
+    def feed(self,data:str)->None:
+        self._base=self._fed-len(self.rawdata)
+        self._fed+=len(data)
+        html.parser.HTMLParser.feed(self,data)
+
+    def close(self)->None:
+        self._base=self._fed-len(self.rawdata)
+        html.parser.HTMLParser.close(self)
+
+    def updatepos(self,i:int,j:int)->int:
+        self._index=j
+        return html.parser.HTMLParser.updatepos(self,i,j)
+
+    def _decode(self,text:str)->str:
+        if self.encoding is None:
+            return text
+        try:
+            return text.encode('latin-1').decode(self.encoding,errors='replace')
+        except UnicodeEncodeError:
+            # has characters that came from an entity, so it's already decoded
+            return text
+
+    def _tagEnd(self)->int:
+        """
+        Absolute offset just after the end of the current start tag
+        """
+        return self._base+self._index+len(self.get_starttag_text() or '')
+
+    def handle_starttag(self,tag:str,attrs:TagAttributes)->None:
+        if tag=='script':
+            attributes={k:self._decode(v or '') for k,v in attrs}
+            self._script=(attributes,self._base+self._index,self._tagEnd(),self._inHead)
+            self._scriptChunks=[]
+        elif tag=='head':
+            self._inHead=True
+            if self.landmarks.headTagEnd<0:
+                self.landmarks.headTagEnd=self._tagEnd()
+        elif tag=='body':
+            self._inHead=False
+        elif tag=='html':
+            if self.landmarks.htmlTagEnd<0:
+                self.landmarks.htmlTagEnd=self._tagEnd()
+
+    def handle_startendtag(self,tag:str,attrs:TagAttributes)->None:
+        if tag=='script':
+            attributes={k:self._decode(v or '') for k,v in attrs}
+            start=self._base+self._index
+            end=self._tagEnd()
+            self.blocks.append(ScriptBlock(attributes,'',self._inHead,start,end,end,end))
+        else:
+            self.handle_starttag(tag,attrs)
+
+    def handle_data(self,data:str)->None:
+        if self._script is not None:
+            self._scriptChunks.append(data)
+
+    def handle_endtag(self,tag:str)->None:
+        if tag=='script' and self._script is not None:
+            attributes,tagStart,codeStart,inHead=self._script
+            codeEnd=self._base+self._index
+            close=self.rawdata.find('>',self._index)
+            tagEnd=self._base+close+1 if close>=0 else codeEnd
+            code=self._decode(''.join(self._scriptChunks))
+            self.blocks.append(ScriptBlock(
+                attributes,code,inHead,tagStart,codeStart,codeEnd,tagEnd))
+            self._script=None
+            self._scriptChunks=[]
+        elif tag=='head':
+            self._inHead=False
+            if self.landmarks.headEndTagStart<0:
+                self.landmarks.headEndTagStart=self._base+self._index
+
+
+def _iterTextChunks(
+    source:HtmlSource,
+    chunkSize:int
+    )->typing.Iterator[typing.Tuple[str,bool]]:
+    """
+    Go through html from any of the supported kinds of source,
+    yielding (text,isLatin1DecodedBytes) chunks
+    """
+    if isinstance(source,str):
+        yield source,False
+    elif isinstance(source,(bytes,bytearray,memoryview)):
+        yield bytes(source).decode('latin-1'),True
+    elif isinstance(source,os.PathLike):
+        with open(source,'rb') as f:
+            yield from _iterTextChunks(f,chunkSize)
+    else:
+        while True:
+            chunk=source.read(chunkSize)
+            if not chunk:
+                break
+            if isinstance(chunk,str):
+                yield chunk,False
+            else:
+                yield chunk.decode('latin-1'),True
+
+
+def readHtml(source:HtmlSource)->typing.Union[str,bytes]:
+    """
+    Read all of the html from any of the supported kinds of source
+
+    :return: str if given a str (or a text file), otherwise bytes
+    """
+    if isinstance(source,os.PathLike):
+        with open(source,'rb') as f:
+            return f.read()
+    if isinstance(source,(str,bytes)):
+        return source
+    if isinstance(source,(bytearray,memoryview)):
+        return bytes(source)
+    return source.read()
+
+
+def iterScriptBlocks(
+    source:HtmlSource,
+    encoding:str='utf-8',
+    chunkSize:typing.Optional[int]=None,
+    landmarks:typing.Optional[HtmlLandmarks]=None
+    )->typing.Iterator[ScriptBlock]:
+    """
+    Stream through html, yielding each <script> tag as it is found.
+
+    :param source: the html as str or bytes, a file-like object,
+        or a file path (as a pathlib.Path or other os.PathLike)
+    :param encoding: what bytes are encoded as
+    :param chunkSize: how much of a file to read at a time
+        (defaults to SCAN_CHUNK_SIZE)
+    :param landmarks: if specified, fill this in with where the
+        <html>, <head> and </head> tags are
+    """
+    if chunkSize is None:
+        chunkSize=SCAN_CHUNK_SIZE
+    scanner:typing.Optional[_ScriptScanner]=None
+    for text,isBytes in _iterTextChunks(source,chunkSize):
+        if scanner is None:
+            scanner=_ScriptScanner(encoding if isBytes else None,landmarks)
+        scanner.feed(text)
+        if scanner.blocks:
+            yield from scanner.blocks
+            scanner.blocks=[]
+    if scanner is not None:
+        scanner.close()
+        yield from scanner.blocks
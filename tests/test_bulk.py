@@ -0,0 +1,46 @@
+"""
+Tests for scanning and fixing a tree of html files
+"""
+import os
+import json
+from javascriptTools import bulk
+
+
+HTML='<html><head><script type="text/javascript">function f(){}</script></head><body></body></html>'
+FIXED='<html><head><script language="JavaScript" type="text/javascript">' \
+    +'//<![CDATA[\nfunction f(){}\n//]]></script></head><body></body></html>'
+
+
+def testProcessFileFixes(tmp_path):
+    filename=tmp_path/'page.html'
+    filename.write_text(HTML,encoding='utf-8')
+    os.chmod(filename,0o640)
+    result=bulk.processFile(str(filename),fix=True)
+    assert filename.read_text(encoding='utf-8')==FIXED
+    assert os.stat(filename).st_mode&0o777==0o640
+    assert os.listdir(tmp_path)==['page.html'] # no temporary files left behind
+    assert result['path']==str(filename)
+    assert result['bytes']==len(HTML)
+    assert result['functions']==['f']
+    assert result['scriptTagsFixed']==1
+    assert result['written'] is True
+    assert 'error' not in result
+    again=bulk.processFile(str(filename),fix=True)
+    assert (again['scriptTagsFixed'],again['written'])==(0,False)
+
+
+def testMainWritesJsonLines(tmp_path):
+    site=tmp_path/'site'
+    (site/'sub').mkdir(parents=True)
+    (site/'a.html').write_text(HTML,encoding='utf-8')
+    (site/'sub'/'b.htm').write_text(FIXED,encoding='utf-8')
+    (site/'notes.txt').write_text(HTML,encoding='utf-8')
+    output=tmp_path/'results.jsonl'
+    status=bulk.main([str(site),'--output',str(output),'--workers','1'])
+    assert status==0
+    results=[json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    assert [os.path.relpath(result['path'],site) for result in results]==[
+        'a.html',os.path.join('sub','b.htm')]
+    assert [result['scriptTagsFixed'] for result in results]==[1,0]
+    assert not any(result['written'] for result in results)
+    assert (site/'a.html').read_text(encoding='utf-8')==HTML
@@ -0,0 +1,24 @@
+"""
+Tests for batching dom updates
+"""
+from javascriptTools.domTransaction import DomTransaction
+
+
+def testBarrierKeepsOrder():
+    transaction=DomTransaction()
+    transaction.setElementContents('a',html='<i id="b"></i>')
+    transaction.setElementAttribute('b','k','1')
+    transaction.barrier()
+    transaction.setElementContents('a',html='<i id="c"></i>')
+    js=str(transaction.commit())
+    assert js.index("'b').setAttribute")<js.index('id="c"')
+
+
+def testUpdatesAreGroupedByElement():
+    transaction=DomTransaction()
+    transaction.setElementAttribute('a','k','1')
+    transaction.setElementAttribute('b','k','2')
+    transaction.setElementAttribute('a','k','3')
+    js=str(transaction.commit())
+    assert "'1'" not in js
+    assert js.index("'3'")<js.index("'2'")
@@ -0,0 +1,15 @@
+"""
+Tests for HtmlPatcher
+"""
+from javascriptTools.htmlPatcher import splitTopLevelNodes
+
+
+def testSplitTopLevelNodes():
+    assert splitTopLevelNodes('a<b>x</b><!--c--><br>d')==['a','<b>x</b>','<!--c-->','<br>','d']
+
+
+def testBlockInsideParagraphIsUnsafe():
+    assert splitTopLevelNodes('<p>a<div>b</div></p>') is None
+    assert splitTopLevelNodes('<p>a<hr/></p>') is None
+    assert splitTopLevelNodes('<p>a<span>b</span></p><div>c</div>')==[
+        '<p>a<span>b</span></p>','<div>c</div>']
@@ -0,0 +1,47 @@
+"""
+Tests that importing the package stays cheap
+"""
+import os
+import sys
+import json
+import subprocess
+
+
+# things "import javascriptTools" must not pull in by itself
+LAZY_DEPENDENCIES=('htmlTools','paths','colorTools','xml.dom.minidom','numpy')
+
+
+def _importedModules(code:str)->list:
+    """
+    Run some code in a fresh interpreter and get what modules it imported
+    """
+    env=dict(os.environ,PYTHONPATH=os.pathsep.join([p for p in sys.path if p]))
+    result=subprocess.run(
+        [sys.executable,'-c',code+'\nimport sys,json\nprint(json.dumps(sorted(sys.modules)))'],
+        capture_output=True,text=True,check=True,env=env)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def _isLazyDependency(name:str)->bool:
+    return any(name==dep or name.startswith(dep+'.') for dep in LAZY_DEPENDENCIES)
+
+
+def testImportIsLazy():
+    modules=_importedModules('import javascriptTools')
+    assert [name for name in modules if _isLazyDependency(name)]==[]
+    assert [name for name in modules if name.startswith('javascriptTools.')]==[
+        'javascriptTools.javascript']
+
+
+def testAttributeImportsOnlyItsSubmodule():
+    modules=_importedModules('import javascriptTools\njavascriptTools.toJsString')
+    assert [name for name in modules if _isLazyDependency(name)]==[]
+    assert [name for name in modules if name.startswith('javascriptTools.')]==[
+        'javascriptTools.javascript','javascriptTools.utils']
+
+
+def testUnknownAttributeImportsNothing():
+    modules=_importedModules(
+        'import javascriptTools\nassert not hasattr(javascriptTools,"toJsStrin")')
+    assert [name for name in modules if name.startswith('javascriptTools.')]==[
+        'javascriptTools.javascript']
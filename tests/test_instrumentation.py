@@ -0,0 +1,27 @@
+"""
+Tests for the opt-in instrumentation
+"""
+from javascriptTools.javascript import Javascript
+from javascriptTools.jsgenerator import JavascriptGenerator
+from javascriptTools.instrumentation import Instrumentation,_outputSize
+
+
+def testOutputSizeIsEncodedBytes():
+    assert _outputSize('abc')==3
+    assert _outputSize('é€')==5
+    assert _outputSize(Javascript('€'))==3
+    assert _outputSize(b'\xff\xfe')==2
+    assert _outputSize(None)==0
+
+
+def testMinifyingGeneratorFollowsInstrumentation():
+    before=JavascriptGenerator(minify=True)
+    with Instrumentation() as inst:
+        during=JavascriptGenerator(minify=True)
+        before.alert('a')
+        during.alert('b')
+        assert inst.snapshot()['JavascriptGenerator.alert']['calls']==2
+    assert str(during.alert('c'))=="alert('c');"
+    before.alert('d')
+    assert inst.snapshot()['JavascriptGenerator.alert']['calls']==2
+    assert not hasattr(JavascriptGenerator.alert,'__wrapped__')
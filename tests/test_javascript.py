@@ -0,0 +1,46 @@
+"""
+Tests for CustomString/Javascript
+"""
+import copy
+from javascriptTools.javascript import Javascript
+
+
+def testRaddWithoutChunks():
+    js=Javascript('y')
+    result='x'+js
+    assert isinstance(result,Javascript)
+    assert str(result)=='xy'
+
+
+def testRaddWithChunks():
+    js=Javascript('y')
+    js.append('z')
+    result='x'+js
+    assert isinstance(result,Javascript)
+    assert str(result)=='xyz'
+
+
+def testAddBothWays():
+    js=Javascript('b')
+    assert str('a'+js+'c')=='abc'
+    assert str(('{let e='+js)+'}')=='{let e=b}'
+
+
+def testCopyHasItsOwnChunks():
+    js=Javascript('a')
+    js.append('b')
+    for duplicate in (copy.copy(js),copy.deepcopy(js)):
+        duplicate.append('c')
+        assert str(duplicate)=='abc'
+    assert str(js)=='ab'
+    js.append('d')
+    assert str(js)=='abd'
+
+
+def testToBytesWritesBomOnce():
+    for encoding in ('utf-16','utf-8-sig'):
+        js=Javascript('a')
+        js.append('b')
+        js.append('c')
+        assert js.toBytes(encoding)=='abc'.encode(encoding)
+        assert b''.join(js.iterBytes(encoding))=='abc'.encode(encoding)
@@ -0,0 +1,23 @@
+"""
+Tests for pushing javascript to subscribers
+"""
+import asyncio
+from javascriptTools import jsChannel
+from javascriptTools.jsChannel import JavascriptChannel
+
+
+def testFramesBuiltOncePerPublish(monkeypatch):
+    calls=[]
+    def countingSseFrame(js,**kwargs):
+        calls.append(js)
+        return jsChannel.sseFrame(js,**kwargs)
+    monkeypatch.setitem(jsChannel.FRAME_FORMATS,'sse',countingSseFrame)
+    async def run():
+        channel=JavascriptChannel()
+        subscribers=[channel.subscribe() for _ in range(5)]
+        await channel.publish('x();')
+        channel.close()
+        return [[frame async for frame in subscriber.frames()] for subscriber in subscribers]
+    frames=asyncio.run(run())
+    assert frames==[[b'event: javascript\ndata: x();\n\n']]*5
+    assert len(calls)==1
@@ -0,0 +1,70 @@
+"""
+Tests for JsHelper
+"""
+import xml.dom.minidom
+from javascriptTools.jsHelper import JsHelper
+
+
+def testFixScriptTagsInHtmlLeavesOtherScriptsAlone():
+    untouched=[
+        '<script type="module">import a from "./a.js";</script>',
+        '<script type="application/ld+json">{"@type":"Thing"}</script>',
+        '<script type="text/template"><b>{{x}}</b></script>',
+        '<script language="vbscript">MsgBox "hi"</script>']
+    html='<html><head>'+''.join(untouched)+'</head></html>'
+    fixes:list=[]
+    assert JsHelper().FixScriptTagsInHtml(html,fixes=fixes)==html
+    assert not fixes
+
+
+def testFixScriptTagsInHtmlFixesClassicJavascript():
+    for tag in ('<script>','<script type="application/javascript">','<script language="JScript">'):
+        fixed=JsHelper().FixScriptTagsInHtml('<html><head>'+tag+'f();</script></head></html>')
+        assert fixed=='<html><head><script language="JavaScript" type="text/javascript">' \
+            +'//<![CDATA[\nf();\n//]]></script></head></html>'
+
+
+def testCreateMissingFunctionsInHtmlSkipsExternalScripts():
+    html='<html><head><script type="text/javascript" src="lib.js"></script></head></html>'
+    created=JsHelper().CreateMissingFunctionsInHtml(html,{'b':'function b(){}'})
+    assert created=='<html><head><script type="text/javascript" src="lib.js"></script>' \
+        +'<script language="JavaScript" type="text/javascript">\nfunction b(){}\n</script>' \
+        +'</head></html>'
+
+
+def testCreateMissingFunctionsInHtmlAddsInsideCdata():
+    helper=JsHelper()
+    html=helper.FixScriptTagsInHtml('<html><head><script>function a(){}</script></head></html>')
+    for source in (html,html.encode('utf-8')):
+        created=helper.CreateMissingFunctionsInHtml(source,{'b':'function b(){}'})
+        if isinstance(created,bytes):
+            created=created.decode('utf-8')
+        assert created=='<html><head><script language="JavaScript" type="text/javascript">' \
+            +'//<![CDATA[\nfunction a(){}\n\nfunction b(){}\n//]]></script></head></html>'
+        assert helper.FixScriptTagsInHtml(created)==created
+        assert sorted(helper.GetFunctionsFromHtml(created))==['a','b']
+
+
+def testCreateMissingFunctionsSkipsExternalScripts():
+    dom=xml.dom.minidom.parseString(
+        '<html><head><script type="text/javascript" src="lib.js"></script>'
+        '<script type="text/javascript">function a(){}</script></head><body/></html>')
+    helper=JsHelper()
+    helper.CreateMissingFunctions(dom.documentElement,{'b':'function b(){}'},incremental=True)
+    external,inline=dom.getElementsByTagName('script')
+    assert not external.childNodes
+    assert helper._GetScriptCode(inline)=='function a(){}\nfunction b(){}\n'
+
+
+def testCreateMissingFunctionsAddsInsideCdata():
+    dom=xml.dom.minidom.parseString(
+        '<html><head><script src="lib.js"></script><script>function a(){}</script>'
+        '</head><body/></html>')
+    helper=JsHelper()
+    helper.FixScriptTags(dom.documentElement)
+    helper.CreateMissingFunctions(dom.documentElement,{'b':'function b(){}'},incremental=True)
+    inline=dom.getElementsByTagName('script')[1]
+    assert [node.nodeType for node in inline.childNodes]==[
+        inline.TEXT_NODE,inline.CDATA_SECTION_NODE]
+    assert inline.childNodes[1].data=='\nfunction a(){}\n\nfunction b(){}\n//'
+    assert sorted(helper.GetFunctions(dom.documentElement))==['a','b']
@@ -0,0 +1,14 @@
+"""
+Tests for the javascript optimization passes
+"""
+from javascriptTools.jsOptimizer import minify
+
+
+def testRenamingAvoidsTemplateSubstitutions():
+    minified=str(minify('{let foo=1;console.log(`${a}`+foo);}'))
+    assert minified=='{let b=1;console.log(`${a}`+b);}'
+
+
+def testRenamingAvoidsNestedTemplateSubstitutions():
+    minified=str(minify('{let foo=1;f(`x${g(`${a+b}`)}`,foo);}'))
+    assert minified=='{let c=1;f(`x${g(`${a+b}`)}`,c);}'
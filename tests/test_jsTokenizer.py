@@ -0,0 +1,17 @@
+"""
+Tests for finding functions in javascript
+"""
+from javascriptTools.jsTokenizer import findFunctions
+
+
+def testGeneratorFunction():
+    functions=findFunctions('function* gen(){yield 1}\nvar g2=function*(){yield 2};')
+    assert [(f.name,f.code) for f in functions]==[
+        ('gen','function* gen(){yield 1}'),
+        ('g2','var g2=function*(){yield 2}')]
+
+
+def testMembersAreMarked():
+    code='obj={init:function(){},run(){return 1}};\nclass K{m(){}}\nfunction f(){}'
+    found={f.name:f.member for f in findFunctions(code)}
+    assert found=={'init':True,'run':True,'K':False,'m':True,'f':False}
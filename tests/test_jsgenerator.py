@@ -0,0 +1,63 @@
+"""
+Tests for JavascriptGenerator
+"""
+import pytest
+from javascriptTools.jsgenerator import _numberListJs,JavascriptGenerator,OutputCache
+
+
+def testNumberListMatchesStr():
+    np=pytest.importorskip('numpy')
+    values=np.random.default_rng(0).normal(0,1000,1000)
+    for precision in (0,1,3):
+        rounded=np.round(values,precision)
+        if precision==0:
+            rounded=rounded.astype(np.int64)
+        expected=[float(v) for v in map(str,rounded.tolist())]
+        assert [float(v) for v in _numberListJs(values,precision).split(',')]==expected
+
+
+def testNumberListFormat():
+    np=pytest.importorskip('numpy')
+    assert _numberListJs(np.array([0.0,-0.04,-1.5,10,100.25]),2)=='0,-0.04,-1.5,10,100.25'
+    assert _numberListJs(np.array([]),0)==''
+
+
+def testOutputCacheHits():
+    cache=OutputCache()
+    jsg=JavascriptGenerator(cache=cache)
+    first=jsg.alert('a')
+    second=jsg.alert('a')
+    assert str(first)==str(second)
+    assert first is not second
+    jsg.alert('b')
+    stats=cache.stats
+    assert (stats['hits'],stats['misses'])==(1,2)
+    assert stats['hitRatio']==pytest.approx(1/3)
+
+
+def testOutputCacheEvictsPastMaxBytes():
+    cache=OutputCache()
+    jsg=JavascriptGenerator(cache=cache)
+    jsg.alert('a'*100)
+    cache.maxBytes=cache.numBytes*2+10 # room for two entries
+    for text in ('b','c','d'):
+        jsg.alert(text*100)
+    assert cache.numBytes<=cache.maxBytes
+    assert len(cache)==2
+    assert cache.stats['evictions']==2
+    jsg.alert('a'*100) # evicted, so generated again
+    assert cache.stats['hits']==0
+
+
+def testOutputCacheSharedByDifferentGenerators():
+    class Shouting(JavascriptGenerator):
+        def alert(self,text):
+            return super().alert(text.upper())
+    cache=OutputCache()
+    plain=JavascriptGenerator(cache=cache).alert('a')
+    shouted=Shouting(cache=cache).alert('a')
+    assert 'A' not in str(plain)
+    assert 'A' in str(shouted)
+    JavascriptGenerator(minify=True,cache=cache).alert('a')
+    assert cache.stats['hits']==0
+    assert len(cache)==3
@@ -0,0 +1,81 @@
+"""
+Tests for keeping compressed scripts ready to send
+"""
+import gzip
+import zlib
+from javascriptTools.payloadCache import PayloadCache,chooseEncoding
+
+
+def _script(i:int)->str:
+    return ''.join([f'function f{i}_{j}(){{return {j*i};}}\n' for j in range(200)])
+
+
+def testChooseEncoding():
+    assert chooseEncoding(None)=='identity'
+    assert chooseEncoding('')=='identity'
+    assert chooseEncoding('gzip, deflate, br')=='gzip'
+    assert chooseEncoding('deflate')=='deflate'
+    assert chooseEncoding('gzip;q=0.5, deflate;q=0.8')=='deflate'
+    assert chooseEncoding('gzip;q=0, deflate;q=0')=='identity'
+    assert chooseEncoding('*;q=0.3, gzip;q=0')=='deflate'
+    assert chooseEncoding('GZIP;Q=1')=='gzip'
+    assert chooseEncoding('gzip;q=oops')=='identity'
+
+
+def testPayloadsAreCompressedOnce():
+    with PayloadCache() as cache:
+        script=_script(1)
+        gzipped=cache.get(script,'gzip')
+        assert gzip.decompress(gzipped).decode('utf-8')==script
+        assert zlib.decompress(cache.get(script,'deflate')).decode('utf-8')==script
+        assert cache.get(script,'identity')==script.encode('utf-8')
+        stats=cache.stats
+        assert (stats['hits'],stats['misses'],stats['compressions'])==(1,1,2)
+
+
+def testEvictedPayloadsSpillToFile(tmp_path):
+    with PayloadCache(spillDirectory=str(tmp_path)) as cache:
+        first,second=_script(1),_script(2)
+        _,payloads=cache.payloads(first)
+        cache.maxBytes=cache.numBytes+1 # only room for one
+        cache.payloads(second)
+        stats=cache.stats
+        assert (stats['evictions'],stats['entries'],stats['spilled'])==(1,1,1)
+        assert stats['spillBytes']==sum(len(payload) for payload in payloads.values())
+        _,spilled=cache.payloads(first)
+        assert spilled==payloads
+        assert gzip.decompress(spilled['gzip']).decode('utf-8')==first
+        assert cache.stats['spillHits']==1
+        assert cache.stats['compressions']==4
+
+
+def testSpillFileStartsOver(tmp_path):
+    with PayloadCache(maxBytes=1,spillDirectory=str(tmp_path)) as cache:
+        cache.payloads(_script(1)) # too big to keep in memory, so spilled
+        cache.maxSpillBytes=cache.spillBytes+1 # only room for one
+        cache.payloads(_script(2))
+        stats=cache.stats
+        assert (stats['entries'],stats['spilled'],stats['spillResets'])==(0,1,1)
+        assert cache.get(_script(2),'gzip')==gzip.compress(
+            _script(2).encode('utf-8'),9,mtime=0)
+        assert cache.stats['spillHits']==1
+        cache.payloads(_script(1)) # forgotten, so compressed again
+        assert cache.stats['compressions']==6
+
+
+def testRespondNotModified():
+    with PayloadCache() as cache:
+        script=_script(1)
+        status,headers,body=cache.respond(script,'gzip')
+        assert status==200
+        assert headers['Content-Encoding']=='gzip'
+        assert headers['Content-Length']==str(len(body))
+        etag=headers['ETag']
+        status,headers,body=cache.respond(script,'gzip',etag)
+        assert (status,body)==(304,b'')
+        assert headers['ETag']==etag
+        assert 'Content-Length' not in headers
+        # the same content in another encoding still matches
+        assert cache.respond(script,'deflate',etag)[0]==304
+        assert cache.respond(script,None,f'W/{etag}, "other"')[0]==304
+        assert cache.respond(_script(2),'gzip',etag)[0]==200
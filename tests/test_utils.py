@@ -0,0 +1,54 @@
+"""
+Tests for the javascript helper functions
+"""
+import io
+import random
+from javascriptTools import utils
+from javascriptTools.javascript import Javascript
+from javascriptTools.utils import jsAddHtml,toJsString,toJsStrings
+
+
+def _originalToJsString(text:str)->str:
+    """
+    The original chained-replace implementation of toJsString()
+    """
+    text=text \
+        .replace('\\','\\\\') \
+        .replace('\'','\\\'') \
+        .replace('\n','\\n') \
+        .replace('\r','')
+    return f"'{text}'"
+
+
+def _fuzzCorpus(count:int=10000,maxLen:int=300,seed:int=0)->list:
+    """
+    Random strings heavy on the characters that need escaping
+    """
+    rand=random.Random(seed)
+    alphabet='abcXYZ019 _-<>/"\'\\\n\r\t\u00e9\u4e2d\U0001f600'
+    return [
+        ''.join(rand.choice(alphabet) for _ in range(rand.randint(0,maxLen)))
+        for _ in range(count)]
+
+
+def testToJsStringMatchesOriginal():
+    corpus=_fuzzCorpus()
+    expected=[_originalToJsString(text) for text in corpus]
+    assert [toJsString(text) for text in corpus]==expected
+    assert [toJsString(Javascript(text)) for text in corpus]==expected
+    assert toJsStrings(corpus)==expected
+
+
+def testJsAddHtmlQuoting():
+    js=str(jsAddHtml('<b>it\'s</b>','list'))
+    assert js=="node=document.getElementById('list');\n" \
+        +"node.insertAdjacentHTML('beforeend',"+toJsString("<b>it's</b>")+");"
+
+
+def testJsAddHtmlStreamedInSlices(monkeypatch):
+    monkeypatch.setattr(utils,'STREAM_CHUNK_SIZE',3)
+    html='<p>a\'b\\c\nd</p>'
+    out=io.StringIO()
+    assert jsAddHtml(html,out=out) is None
+    assert out.getvalue()=="node=document.body;\n" \
+        +"node.insertAdjacentHTML('beforeend',"+toJsString(html)+");"
@@ -2,15 +2,247 @@
 General purpose css utilities
 """
 import typing
-from htmlTools import (
-    HtmlCompatible,asHtml,Html,isPlaintextCompatible,PlaintextCompatible,Text)
+import functools
+import hashlib
+import threading
 from  .javascript import Javascript
+if typing.TYPE_CHECKING:
+    # htmlTools is only imported when it is needed, to keep startup fast
+    from htmlTools import HtmlCompatible,PlaintextCompatible
+
+
+# how much text the streaming (out=) mode escapes and writes at a time
+STREAM_CHUNK_SIZE=65536
+
+
+def _emitChunks(
+    chunks:typing.Iterable[str],
+    out:typing.Optional[typing.TextIO]=None,
+    sep:str=''
+    )->typing.Optional[Javascript]:
+    """
+    Either join the chunks into a Javascript object, or, if out is
+    given, write them to it one at a time and return None.
+    """
+    if out is None:
+        return Javascript(sep.join(chunks))
+    first=True
+    for chunk in chunks:
+        if first:
+            first=False
+        elif sep:
+            out.write(sep)
+        out.write(chunk)
+    return None
+
+
+def _iterSlices(text:str,size:typing.Optional[int]=None)->typing.Iterator[str]:
+    """
+    Break a long string up into pieces of at most size characters
+
+    :param size: defaults to STREAM_CHUNK_SIZE
+    """
+    if size is None:
+        size=STREAM_CHUNK_SIZE
+    text=str(text)
+    if len(text)<=size:
+        yield text
+        return
+    for i in range(0,len(text),size):
+        yield text[i:i+size]
+
+
+# the ways jsAddCssRules() can add rules to the document
+CSS_RULE_MODES=('insertRule','style','constructable')
+
+
+class ContentRegistry:
+    """
+    Remembers (by hash) which pieces of content a page or session
+    already has, so they do not need to be sent again.
+
+    Keep one of these per page/session.  Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._hashes:typing.Set[typing.Hashable]=set()
+        self._lock=threading.Lock()
+
+    @staticmethod
+    def key(content:str)->typing.Hashable:
+        """
+        The hash a piece of content is remembered by
+        """
+        return hashlib.blake2b(content.encode('utf-8','surrogatepass'),digest_size=16).digest()
+
+    def add(self,content:str)->bool:
+        """
+        Remember a piece of content as sent
+
+        :return: True if it was new
+        """
+        k=self.key(content)
+        with self._lock:
+            if k in self._hashes:
+                return False
+            self._hashes.add(k)
+        return True
+
+    def filterNew(self,contents:typing.Iterable[str])->typing.List[str]:
+        """
+        Get the pieces of content that have not been seen before
+        (skipping blank ones) and remember them as seen.
+        """
+        newContents=[]
+        with self._lock:
+            for content in contents:
+                if not content.strip():
+                    continue
+                k=self.key(content)
+                if k not in self._hashes:
+                    self._hashes.add(k)
+                    newContents.append(content)
+        return newContents
+
+    def forget(self,contents:typing.Iterable[str])->None:
+        """
+        Forget some content, so it will be sent again
+        """
+        with self._lock:
+            for content in contents:
+                self._hashes.discard(self.key(content))
+
+    def clear(self)->None:
+        """
+        Forget everything (eg, when the page is reloaded)
+        """
+        with self._lock:
+            self._hashes.clear()
+
+    def __contains__(self,content:str)->bool:
+        return self.key(content) in self._hashes
+
+    def __len__(self)->int:
+        return len(self._hashes)
+
+
+class CssRuleRegistry(ContentRegistry):
+    """
+    Remembers which css rules a page or session already has,
+    so that jsAddCssRules(...,registry=) only sends the new ones.
+    """
+
+    @staticmethod
+    def key(content:str)->typing.Hashable:
+        return ContentRegistry.key(content.strip())
+
+    def forget(self,contents:typing.Union[str,typing.Iterable[str]])->None:
+        if isinstance(contents,str):
+            contents=contents.split('\n')
+        ContentRegistry.forget(self,contents)
+
+
+def scriptHash(javascript:typing.Union[str,typing.Iterable[str]])->str:
+    """
+    A short content hash of some javascript (or of pieces of it,
+    as if they were joined with newlines), for use as a
+    window.__jsLoaded key
+    """
+    if isinstance(javascript,str):
+        javascript=(javascript,)
+    h=hashlib.blake2b(digest_size=8)
+    first=True
+    for piece in javascript:
+        if first:
+            first=False
+        else:
+            h.update(b'\n')
+        h.update(str(piece).encode('utf-8','surrogatepass'))
+    return h.hexdigest()
+
+
+class JavascriptRegistry(ContentRegistry):
+    """
+    Remembers which scripts a page or session already has,
+    so that jsAddJavascript(...,registry=) and
+    JavascriptGenerator.addJavascriptFunction(...,registry=)
+    do not send them again.
+    """
+
+    @staticmethod
+    def key(content:typing.Union[str,typing.Iterable[str]])->typing.Hashable: # type: ignore
+        return scriptHash(content)
+
+
+def _iterLoadGuard(
+    chunks:typing.Iterable[str],
+    key:str
+    )->typing.Iterator[str]:
+    """
+    Wrap some javascript so the browser only runs it
+    if it has not already run something with the same key
+    """
+    yield ("if(!(window.__jsLoaded=window.__jsLoaded||{})"
+        f"['{key}']){{window.__jsLoaded['{key}']=1;")
+    yield from chunks
+    yield '}'
+
+
+def _iterJsAddCssRules(
+    cssRules:typing.Union[str,typing.Iterable[str]],
+    noAddStyleTag:bool=False,
+    mode:str='insertRule',
+    registry:typing.Optional[CssRuleRegistry]=None
+    )->typing.Iterator[str]:
+    """
+    Generator behind jsAddCssRules()
+    """
+    if isinstance(cssRules,str):
+        cssRules=cssRules.split('\n')
+    if registry is not None:
+        cssRules=registry.filterNew(cssRules)
+        if not cssRules:
+            return
+    if mode=='style':
+        yield r"""css=document.createElement("style");"""
+        yield r"""css.type="text/css";"""
+        yield r"""css.textContent="""+toJsString('\n'.join(cssRules))+';'
+        yield r"""document.head.appendChild(css);"""
+        return
+    if mode=='constructable':
+        yield r"""cssText="""+toJsString('\n'.join(cssRules))+';'
+        yield r"""
+        if(window.CSSStyleSheet && document.adoptedStyleSheets!==undefined){
+            css=new CSSStyleSheet();
+            css.replaceSync(cssText);
+            document.adoptedStyleSheets=document.adoptedStyleSheets.concat([css]);
+        }else{
+            css=document.createElement("style");
+            css.type="text/css";
+            css.textContent=cssText;
+            document.head.appendChild(css);
+        }"""
+        return
+    if not noAddStyleTag:
+        yield r"""
+        if(window.document.styleSheets.length<1){
+            css=document.createElement("style");
+            css.type="text/css";
+            document.head.appendChild(css);
+        }"""
+    yield r"""css=window.document.styleSheets[0];"""
+    for cssRule in cssRules:
+        cssRule="'%s'"%(cssRule.replace("'","\\'"))
+        yield r"""css.insertRule("""+cssRule+r""",css.cssRules.length);"""
 
 
 def jsAddCssRules(
     cssRules:typing.Union[str,typing.Iterable[str]],
-    noAddStyleTag:bool=False
-    )->Javascript:
+    noAddStyleTag:bool=False,
+    out:typing.Optional[typing.TextIO]=None,
+    mode:str='insertRule',
+    registry:typing.Optional[CssRuleRegistry]=None
+    )->typing.Optional[Javascript]:
     """
     Generates javascript to add css rules to the document.
 
@@ -18,31 +250,73 @@ def jsAddCssRules(
 
     :param noAddStyleTag: can turn off checking for the <style> tag for efficiency
         if we already know there is one there
+    :param out: if specified, write the javascript to this file-like object
+        a piece at a time (and return None) rather than returning it
+    :param mode: how to add the rules:
+        'insertRule' - one css.insertRule() per rule (the browser restyles for each)
+        'style' - all of them at once as the text of a new <style> element
+        'constructable' - all of them at once as a constructable stylesheet
+            added to document.adoptedStyleSheets (falls back to 'style')
+    :param registry: if specified, only add the rules that this
+        page/session does not already have
 
     See also:
         https://developer.mozilla.org/en-US/docs/Web/API/DocumentOrShadowRoot/styleSheets
+        https://developer.mozilla.org/en-US/docs/Web/API/Document/adoptedStyleSheets
     """
-    ret=[]
-    if not noAddStyleTag:
-        ret.append(r"""
-        if(window.document.styleSheets.length<1){
-            css=document.createElement("style");
-            css.type="text/css";
-            document.head.appendChild(css);
-        }""")
-    ret.append(r"""css=window.document.styleSheets[0];""")
-    if isinstance(cssRules,str):
-        cssRules=cssRules.split('\n')
-    for cssRule in cssRules:
-        cssRule="'%s'"%(cssRule.replace("'","\\'"))
-        ret.append(r"""css.insertRule("""+cssRule+r""",css.cssRules.length);""")
-    return Javascript('\n'.join(ret))
+    if mode not in CSS_RULE_MODES:
+        raise Exception(f'Unknown css mode "{mode}", expected one of {CSS_RULE_MODES}')
+    return _emitChunks(_iterJsAddCssRules(cssRules,noAddStyleTag,mode,registry),out,'\n')
+
+
+def _iterJsAddJavascript(
+    javascript:typing.Union[Javascript,str,typing.List[str],typing.Tuple[str,...]],
+    noAddScriptTag:bool=False,
+    dedup:bool=False,
+    registry:typing.Optional[JavascriptRegistry]=None
+    )->typing.Iterator[str]:
+    """
+    Generator behind jsAddJavascript()
+    """
+    if dedup or registry is not None:
+        if not isinstance(javascript,(list,tuple)):
+            javascript=str(javascript)
+        key=scriptHash(javascript)
+        if registry is not None and not registry.add(javascript):
+            return
+        if dedup:
+            yield from _iterLoadGuard(_iterJsAddJavascript(javascript,noAddScriptTag),key)
+            return
+    if not noAddScriptTag:
+        yield r"""
+        if(window.document.scripts.length<1){
+            script=document.createElement("script");
+            document.head.appendChild(script);
+        }"""
+    yield r"""javascript=window.document.scripts[0];"""
+    yield r"""javascript.appendChild(document.createTextNode('"""
+    if isinstance(javascript,(list,tuple)):
+        pieces:typing.Iterable[str]=javascript
+    else:
+        pieces=(javascript,)
+    first=True
+    for piece in pieces:
+        if first:
+            first=False
+        else:
+            yield '\\n'
+        for text in _iterSlices(piece):
+            yield text.replace('\\','\\\\').replace('\n','\\n').replace("\'","\\'")
+    yield r"""'));"""
 
 
 def jsAddJavascript(
     javascript:typing.Union[Javascript,str],
-    noAddScriptTag:bool=False
-    )->Javascript:
+    noAddScriptTag:bool=False,
+    out:typing.Optional[typing.TextIO]=None,
+    dedup:bool=False,
+    registry:typing.Optional[JavascriptRegistry]=None
+    )->typing.Optional[Javascript]:
     """
     Generates javascript to add javascript items to the document.
 
@@ -50,50 +324,57 @@ def jsAddJavascript(
 
     :param noAddScriptTag: can turn off checking for the <script> tag for efficiency
         if we already know there is one there
+    :param out: if specified, write the javascript to this file-like object
+        a piece at a time (and return None) rather than returning it
+    :param dedup: guard it with a window.__jsLoaded[contentHash] check
+        so the browser only adds it once
+    :param registry: if specified, generate nothing at all if this
+        page/session has already been sent the same javascript
 
     See also:
         https://developer.mozilla.org/en-US/docs/Web/API/Document/scripts
         https://developer.mozilla.org/en-US/docs/Web/API/HTMLScriptElement
     """
-    ret=[]
-    if not noAddScriptTag:
-        ret.append(r"""
-        if(window.document.scripts.length<1){
-            script=document.createElement("script");
-            document.head.appendChild(script);
-        }""")
-    ret.append(r"""javascript=window.document.scripts[0];""")
-    if isinstance(javascript,(list,tuple)):
-        javascript='\n'.join(javascript)
-    ret.append(r"""javascript.appendChild(document.createTextNode('""")
-    javascript=javascript.replace('\\','\\\\').replace('\n','\\n').replace("\'","\\'")
-    ret.append(javascript)
-    ret.append(r"""'));""")
-    return Javascript(''.join(ret))
+    return _emitChunks(_iterJsAddJavascript(javascript,noAddScriptTag,dedup,registry),out)
 
 
-def jsAddHtml(
-    html:HtmlCompatible,
+def _iterJsAddHtml(
+    html:'HtmlCompatible',
     parentNodeId:typing.Optional[str]=None
-    )->Javascript:
+    )->typing.Iterator[str]:
     """
-    :param parentNodeId: if None, will add to the end of <body>
+    Generator behind jsAddHtml()
     """
+    from htmlTools import asHtml
     html=asHtml(html) # use all Html object goodies
-    ret=[]
     if parentNodeId is None:
-        ret.append('node=document.body;')
+        yield 'node=document.body;'
     else:
-        ret.append("node=document.getElementById('%s');"%parentNodeId)
-    html=toJsString(html)
-    ret.append("node.insertAdjacentHTML('beforeend','%s');"%html)
-    return Javascript('\n'.join(ret))
+        yield f'node=document.getElementById({toJsString(parentNodeId)});'
+    # the same as one toJsString(html) argument, escaped a slice at a time
+    yield "\nnode.insertAdjacentHTML('beforeend','"
+    for text in _iterSlices(str(html)):
+        yield _escapeJsString(text)[1:-1]
+    yield "');"
+
+
+def jsAddHtml(
+    html:'HtmlCompatible',
+    parentNodeId:typing.Optional[str]=None,
+    out:typing.Optional[typing.TextIO]=None
+    )->typing.Optional[Javascript]:
+    """
+    :param parentNodeId: if None, will add to the end of <body>
+    :param out: if specified, write the javascript to this file-like object
+        a piece at a time (and return None) rather than returning it
+    """
+    return _emitChunks(_iterJsAddHtml(html,parentNodeId),out)
 
 
 def setElementContents(
     elementId:str,
-    html:typing.Optional[HtmlCompatible]=None,
-    plaintext:typing.Optional[PlaintextCompatible]=None
+    html:typing.Optional['HtmlCompatible']=None,
+    plaintext:typing.Optional['PlaintextCompatible']=None
     )->Javascript:
     """
     Shortcut to creating javascript to assign the contents of an element
@@ -103,6 +384,7 @@ def setElementContents(
 
     returns javascript
     """
+    from htmlTools import Html
     from .jsgenerator import JavascriptGenerator
     jsg=JavascriptGenerator()
     if html is None:
@@ -114,8 +396,8 @@ def setElementContents(
 
 
 def appendElementContents(elementId:str,
-    html:typing.Optional[HtmlCompatible]=None,
-    plaintext:typing.Optional[PlaintextCompatible]=None
+    html:typing.Optional['HtmlCompatible']=None,
+    plaintext:typing.Optional['PlaintextCompatible']=None
     )->Javascript:
     """
     Shortcut to creating javascript to assign the contents of an element
@@ -125,6 +407,7 @@ def appendElementContents(elementId:str,
 
     returns javascript
     """
+    from htmlTools import Html
     from .jsgenerator import JavascriptGenerator
     jsg=JavascriptGenerator()
     if html is None:
@@ -135,18 +418,54 @@ def appendElementContents(elementId:str,
     return js
 
 
+# (find,replace) pairs applied by toJsString, in order
+JS_STRING_ESCAPES:typing.Tuple[typing.Tuple[str,str],...]=(
+    ('\\','\\\\'),
+    ('\'','\\\''),
+    ('\n','\\n'),
+    ('\r',''))
+
+# strings up to this long are remembered by toJsString
+# (element ids, attribute names, window names, and the like)
+TO_JS_STRING_CACHE_MAX_LEN=256
+
+
+def _escapeJsString(text:str)->str:
+    """
+    Escape text and wrap it in quotes.
+
+    Only calls str.replace() for characters that are actually present,
+    which is the common case for things like ids and attribute names.
+    (str.replace is done in C, so this beats any per-character python loop.)
+    """
+    for find,replace in JS_STRING_ESCAPES:
+        if find in text:
+            text=text.replace(find,replace)
+    return f"'{text}'"
+
+_escapeJsStringCached=functools.lru_cache(maxsize=4096)(_escapeJsString)
+
+
 def toJsString(
-    text:typing.Union[PlaintextCompatible,typing.Any]
+    text:typing.Union['PlaintextCompatible',typing.Any]
     )->str:
     """
     Returns a text object (or any object) as a porperly-escaped javascript string.
 
     Will prefer to get something that is compatible with Text objects,
     but if all else fails, will do a string conversion on an object.
+
+    Short plain strings are cached, so repeated literals are nearly free.
     """
+    if type(text) is str: # pylint: disable=unidiomatic-typecheck
+        if len(text)<=TO_JS_STRING_CACHE_MAX_LEN:
+            return _escapeJsStringCached(text)
+        return _escapeJsString(text)
     if isinstance(text,str):
-        pass
-    elif isinstance(text,Html):
+        # eg Javascript, which is quicker to escape as a plain str
+        return _escapeJsString(str(text))
+    from htmlTools import Html,Text,isPlaintextCompatible
+    if isinstance(text,Html):
         # don't want to accidentally convert that!
         text=str(text)
     elif isPlaintextCompatible(text):
@@ -155,9 +474,13 @@ def toJsString(
         text=str(text)
     else:
         text=str(text)
-    text=text \
-        .replace('\\','\\\\') \
-        .replace('\'','\\\'') \
-        .replace('\n','\\n') \
-        .replace('\r','')
-    return f"'{text}'"
+    return _escapeJsString(text)
+
+
+def toJsStrings(
+    texts:typing.Iterable[typing.Union['PlaintextCompatible',typing.Any]]
+    )->typing.List[str]:
+    """
+    Same as toJsString() but for a whole bunch of items at once
+    """
+    return [toJsString(text) for text in texts]